@@ -0,0 +1,156 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+"""Cost per host message of the protocol dispatch, table vs if/elif chain.
+
+The legacy variant reproduces the previous parsing: an if/elif chain over the
+type byte creating message objects from sliced copies of the report and an
+isinstance chain selecting the handler. Traffic is dominated by SetColor with
+some pings and unknown messages.
+
+Run with ``uv run python benchmarks/bench_dispatch.py``.
+"""
+
+import os
+import random
+import sys
+import time
+import tracemalloc
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src", "mutenix_firmware"))
+
+sys.modules["hardware"] = mock.MagicMock()
+sys.modules["supervisor"] = mock.MagicMock()
+
+from protocol import Dispatcher  # noqa: E402
+from protocol import Ping  # noqa: E402
+from protocol import SetColor  # noqa: E402
+from protocol import StatsRequest  # noqa: E402
+from protocol import TimeSync  # noqa: E402
+
+MESSAGES = 100_000
+OUT_REPORT_LENGTH = 8
+
+
+class LegacyPing:
+    def __init__(self, data):
+        self.capabilities = data[0] if len(data) else 0
+
+
+class LegacySetColor:
+    def __init__(self, data):
+        self.buttonid = data[0]
+        self.color = bytearray(data[1:5])
+
+
+class LegacyStatsRequest:
+    def __init__(self, data):
+        self.phase = data[0]
+
+
+class LegacyTimeSync:
+    def __init__(self, data):
+        self.token = int.from_bytes(data[0:2], "little")
+
+
+class LegacyUnknown:
+    def __init__(self, data):
+        self.data = data
+
+
+def legacy_from_buffer(buffer):
+    type = buffer[0]
+    if type == 0xF0:
+        return LegacyPing(buffer[1:OUT_REPORT_LENGTH])
+    elif type == 0x1:
+        return LegacySetColor(buffer[1:OUT_REPORT_LENGTH])
+    elif type == 0xF1:
+        return LegacyStatsRequest(buffer[1:OUT_REPORT_LENGTH])
+    elif type == 0xF2:
+        return LegacyTimeSync(buffer[1:OUT_REPORT_LENGTH])
+    return LegacyUnknown(buffer[0:OUT_REPORT_LENGTH])
+
+
+leds = bytearray(4 * 11)
+
+
+def set_led(led, color):
+    leds[led * 4 : led * 4 + 4] = color
+
+
+def legacy_handle(data):
+    p = legacy_from_buffer(data)
+    if isinstance(p, LegacyPing):
+        pass
+    elif isinstance(p, LegacySetColor):
+        set_led(p.buttonid, p.color)
+    elif isinstance(p, LegacyStatsRequest):
+        pass
+    elif isinstance(p, LegacyTimeSync):
+        pass
+    elif isinstance(p, LegacyUnknown):
+        pass
+
+
+def on_set_color(message):
+    set_led(message.buttonid, message.color)
+
+
+def ignore(message):
+    pass
+
+
+dispatcher = Dispatcher(unknown=ignore)
+dispatcher.register(Ping, ignore)
+dispatcher.register(SetColor, on_set_color)
+dispatcher.register(StatsRequest, ignore)
+dispatcher.register(TimeSync, ignore)
+
+
+def traffic():
+    rng = random.Random(1)
+    reports = []
+    for _ in range(MESSAGES):
+        kind = rng.random()
+        if kind < 0.9:
+            color = [rng.randrange(256) for _ in range(4)]
+            reports.append(bytes([0x1, rng.randrange(1, 11)] + color + [0, 0]))
+        elif kind < 0.95:
+            reports.append(bytes([0xF0, 0, 0, 0, 0, 0, 0, 0]))
+        else:
+            reports.append(bytes([0x42, 1, 2, 3, 4, 5, 6, 7]))
+    return reports
+
+
+def measure(handle, reports):
+    start = time.perf_counter()
+    for report in reports:
+        handle(report)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    allocated = 0
+    for report in reports[:1000]:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        handle(report)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return elapsed / len(reports) * 1e9, allocated / 1000
+
+
+def main():
+    reports = traffic()
+    print(f"{MESSAGES} messages, 90% SetColor, 5% Ping, 5% unknown")
+    print(f"{'dispatch':10} {'ns/msg':>8} {'peak B/msg':>11}")
+    for name, handle in (
+        ("if/elif", legacy_handle),
+        ("table", dispatcher.dispatch),
+    ):
+        ns, allocated = measure(handle, reports)
+        print(f"{name:10} {ns:8.0f} {allocated:11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+"""Frames per second of the led color pipeline for a 13 led strip.
+
+The legacy variant reproduces the previous pipeline: float HSV math for the
+rainbow, a float mix_color() allocating a bytearray and a ColorLeds setter
+allocating a reordered bytearray per led. Each frame sets every led and
+shows the strip (neopixel_write is mocked, so the time is the Python side).
+The peak allocation of the integer pipeline are the frames and range
+iterators CPython allocates per call, nothing is kept between frames.
+
+Run with ``uv run python benchmarks/bench_frames.py``.
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src", "mutenix_firmware"))
+
+for module in [
+    "adafruit_ble",
+    "adafruit_ble.advertising",
+    "adafruit_ble.advertising.standard",
+    "adafruit_ble.services.standard",
+    "adafruit_ble.services.standard.device_info",
+    "adafruit_ble.services.standard.hid",
+    "_bleio",
+    "board",
+    "digitalio",
+    "keypad",
+    "neopixel_write",
+    "storage",
+    "supervisor",
+    "usb_hid",
+]:
+    sys.modules[module] = mock.MagicMock()
+board = mock.MagicMock()
+board.board_id = "waveshare_rp2040_zero"
+sys.modules["board"] = board
+neopixel_write = mock.MagicMock()
+# a plain function instead of the mock, its call recording would dominate
+neopixel_write.neopixel_write = lambda pin, buffer: None
+sys.modules["neopixel_write"] = neopixel_write
+
+from animation import Animations  # noqa: E402
+from animation import PULSE  # noqa: E402
+from animation import RAINBOW  # noqa: E402
+from hardware import ColorLeds  # noqa: E402
+from hardware import GRB  # noqa: E402
+from hardware import LedColors  # noqa: E402
+from update import LedStatus  # noqa: E402
+
+LEDS = 13
+FRAMES = 2000
+
+
+class LegacyColorLeds(ColorLeds):
+    def __setitem__(self, key, value):
+        if isinstance(value, str):
+            value = LedColors[value]
+        key = self._mapping[key]
+        cvalue = value
+        if sum(cvalue[0:3]) == 0 and len(cvalue) == 4:
+            cvalue = bytearray([cvalue[3], cvalue[3], cvalue[3]])
+        else:
+            cvalue = bytearray([cvalue[1], cvalue[0], cvalue[2]])
+        start = key * self._size
+        if self.colors[start : start + self._size] != cvalue[0 : self._size]:
+            self.colors[start : start + self._size] = cvalue[0 : self._size]
+            self._dirty = True
+
+
+def legacy_hsv_to_rgb(h, s, v):
+    i = int(h * 6)
+    f = (h * 6) - i
+    p = v * (1 - s)
+    q = v * (1 - f * s)
+    t = v * (1 - (1 - f) * s)
+    return [(v, t, p), (q, v, p), (p, v, t), (p, q, v), (t, p, v), (v, p, q)][i % 6]
+
+
+def legacy_mix_color(color1, color2, descriminant, divisor):
+    color1 = LedColors[color1]
+    color2 = LedColors[color2]
+    return bytearray(
+        [
+            int(
+                (color1[i] * descriminant + color2[i] * (divisor - descriminant))
+                / divisor,
+            )
+            for i in range(4)
+        ],
+    )
+
+
+def legacy_rainbow(leds):
+    hue = 0.0
+
+    def frame(n):
+        nonlocal hue
+        hue = (hue + 0.01) % 1
+        for i in range(1, LEDS):
+            r, g, b = legacy_hsv_to_rgb((hue + i / LEDS) % 1, 1, 1)
+            leds[i] = bytearray([int(r * 10), int(g * 10), int(b * 10), 0])
+
+    return frame
+
+
+def legacy_update_status(leds):
+    status = 0
+
+    def frame(n):
+        nonlocal status
+        status = (status + 1) % 100
+        for i in range(1, LEDS):
+            if status // 10 in [(i - 1), (i - 1 + 5)]:
+                color1, color2 = (
+                    ("blue", "green") if status // 10 == (i - 1) else ("green", "blue")
+                )
+                leds[i] = legacy_mix_color(color1, color2, status % 10, 10)
+
+    return frame
+
+
+def animation(leds, effect):
+    animations = Animations(leds, LEDS)
+    animations.start(1, LEDS - 1, effect, 1000, bytes([10, 0, 0, 0]), bytes(4), 20, 0)
+
+    def frame(n):
+        animations.step(n * 20)
+
+    return frame
+
+
+def update_status(leds):
+    status = LedStatus(leds)
+
+    def frame(n):
+        status.update()
+
+    return frame
+
+
+def measure(make, leds_class):
+    leds = leds_class(mock.Mock(), LEDS, GRB)
+    frame = make(leds)
+    start = time.perf_counter()
+    for n in range(FRAMES):
+        frame(n)
+        leds.show()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    allocated = 0
+    for n in range(200):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        frame(n)
+        leds.show()
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return FRAMES / elapsed, allocated / 200
+
+
+def main():
+    print(f"{LEDS} leds, {FRAMES} frames")
+    print(f"{'frame':26} {'frames/s':>9} {'peak B/frame':>13}")
+    for name, make, leds_class in (
+        ("rainbow (legacy float)", legacy_rainbow, LegacyColorLeds),
+        ("rainbow (lut)", lambda leds: animation(leds, RAINBOW), ColorLeds),
+        ("pulse (lut)", lambda leds: animation(leds, PULSE), ColorLeds),
+        ("update status (legacy)", legacy_update_status, LegacyColorLeds),
+        ("update status (integer)", update_status, ColorLeds),
+    ):
+        fps, allocated = measure(make, leds_class)
+        print(f"{name:26} {fps:9.0f} {allocated:13.1f}")
+
+
+if __name__ == "__main__":
+    main()
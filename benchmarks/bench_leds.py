@@ -0,0 +1,105 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+"""Benchmark for the LED frame buffer.
+
+Run with ``uv run python benchmarks/bench_leds.py``.
+"""
+
+import os
+import sys
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src", "mutenix_firmware"))
+
+for module in [
+    "adafruit_ble",
+    "adafruit_ble.advertising",
+    "adafruit_ble.advertising.standard",
+    "adafruit_ble.services.standard",
+    "adafruit_ble.services.standard.device_info",
+    "adafruit_ble.services.standard.hid",
+    "_bleio",
+    "board",
+    "digitalio",
+    "keypad",
+    "neopixel_write",
+    "storage",
+    "supervisor",
+    "usb_hid",
+]:
+    sys.modules[module] = mock.MagicMock()
+board = mock.MagicMock()
+board.board_id = "waveshare_rp2040_zero"
+sys.modules["board"] = board
+
+import hardware  # noqa: E402
+from hardware import ColorLeds  # noqa: E402
+
+ITERATIONS = 1000
+# 800 kHz, 24 bit per GRB led
+WRITE_TIME_US = 13 * 24 * 1.25
+
+set_calls = 0
+original_setitem = ColorLeds.__setitem__
+
+
+def counting_setitem(self, key, value):
+    global set_calls
+    set_calls += 1
+    original_setitem(self, key, value)
+
+
+ColorLeds.__setitem__ = counting_setitem  # type: ignore[method-assign]
+neopixel_write = sys.modules["neopixel_write"].neopixel_write
+leds = hardware.hardware_variant.leds
+
+
+def connected(i):
+    """Host pings and refreshes one button color per iteration."""
+    leds[0] = "green"
+    leds[1 + i % 10] = "red" if (i // 10) % 2 else "blue"
+    hardware.hardware_variant.check_bluetooth()
+
+
+def idle(i):
+    """Host connected, nothing changes."""
+    leds[0] = "green"
+    hardware.hardware_variant.check_bluetooth()
+
+
+def timed_out(i):
+    """Host gone, the timeout branch resets the leds."""
+    leds[0] = "red"
+    leds[1:11] = "black"
+
+
+def fill(i):
+    leds.fill("green" if i % 2 else "red")
+
+
+def run(name, step):
+    global set_calls
+    set_calls = 0
+    neopixel_write.reset_mock()
+    for i in range(ITERATIONS):
+        step(i)
+        leds.show()
+    writes = neopixel_write.call_count
+    print(
+        f"  {name:10s}: before {set_calls / ITERATIONS:5.2f} writes/iteration "
+        f"({set_calls / ITERATIONS * WRITE_TIME_US:6.0f} us), "
+        f"after {writes / ITERATIONS:5.2f} writes/iteration "
+        f"({writes / ITERATIONS * WRITE_TIME_US:6.0f} us)",
+    )
+
+
+if __name__ == "__main__":
+    print(f"neopixel_write calls per main loop iteration ({ITERATIONS} iterations)")
+    for name, step in [
+        ("connected", connected),
+        ("idle", idle),
+        ("timed out", timed_out),
+        ("fill", fill),
+    ]:
+        run(name, step)
@@ -0,0 +1,98 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+"""Allocations per main loop iteration caused by disabled debug logging.
+
+Runs the same scenarios on the firmware in the tree, on the release build
+with the log statements stripped and optionally on the firmware of an older
+git revision (which needs to provide main.loop_once()).
+
+Run with ``uv run python benchmarks/bench_logging.py [--baseline REF]``.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+import strip_logs  # noqa: E402
+from mutenix_simulator import Scenario  # noqa: E402
+
+FIRMWARE = os.path.join(ROOT, "src", "mutenix_firmware")
+DURATION_MS = 5_000
+
+
+def typing():
+    scenario = Scenario("tapping all buttons", DURATION_MS).ping_every(1000)
+    for i, ms in enumerate(range(50, DURATION_MS, 100)):
+        scenario.tap(ms, i % 10, 40)
+    return scenario
+
+
+def led_updates():
+    scenario = Scenario("host sets leds every 20ms", DURATION_MS).ping_every(1000)
+    for i, ms in enumerate(range(10, DURATION_MS, 20)):
+        scenario.host(ms, bytes([0x1, 1 + i % 10, 0x20 * (i % 8), 0, 0, 0, 0, 0]))
+    return scenario
+
+
+def copy_firmware(target):
+    shutil.copytree(
+        FIRMWARE,
+        target,
+        ignore=shutil.ignore_patterns("__pycache__"),
+    )
+    return target
+
+
+def stripped_build(workdir):
+    target = copy_firmware(os.path.join(workdir, "stripped"))
+    strip_logs.main(target)
+    return target
+
+
+def baseline_build(workdir, ref):
+    target = os.path.join(workdir, "baseline")
+    os.makedirs(target)
+    archive = subprocess.run(
+        ["git", "archive", ref, "src/mutenix_firmware"],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+    ).stdout
+    subprocess.run(["tar", "-x", "-C", target], input=archive, check=True)
+    return os.path.join(target, "src", "mutenix_firmware")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--baseline", help="git revision to compare with")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        builds = [("tree", FIRMWARE), ("stripped", stripped_build(workdir))]
+        if args.baseline:
+            builds.insert(0, (args.baseline, baseline_build(workdir, args.baseline)))
+
+        print(
+            f"{'scenario':28} {'build':>10} {'B/it':>8} {'max B/it':>9} {'it/s':>9}",
+        )
+        for make in (typing, led_updates):
+            for build, firmware_dir in builds:
+                traced = make().run(trace_allocations=True, firmware_dir=firmware_dir)
+                timed = make().run(firmware_dir=firmware_dir)
+                print(
+                    f"{traced.name:28} {build:>10}"
+                    f" {traced.allocated_per_iteration:8.1f}"
+                    f" {traced.max_allocated:9d}"
+                    f" {timed.iterations_per_second:9.0f}",
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+"""Benchmark of the complete main loop running in the simulator.
+
+Reports per scenario the loop iterations per second on this machine, the
+latency from a button edge to its report in loop iterations, the bytes
+allocated per iteration and the reports sent to the host.
+
+Run with ``uv run python benchmarks/bench_main_loop.py``.
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from mutenix_simulator import Scenario  # noqa: E402
+
+DURATION_MS = 10_000
+PING = bytes([0xF0, 0, 0, 0, 0, 0, 0, 0])
+
+
+def idle():
+    return Scenario("idle, host connected", DURATION_MS).ping_every(1000)
+
+
+def typing():
+    scenario = Scenario("tapping all buttons", DURATION_MS).ping_every(1000)
+    for i, ms in enumerate(range(50, DURATION_MS, 100)):
+        scenario.tap(ms, i % 10, 40)
+    return scenario
+
+
+def led_updates():
+    scenario = Scenario("host sets leds every 20ms", DURATION_MS).ping_every(1000)
+    for i, ms in enumerate(range(10, DURATION_MS, 20)):
+        scenario.host(ms, bytes([0x1, 1 + i % 10, 0x20 * (i % 8), 0, 0, 0, 0, 0]))
+    return scenario
+
+
+def no_host():
+    return Scenario("no host", DURATION_MS).tap(500, 0).tap(5000, 1)
+
+
+def main():
+    print(
+        f"{'scenario':28} {'variant':>7} {'it/s':>9} {'lat max':>7}"
+        f" {'B/it':>7} {'reports':>8} {'led writes':>10}",
+    )
+    for variant in ("usb10", "bt10"):
+        for make in (idle, typing, led_updates, no_host):
+            timed = make().run(variant=variant)
+            traced = make().run(trace_allocations=True, variant=variant)
+            reports = sum(timed.reports.values())
+            print(
+                f"{timed.name:28} {variant:>7} {timed.iterations_per_second:9.0f}"
+                f" {timed.max_latency:7d} {traced.allocated_per_iteration:7.0f}"
+                f" {reports:8d} {timed.neopixel_writes:10d}",
+            )
+
+
+if __name__ == "__main__":
+    main()
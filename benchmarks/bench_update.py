@@ -0,0 +1,217 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+"""Benchmark for the update file transfer.
+
+Run with ``uv run python benchmarks/bench_update.py [release/<version>.tar.gz]``.
+Without a release archive the files that ``make_release.sh`` would pack are used.
+"""
+
+import io
+import os
+import random
+import sys
+import tarfile
+import time
+import tracemalloc
+import zlib
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src", "mutenix_firmware"))
+
+sys.modules["supervisor"] = mock.Mock()
+sys.modules["usb_hid"] = mock.MagicMock()
+sys.modules["storage"] = mock.Mock()
+sys.modules["hardware"] = mock.Mock()
+
+from update import File  # noqa: E402
+from update import FILE_TRANSPORT_DATA  # noqa: E402
+from update import FILE_TRANSPORT_START  # noqa: E402
+from update import FileTransport  # noqa: E402
+from update import FLAG_COMPRESSED  # noqa: E402
+from update import FLAG_CRC32  # noqa: E402
+
+PACKAGES = 10_000
+CHUNK_REPORT_SIZE = 60
+# a full speed HID interrupt endpoint moves one report per millisecond
+REPORT_INTERVAL = 0.001
+
+
+class NullFile:
+    def write(self, data):
+        return len(data)
+
+    def seek(self, offset):
+        pass
+
+    def close(self):
+        pass
+
+
+def start_packet(packages, size=None, flags=0, crc=0):
+    if size is None:
+        size = packages * FileTransport.content_length
+    return FileTransport(
+        FILE_TRANSPORT_START.to_bytes(2, "little")
+        + (1).to_bytes(2, "little")
+        + packages.to_bytes(2, "little")
+        + (0).to_bytes(2, "little")
+        + b"\x08file.mpy\x04"
+        + size.to_bytes(4, "little")
+        + flags.to_bytes(1, "little")
+        + (crc.to_bytes(4, "little") if flags & FLAG_CRC32 else b""),
+    )
+
+
+def data_packets(packages, payload=None):
+    if payload is None:
+        payload = b"x" * FileTransport.content_length * packages
+    return [
+        FileTransport(
+            FILE_TRANSPORT_DATA.to_bytes(2, "little")
+            + (1).to_bytes(2, "little")
+            + packages.to_bytes(2, "little")
+            + i.to_bytes(2, "little")
+            + payload[
+                i * FileTransport.content_length : (i + 1)
+                * FileTransport.content_length
+            ],
+        )
+        for i in range(packages)
+    ]
+
+
+def packages_for(size):
+    return max(1, -(-size // FileTransport.content_length))
+
+
+def release_files(archive=None):
+    if archive:
+        with tarfile.open(archive) as tar:
+            for member in tar.getmembers():
+                if member.isfile():
+                    yield member.name, tar.extractfile(member).read()
+        return
+    for base, folder in (
+        (os.path.join(ROOT, "src", "mutenix_firmware"), ""),
+        (os.path.join(ROOT, "lib"), "lib"),
+    ):
+        for dirpath, dirnames, filenames in os.walk(base):
+            if "__pycache__" in dirnames:
+                dirnames.remove("__pycache__")
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                with open(path, "rb") as f:
+                    yield os.path.join(folder, os.path.relpath(path, base)), f.read()
+
+
+def transfer(payload, flags, crc=0):
+    """Push one file through File and return wire bytes, device time and output."""
+    packages = packages_for(len(payload))
+    start = start_packet(packages, len(payload), flags, crc)
+    packets = data_packets(packages, payload)
+    flash = {}
+
+    def open_file(name, mode="r"):
+        if "w" not in mode:
+            return io.BytesIO(flash[name].getvalue())
+        flash[name] = io.BytesIO()
+        flash[name].close = lambda: None
+        return flash[name]
+
+    with mock.patch("builtins.open", open_file), mock.patch("os.unlink", flash.pop):
+        t0 = time.perf_counter()
+        file = File(start)
+        for p in packets:
+            file.write(p)
+        elapsed = time.perf_counter() - t0
+    assert file.is_complete()
+    assert file.verified()
+    output = flash["file.mpy"].getvalue()
+    return (packages + 2) * CHUNK_REPORT_SIZE, packages + 2, elapsed, output
+
+
+class LegacyTracking:
+    """Package tracking as it was done before the bitmap."""
+
+    def __init__(self, packages):
+        self.packages = list(range(packages))
+
+    def receive(self, package):
+        if package not in self.packages:
+            return
+        self.packages.remove(package)
+
+
+def heap_of(factory):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = factory()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, after - before
+
+
+def bench_tracking():
+    start = start_packet(PACKAGES)
+    packets = data_packets(PACKAGES)
+
+    _, legacy_heap = heap_of(lambda: LegacyTracking(PACKAGES))
+    with mock.patch("builtins.open", return_value=NullFile()):
+        _, file_heap = heap_of(lambda: File(start))
+
+    print(f"chunk tracking for {PACKAGES} chunks")
+    print(f"  heap: legacy list {legacy_heap} B, bitmap File {file_heap} B")
+    shuffled = list(packets)
+    random.Random(0).shuffle(shuffled)
+    for order, sequence in (("in order", packets), ("shuffled", shuffled)):
+        legacy = LegacyTracking(PACKAGES)
+        t0 = time.perf_counter()
+        for p in sequence:
+            legacy.receive(p.package)
+        legacy_time = time.perf_counter() - t0
+
+        with mock.patch("builtins.open", return_value=NullFile()):
+            file = File(start)
+            t0 = time.perf_counter()
+            for p in sequence:
+                file.write(p)
+            file_time = time.perf_counter() - t0
+        assert file.is_complete()
+        print(
+            f"  {order}: legacy list {legacy_time / PACKAGES * 1e6:.2f} us/chunk, "
+            f"bitmap File {file_time / PACKAGES * 1e6:.2f} us/chunk (incl. write)",
+        )
+
+
+def bench_compression(archive=None):
+    """Transfer of the release bundle, compressed and verified with crc32."""
+    modes = ("plain", "plain+crc", "zlib", "zlib+crc")
+    totals = {mode: [0, 0, 0.0] for mode in modes}
+    for name, content in release_files(archive):
+        for mode in totals:
+            if mode.startswith("zlib"):
+                payload, flags = zlib.compress(content, 9), FLAG_COMPRESSED
+            else:
+                payload, flags = content, 0
+            if mode.endswith("+crc"):
+                flags |= FLAG_CRC32
+            crc = zlib.crc32(content)
+            wire, reports, elapsed, output = transfer(payload, flags, crc)
+            assert output == content, name
+            totals[mode][0] += wire
+            totals[mode][1] += reports
+            totals[mode][2] += elapsed
+
+    print(f"release bundle transfer ({archive or 'source tree'})")
+    for mode, (wire, reports, elapsed) in totals.items():
+        link = reports * REPORT_INTERVAL
+        print(
+            f"  {mode:9s}: {wire:8d} wire bytes, {reports:6d} reports, "
+            f"device {elapsed * 1000:7.1f} ms, end-to-end >= {link + elapsed:6.2f} s",
+        )
+
+
+if __name__ == "__main__":
+    bench_tracking()
+    bench_compression(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -48,11 +48,16 @@ mkdir -p release
 # Define the output file name
 OUTPUT_FILE="release/${VERSION}.tar.gz"
 
-cp -r lib src/mutenix_firmware/lib
+# Stage the firmware, strip the debug logging and add the lib folder
+STAGING=$(mktemp -d)
+cp -r src/mutenix_firmware/. "$STAGING"
+rm -rf "$STAGING/__pycache__"
+python3 scripts/strip_logs.py "$STAGING" || { rm -rf "$STAGING"; exit 1; }
+cp -r lib "$STAGING/lib"
 
-# Create a tar.gz archive containing all files in src/mutenix_firmware and the lib folder
-tar -czvf "$OUTPUT_FILE" -C src/mutenix_firmware .
+# Create a tar.gz archive containing all staged files
+tar -czvf "$OUTPUT_FILE" -C "$STAGING" .
 
-rm -rf src/mutenix_firmware/lib
+rm -rf "$STAGING"
 
 echo "Release package created: $OUTPUT_FILE"
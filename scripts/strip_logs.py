@@ -0,0 +1,88 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+"""Remove debug logging statements from the firmware sources.
+
+Used by make_release.sh on a staging copy of src/mutenix_firmware, the
+release bundle then neither evaluates the log arguments nor calls log() at
+all. Only statements consisting of a single log() or log_info() call are
+removed, log_error() stays. A block left empty gets a ``pass``.
+
+Usage: python scripts/strip_logs.py DIRECTORY
+"""
+
+import ast
+import os
+import sys
+
+STRIPPED_CALLS = ("log", "log_info")
+BLOCK_FIELDS = ("body", "orelse", "finalbody")
+
+
+def is_log_statement(node):
+    return (
+        isinstance(node, ast.Expr)
+        and isinstance(node.value, ast.Call)
+        and isinstance(node.value.func, ast.Name)
+        and node.value.func.id in STRIPPED_CALLS
+    )
+
+
+def find_edits(tree):
+    """Return (statement, replace_with_pass) for each log statement."""
+    edits = []
+    for node in ast.walk(tree):
+        for field in BLOCK_FIELDS:
+            block = getattr(node, field, None)
+            if not isinstance(block, list) or not block:
+                continue
+            if not isinstance(block[0], ast.stmt):
+                continue
+            stripped = [stmt for stmt in block if is_log_statement(stmt)]
+            keep_one = len(stripped) == len(block)
+            for i, stmt in enumerate(stripped):
+                edits.append((stmt, keep_one and i == 0))
+    return edits
+
+
+def strip_source(source):
+    tree = ast.parse(source)
+    lines = source.splitlines(keepends=True)
+    edits = sorted(find_edits(tree), key=lambda e: e[0].lineno, reverse=True)
+    for stmt, replace_with_pass in edits:
+        first = stmt.lineno - 1
+        last = stmt.end_lineno - 1
+        prefix = lines[first][: stmt.col_offset]
+        suffix = lines[last][stmt.end_col_offset :]
+        if prefix.strip() or suffix.strip(" \t\r\n;").split("#")[0].strip():
+            # shares a line with other code, e.g. "if x: log(...)"
+            lines[first : last + 1] = [prefix + "pass" + suffix]
+        elif replace_with_pass:
+            lines[first : last + 1] = [prefix + "pass\n"]
+        else:
+            del lines[first : last + 1]
+    return "".join(lines)
+
+
+def strip_file(path):
+    with open(path) as f:
+        source = f.read()
+    stripped = strip_source(source)
+    if stripped == source:
+        return False
+    compile(stripped, path, "exec")
+    with open(path, "w") as f:
+        f.write(stripped)
+    return True
+
+
+def main(directory):
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".py") and strip_file(os.path.join(directory, name)):
+            print(f"stripped logging from {name}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1])
@@ -0,0 +1,123 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+"""Led effects run on the device, started by one host message each.
+
+Every led has at most one effect, given by its period, two colors and a
+value. Effects are computed with integers from the position in the period
+(0-255) and written to the leds by step(), which the main loop calls at a
+fixed frame rate:
+
+- BLINK: color1 in the first half of the period, color2 in the second
+- PULSE: breathes from color2 to color1 and back
+- FADE: fades once from color2 to color1, then keeps color1
+- RAINBOW: cycles the hue, brightness of the largest channel of color1, the
+  hue of consecutive leds is shifted by value
+- PROGRESS: lights value/255 of the leds with color1, the rest with color2
+"""
+
+from colors import hue_color
+from ticks import ticks_diff
+
+STOP = 0
+BLINK = 1
+PULSE = 2
+FADE = 3
+RAINBOW = 4
+PROGRESS = 5
+
+COLOR_SIZE = 4
+
+
+class Animations:
+    """Effects of a number of leds, see the module documentation.
+
+    Colors are rgbw like in SetColor. Leds with a running effect are kept in
+    a bitmask, step() returns right away when there are none.
+    """
+
+    def __init__(self, leds, count):
+        self._leds = leds
+        self._effects = bytearray(count)
+        self._values = bytearray(count)
+        self._periods = [0] * count
+        self._starts = [0] * count
+        # color1 and color2 of every led, with views to read them in place
+        self._colors = bytearray(count * 2 * COLOR_SIZE)
+        view = memoryview(self._colors)
+        self._color1 = [
+            view[i * 2 * COLOR_SIZE : i * 2 * COLOR_SIZE + COLOR_SIZE]
+            for i in range(count)
+        ]
+        self._color2 = [
+            view[i * 2 * COLOR_SIZE + COLOR_SIZE : (i + 1) * 2 * COLOR_SIZE]
+            for i in range(count)
+        ]
+        self._frame = bytearray(COLOR_SIZE)
+        self.active = 0
+
+    def start(self, led, count, effect, period_ms, color1, color2, value, now):
+        """Start the effect on count leds from led on, STOP ends it."""
+        for i in range(count):
+            index = led + i
+            if effect == PROGRESS:
+                # level of this led, full for the leds below the value
+                level = min(max(value * count - 255 * i, 0), 255)
+                self._set(index, color1, color2, level)
+                self.stop(index)
+                continue
+            if effect == STOP:
+                self.stop(index)
+                continue
+            self._color1[index][:] = color1[0:COLOR_SIZE]
+            self._color2[index][:] = color2[0:COLOR_SIZE]
+            self._effects[index] = effect
+            self._periods[index] = max(period_ms, 1)
+            self._starts[index] = now
+            self._values[index] = value * i & 0xFF
+            self.active |= 1 << index
+
+    def stop(self, led):
+        self._effects[led] = STOP
+        self.active &= ~(1 << led)
+
+    def stop_all(self):
+        for led in range(len(self._effects)):
+            self.stop(led)
+
+    def _set(self, led, color1, color2, level):
+        frame = self._frame
+        for c in range(COLOR_SIZE):
+            frame[c] = color2[c] + (color1[c] - color2[c]) * level // 255
+        self._leds[led] = frame
+
+    def step(self, now):
+        active = self.active
+        led = 0
+        while active:
+            if active & 1:
+                self._step(led, now)
+            active >>= 1
+            led += 1
+
+    def _step(self, led, now):
+        effect = self._effects[led]
+        period = self._periods[led]
+        elapsed = ticks_diff(now, self._starts[led])
+        color1 = self._color1[led]
+        color2 = self._color2[led]
+        position = (elapsed % period) * 256 // period
+        if effect == BLINK:
+            self._leds[led] = color1 if position < 128 else color2
+        elif effect == PULSE:
+            level = position * 2 if position < 128 else (255 - position) * 2
+            self._set(led, color1, color2, level)
+        elif effect == FADE:
+            if elapsed >= period:
+                self._leds[led] = color1
+                self.stop(led)
+            else:
+                self._set(led, color1, color2, elapsed * 255 // period)
+        elif effect == RAINBOW:
+            brightness = max(color1[0], color1[1], color1[2])
+            hue_color((position + self._values[led]) & 0xFF, brightness, self._frame)
+            self._leds[led] = self._frame
@@ -1,24 +1,29 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
-import time
-
 import digitalio  # type: ignore
+from ticks import ticks_diff
+from ticks import ticks_ms
+
+try:
+    import keypad  # type: ignore
+except ImportError:
+    keypad = None
 
 LONGPRESS_TIME_MS = 400
+DEBOUNCE_INTERVAL = 0.02
+EVENT_QUEUE_SIZE = 64
 
 
-class Button:
-    def __init__(self, id: int, pin=None):
-        self._pin = digitalio.DigitalInOut(pin)
-        self._pin.direction = digitalio.Direction.INPUT
-        self._pin.pull = digitalio.Pull.UP
-        self._state = not self._pin.value
+class BaseButton:
+    def __init__(self, id: int, state: bool = False):
+        self._state = state
         self._longpress = False
         self._pressed = self._state
         self._released = not self._state
         self._triggered = False
         self._changed_state = False
-        self._last = 0.0
+        self._last = 0
+        self._timestamp = 0
         self._id = id
         self._counter = 0
 
@@ -34,25 +39,26 @@ class Button:
     def longpressed(self):
         return self._longpress
 
-    def read(self):
-        value = not self._pin.value
-        if self._state != value:
-            self._changed_state = True
-            self._state = value
-            if value:
-                self._last = time.monotonic()
-                self._longpress = False
-                self._pressed = True
-                self._released = False
-                self._counter += 1
-            else:
-                self._longpress = (
-                    self._last + LONGPRESS_TIME_MS / 1000 < time.monotonic()
-                )
-                self._released = True
-                self._pressed = False
-                self._triggered = True
-        return self._pressed
+    @property
+    def timestamp(self):
+        """Ticks in ms of the last edge."""
+        return self._timestamp
+
+    def _update(self, value, timestamp):
+        self._changed_state = True
+        self._state = value
+        self._timestamp = timestamp
+        if value:
+            self._last = timestamp
+            self._longpress = False
+            self._pressed = True
+            self._released = False
+            self._counter += 1
+        else:
+            self._longpress = ticks_diff(timestamp, self._last) > LONGPRESS_TIME_MS
+            self._released = True
+            self._pressed = False
+            self._triggered = True
 
     @property
     def triggered(self):
@@ -79,3 +85,76 @@ class Button:
     @property
     def counter(self):
         return self._counter
+
+
+class Button(BaseButton):
+    """Button polled through digitalio on every read."""
+
+    def __init__(self, id: int, pin=None):
+        self._pin = digitalio.DigitalInOut(pin)
+        self._pin.direction = digitalio.Direction.INPUT
+        self._pin.pull = digitalio.Pull.UP
+        super().__init__(id, not self._pin.value)
+
+    def read(self):
+        value = not self._pin.value
+        if self._state != value:
+            self._update(value, ticks_ms())
+        return self._pressed
+
+
+class KeypadButton(BaseButton):
+    """Button fed with debounced, timestamped events by KeypadButtons."""
+
+    def __init__(self, id: int, pin=None):
+        super().__init__(id)
+        self._pin = pin
+
+    def read(self):
+        return self._pressed
+
+
+class KeypadButtons:
+    """Scans all buttons in the background using the keypad module."""
+
+    def __init__(self, pins, interval=DEBOUNCE_INTERVAL):
+        self._keys = keypad.Keys(
+            pins,
+            value_when_pressed=False,
+            pull=True,
+            interval=interval,
+            max_events=EVENT_QUEUE_SIZE,
+        )
+        self._event = keypad.Event()
+        self._deferred = None
+        self.buttons = [KeypadButton(i, pin) for i, pin in enumerate(pins, 1)]
+
+    @staticmethod
+    def available():
+        return keypad is not None
+
+    def read(self):
+        """Apply queued events, at most one edge per button and call.
+
+        A second edge of the same button stays queued for the next call, so
+        every edge is reported separately even if the loop was busy.
+        """
+        changed = 0
+        if self._keys.events.overflowed:
+            # edges got lost, start over with the current state of the keys
+            self._keys.events.clear()
+            self._keys.reset()
+            self._deferred = None
+        if self._deferred is not None:
+            key_number, pressed, timestamp = self._deferred
+            self._deferred = None
+            self.buttons[key_number]._update(pressed, timestamp)
+            changed = 1 << key_number
+        event = self._event
+        while self._keys.events.get_into(event):
+            if changed & (1 << event.key_number):
+                self._deferred = (event.key_number, event.pressed, event.timestamp)
+                break
+            self.buttons[event.key_number]._update(event.pressed, event.timestamp)
+            changed |= 1 << event.key_number
+        return changed
@@ -0,0 +1,60 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+"""Button chords, actions triggered by holding several buttons together.
+
+The pressed buttons are kept as bitmask which is only updated on button
+edges. An edge arms the chord matching exactly the pressed buttons, so a
+chord is not triggered while more buttons are held. check() is called every
+loop iteration and costs one comparison while no chord is armed.
+"""
+
+from ticks import ticks_diff
+
+DEFAULT_HOLD_MS = 500
+
+
+class Chord:
+    def __init__(self, buttons, action, hold_ms=DEFAULT_HOLD_MS):
+        self.mask = 0
+        for index in buttons:
+            self.mask |= 1 << index
+        self.action = action
+        self.hold_ms = hold_ms
+
+
+class Chords:
+    """Fires the action of a chord once it was held for its hold time.
+
+    Buttons are indices into the button list. A chord fires once per press,
+    it is armed again when the pressed buttons change.
+    """
+
+    def __init__(self):
+        self._chords = {}
+        self.pressed = 0
+        self._armed = None
+        self._since = 0
+
+    def add(self, buttons, action, hold_ms=DEFAULT_HOLD_MS):
+        chord = Chord(buttons, action, hold_ms)
+        if chord.mask in self._chords:
+            raise ValueError("chord already defined")
+        self._chords[chord.mask] = chord
+        return chord
+
+    def edge(self, index, pressed, timestamp):
+        if pressed:
+            self.pressed |= 1 << index
+        else:
+            self.pressed &= ~(1 << index)
+        self._armed = self._chords.get(self.pressed)
+        self._since = timestamp
+
+    def check(self, now):
+        """Run the armed chord if it was held long enough, returns if it ran."""
+        chord = self._armed
+        if chord is None or ticks_diff(now, self._since) < chord.hold_ms:
+            return False
+        self._armed = None
+        chord.action()
+        return True
@@ -0,0 +1,57 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+"""Integer lookup tables for led colors.
+
+The tables are computed once at import, so setting colors, mixing and
+cycling hues needs no float math per frame.
+"""
+
+
+def _hue_wheel():
+    wheel = bytearray(256 * 3)
+    for hue in range(256):
+        region = hue * 6 >> 8
+        up = (hue * 6 & 0xFF) * 255 >> 8
+        down = 255 - up
+        wheel[hue * 3 : hue * 3 + 3] = (
+            (255, up, 0),
+            (down, 255, 0),
+            (0, 255, up),
+            (0, down, 255),
+            (up, 0, 255),
+            (255, 0, down),
+        )[region]
+    return wheel
+
+
+# rgb of hue 0-255 at full brightness
+HUE_WHEEL = _hue_wheel()
+# perceived to linear brightness, gamma 2.2
+GAMMA = bytes(int((i / 255) ** 2.2 * 255 + 0.5) for i in range(256))
+
+
+def scale(value, brightness):
+    """value * brightness / 255 for values 0-255, exact at both ends."""
+    return value * (brightness + 1) >> 8
+
+
+def hue_color(hue, brightness, color):
+    """Write the rgb color of hue (0-255) with the given brightness."""
+    offset = (hue & 0xFF) * 3
+    color[0] = HUE_WHEEL[offset] * (brightness + 1) >> 8
+    color[1] = HUE_WHEEL[offset + 1] * (brightness + 1) >> 8
+    color[2] = HUE_WHEEL[offset + 2] * (brightness + 1) >> 8
+    color[3] = 0
+
+
+def levels(brightness=255, gamma=False):
+    """Per channel table applying gamma and brightness.
+
+    None if the table would not change any value, so callers can skip it.
+    """
+    if brightness >= 255 and not gamma:
+        return None
+    table = bytearray(256)
+    for i in range(256):
+        table[i] = scale(GAMMA[i] if gamma else i, brightness)
+    return table
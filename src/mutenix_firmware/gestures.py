@@ -0,0 +1,89 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+"""Tap sequence gestures recognised from the button edges.
+
+A button tapped once or twice and then left alone for the tap window gives
+SINGLE or DOUBLE, the third tap gives TRIPLE right away. A press held for
+the hold time gives HOLD, with the number of taps before it (tap and hold),
+and its release HOLD_RELEASED. Every completed gesture is passed once to the
+emit callback as emit(index, gesture, taps, start), start being the ticks of
+its first press.
+"""
+
+from button import LONGPRESS_TIME_MS
+from ticks import ticks_diff
+
+SINGLE = 1
+DOUBLE = 2
+TRIPLE = 3
+HOLD = 4
+HOLD_RELEASED = 5
+
+MAX_TAPS = 3
+TAP_WINDOW_MS = 250
+HOLD_MS = LONGPRESS_TIME_MS
+
+_IDLE = 0
+_PRESSED = 1
+_RELEASED = 2
+_HOLDING = 3
+
+
+class Gestures:
+    """Gesture recognisers for a number of buttons, addressed by index.
+
+    edge() is called for every button edge, check() every loop iteration to
+    finish gestures by timeout. Buttons with a running timeout are kept in a
+    bitmask, so check() returns right away while all buttons are idle.
+    """
+
+    def __init__(self, count, emit, tap_window_ms=TAP_WINDOW_MS, hold_ms=HOLD_MS):
+        self._emit = emit
+        self.tap_window_ms = tap_window_ms
+        self.hold_ms = hold_ms
+        self._state = bytearray(count)
+        self._taps = bytearray(count)
+        self._start = [0] * count
+        self._since = [0] * count
+        self._waiting = 0
+
+    def edge(self, index, pressed, timestamp):
+        state = self._state[index]
+        if pressed:
+            if state != _RELEASED:
+                self._taps[index] = 0
+                self._start[index] = timestamp
+            self._state[index] = _PRESSED
+            self._since[index] = timestamp
+            self._waiting |= 1 << index
+        elif state == _HOLDING:
+            self._finish(index, HOLD_RELEASED)
+        elif state == _PRESSED:
+            self._taps[index] += 1
+            if self._taps[index] == MAX_TAPS:
+                self._finish(index, TRIPLE)
+            else:
+                self._state[index] = _RELEASED
+                self._since[index] = timestamp
+
+    def _finish(self, index, gesture):
+        self._state[index] = _IDLE
+        self._waiting &= ~(1 << index)
+        self._emit(index, gesture, self._taps[index], self._start[index])
+
+    def check(self, now):
+        waiting = self._waiting
+        index = 0
+        while waiting:
+            if waiting & 1:
+                state = self._state[index]
+                elapsed = ticks_diff(now, self._since[index])
+                if state == _PRESSED and elapsed >= self.hold_ms:
+                    self._state[index] = _HOLDING
+                    self._waiting &= ~(1 << index)
+                    self._emit(index, HOLD, self._taps[index], self._start[index])
+                elif state == _RELEASED and elapsed >= self.tap_window_ms:
+                    # SINGLE and DOUBLE are the number of taps
+                    self._finish(index, self._taps[index])
+            waiting >>= 1
+            index += 1
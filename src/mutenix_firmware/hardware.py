@@ -1,7 +1,6 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
 import os
-import time
 
 import adafruit_ble  # type: ignore
 import board
@@ -11,6 +10,7 @@ import myhid
 import neopixel_write  # type: ignore
 import version
 from _bleio import adapter  # type: ignore
+from _bleio import CharacteristicBuffer  # type: ignore
 from adafruit_ble.advertising import Advertisement  # type: ignore
 from adafruit_ble.advertising.standard import ProvideServicesAdvertisement  # type: ignore
 from adafruit_ble.services.standard import BatteryService  # type: ignore
@@ -19,7 +19,12 @@ from adafruit_ble.services.standard.hid import HIDService  # type: ignore
 from adafruit_ble.services.standard.hid import ReportIn  # type: ignore
 from adafruit_ble.services.standard.hid import ReportOut  # type: ignore
 from button import Button
+from button import KeypadButtons
+from colors import hue_color
+from colors import levels
 from log import log
+from ticks import ticks_diff
+from ticks import ticks_ms
 
 
 FIVE_BUTTON_USB = 0x02
@@ -28,6 +33,11 @@ FIVE_BUTTON_USB_V2 = 0x04
 TEN_BUTTON_USB_V2 = 0x05
 TEN_BUTTON_BT = 0x06
 
+# report 2 from the host, see myhid.py
+UPDATE_REPORT_LENGTH = 60
+# report 2 writes queued between two reads
+UPDATE_REPORT_QUEUE = 4
+
 
 def file_or_dir_exists(filename):
     try:
@@ -37,20 +47,21 @@ def file_or_dir_exists(filename):
         return False
 
 
-def mix_color(color1, color2, descriminant, divisor):
+def mix_color(color1, color2, descriminant, divisor, out=None):
+    """color1 * descriminant / divisor + color2 * the rest, in integers.
+
+    The result is written to out if given, otherwise a new bytearray.
+    """
     if isinstance(color1, str):
         color1 = LedColors[color1]
     if isinstance(color2, str):
         color2 = LedColors[color2]
-    return bytearray(
-        [
-            int(
-                (color1[i] * descriminant + color2[i] * (divisor - descriminant))
-                / divisor,
-            )
-            for i in range(4)
-        ],
-    )
+    if out is None:
+        out = bytearray(4)
+    rest = divisor - descriminant
+    for i in range(4):
+        out[i] = (color1[i] * descriminant + color2[i] * rest) // divisor
+    return out
 
 
 GRBW = 0
@@ -76,19 +87,24 @@ class Rainbow:
     def __init__(self, led, selected, speed=0.1):
         self.led = led
         self.speed = speed
+        self._interval_ms = int(speed * 1000)
+        self._hue_step = int(speed * 256)
         self._hue = 0
         self._selected = selected
-        self._time = time.monotonic()
+        self._time = ticks_ms()
         self._was_active = True
+        self._color = bytearray(4)
 
     def next(self):
-        if time.monotonic() - self._time < self.speed:
+        now = ticks_ms()
+        if ticks_diff(now, self._time) < self._interval_ms:
             return
         self._was_active = True
-        self._time = time.monotonic()
-        self._hue = (self._hue + self.speed) % 1
+        self._time = now
+        self._hue = (self._hue + self._hue_step) & 0xFF
+        hue_color(self._hue, 10, self._color)
         for i in self._selected:
-            self.led[i] = self._color(i)
+            self.led[i] = self._color
 
     def was_active(self):
         return self._was_active
@@ -96,44 +112,32 @@ class Rainbow:
     def off(self):
         self._was_active = False
         for i in self._selected:
-            self.led[i] = bytearray([0, 0, 0, 0])
-
-    def _color(self, i):
-        r, g, b = self._hsv_to_rgb(self._hue, 1, 1)
-        return bytearray([int(g * 10), int(r * 10), int(b * 10), 0])
-
-    def _hsv_to_rgb(self, h, s, v):
-        i = int(h * 6)
-        f = (h * 6) - i
-        p = v * (1 - s)
-        q = v * (1 - f * s)
-        t = v * (1 - (1 - f) * s)
-
-        if i % 6 == 0:
-            r, g, b = v, t, p
-        elif i % 6 == 1:
-            r, g, b = q, v, p
-        elif i % 6 == 2:
-            r, g, b = p, v, t
-        elif i % 6 == 3:
-            r, g, b = p, q, v
-        elif i % 6 == 4:
-            r, g, b = t, p, v
-        else:
-            r, g, b = v, p, q
-
-        return r, g, b
+            self.led[i] = "black"
 
 
 class ColorLeds:
-    def __init__(self, pin, count, colormode=GRB, mapping=None, rainbow=None):
+    """Frame buffer of the led strip, colors are set as rgbw or by name.
+
+    Colors are reordered for the strip and passed through the levels table
+    (gamma and brightness, see colors.levels()) into the frame without
+    allocating. Named colors are converted once per instance. A GRB strip
+    shows a color with only the white channel set as gray.
+    """
+
+    def __init__(
+        self,
+        pin,
+        count,
+        colormode=GRB,
+        mapping=None,
+        rainbow=None,
+        brightness=255,
+        gamma=False,
+    ):
         self.pin = digitalio.DigitalInOut(pin)
         self.pin.direction = digitalio.Direction.OUTPUT
         self._colormode = colormode
-        if colormode == GRB:
-            self._size = 3
-        else:
-            self._size = 4
+        self._size = 3 if colormode == GRB else 4
         self.colors = bytearray(count * self._size)
         self.count = count
         if mapping is None:
@@ -141,6 +145,32 @@ class ColorLeds:
         else:
             self._mapping = mapping
         self._rainbow = Rainbow(self, rainbow or list(range(1, count)))
+        self._scratch = bytearray(self._size)
+        self._dirty = True
+        self._held = False
+        self.set_brightness(brightness, gamma)
+
+    def set_brightness(self, brightness, gamma=False):
+        """Scale colors set from now on to brightness (0-255)."""
+        self._levels = levels(brightness, gamma)
+        self._named = {}
+        for name, color in LedColors.items():
+            self._convert(color)
+            self._named[name] = bytes(self._scratch)
+
+    def _convert(self, value):
+        # both strips are grb(w), unrolled as this runs for every led and frame
+        scratch = self._scratch
+        if self._size == 4:
+            scratch[3] = value[3]
+        elif len(value) == 4 and not (value[0] or value[1] or value[2]):
+            scratch[0] = scratch[1] = scratch[2] = value[3]
+            value = scratch
+        scratch[0], scratch[1], scratch[2] = value[1], value[0], value[2]
+        table = self._levels
+        if table is not None:
+            for i in range(self._size):
+                scratch[i] = table[scratch[i]]
 
     def __getitem__(self, key):
         key = self._mapping[key]
@@ -150,35 +180,54 @@ class ColorLeds:
 
     def __setitem__(self, key, value):
         if isinstance(value, str):
-            value = LedColors[value]
-        if not isinstance(value, (bytes, bytearray)):
-            raise ValueError("Value must be a bytes or bytearray object")
-        if len(value) < self._size:
+            value = self._named[value]
+        elif not isinstance(value, (bytes, bytearray, memoryview)):
+            raise ValueError("Value must be a bytes, bytearray or memoryview object")
+        elif len(value) < self._size:
             raise ValueError("Value must be exactly 4 bytes long")
-        key = self._mapping[key]
-
-        def set_color(ckey, cvalue):
-            if self._colormode == GRBW:
-                cvalue = bytearray([cvalue[1], cvalue[0], cvalue[2], cvalue[3]])
-            if self._colormode == GRB:
-                if sum(cvalue[0:3]) == 0 and len(cvalue) == 4:
-                    cvalue = bytearray([cvalue[3], cvalue[3], cvalue[3]])
-                else:
-                    cvalue = bytearray([cvalue[1], cvalue[0], cvalue[2]])
-            self.colors[ckey * self._size : ckey * self._size + self._size] = cvalue[
-                0 : self._size
-            ]
+        else:
+            self._convert(value)
+            value = self._scratch
+        self._store(self._mapping[key], value)
 
+    def _store(self, key, value):
         if isinstance(key, list):
             for k in key:
-                set_color(k, value)
-        else:
-            set_color(key, value)
-        neopixel_write.neopixel_write(self.pin, self.colors)
+                self._store(k, value)
+            return
+        colors = self.colors
+        start = key * self._size
+        if (
+            colors[start] != value[0]
+            or colors[start + 1] != value[1]
+            or colors[start + 2] != value[2]
+            or (self._size == 4 and colors[start + 3] != value[3])
+        ):
+            colors[start] = value[0]
+            colors[start + 1] = value[1]
+            colors[start + 2] = value[2]
+            if self._size == 4:
+                colors[start + 3] = value[3]
+            self._dirty = True
 
     def __len__(self):
         return self.count
 
+    def hold(self):
+        """Keep showing the current frame until release() is called."""
+        self._held = True
+
+    def release(self):
+        self._held = False
+
+    def show(self):
+        """Write the frame to the strip, if anything changed since the last call."""
+        if not self._dirty or self._held:
+            return False
+        neopixel_write.neopixel_write(self.pin, self.colors)
+        self._dirty = False
+        return True
+
     def rainbow_next(self):
         self._rainbow.next()
 
@@ -203,12 +252,14 @@ class HardwareOptions:
         self._bluetooth = None
         self._ble_advertising = False
         self._last_read = None
+        self._update_writes = None
         self._battery_level = 10
         self._update_communication_in = None
         self._update_communication_out = None
         self._hid_communication_in = None
         self._hid_communication_out = None
         self._precvious_bl_led_state = None
+        self._batteryservice = None
         self._setup_hardware_config()
         self._set_buttons()
         self._init_leds()
@@ -280,9 +331,17 @@ class HardwareOptions:
                         board.P0_31,
                     ],
                 )
-        self.buttons = [Button(i, pin) for i, pin in enumerate(self.button_pins, 1)]
+        if KeypadButtons.available():
+            self._keys = KeypadButtons(self.button_pins)
+            self.buttons = self._keys.buttons
+        else:
+            self._keys = None
+            self.buttons = [Button(i, pin) for i, pin in enumerate(self.button_pins, 1)]
 
     def read_buttons(self):
+        if self._keys is not None:
+            self._keys.read()
+            return
         for b in self.buttons:
             b.read()
 
@@ -330,6 +389,10 @@ class HardwareOptions:
                 rainbow=list(range(6, 1)),
             )
 
+    @property
+    def bluetooth_led(self):
+        return 11 if self.hardware_variant == TEN_BUTTON_BT else 6
+
     @property
     def has_bluetooth(self):
         return self.hardware_variant in [FIVE_BUTTON_BT, TEN_BUTTON_BT]
@@ -389,7 +452,8 @@ class HardwareOptions:
         else:
             ledcolor = "red"
         if ledcolor != self._precvious_bl_led_state:
-            self.leds[11] = ledcolor
+            self.leds[self.bluetooth_led] = ledcolor
+            self._precvious_bl_led_state = ledcolor
 
     def _setup_hid_endpoints(self):
         self._hid_communication_out = next(
@@ -416,6 +480,11 @@ class HardwareOptions:
                 self._hid.devices,
             ),
         )
+        # queues every write, the update protocol repeats identical reports
+        self._update_writes = CharacteristicBuffer(
+            self._update_communication_out._characteristic,
+            buffer_size=UPDATE_REPORT_LENGTH * UPDATE_REPORT_QUEUE,
+        )
 
     def read_bluetooth_hid(self):
         new_value = self._hid_communication_out.report
@@ -424,6 +493,11 @@ class HardwareOptions:
         self._last_read = new_value
         return new_value
 
+    def read_bluetooth_update(self):
+        if self._update_writes.in_waiting < UPDATE_REPORT_LENGTH:
+            return None
+        return self._update_writes.read(UPDATE_REPORT_LENGTH)
+
     def send_bluetooth_hid(self, data):
         self._hid_communication_in.send_report(data)
 
@@ -433,13 +507,15 @@ class HardwareOptions:
 
     @property
     def bluetooth_connected(self):
-        if not self.has_bluetooth:
+        # update.py only sets up bluetooth when it needs it
+        if not self.has_bluetooth or self._bluetooth is None:
             return False
         return self._bluetooth.connected
 
     def set_battery_level(self, value):
         self._battery_level = value
-        self._batteryservice.level = self._battery_level
+        if self._batteryservice is not None:
+            self._batteryservice.level = self._battery_level
 
     @property
     def is_ten_button_variant(self):
@@ -1,20 +1,163 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+"""Logging to serial and, on bluetooth variants, to the update characteristic.
+
+Messages are %-format strings with up to four arguments. Formatting only
+happens when a message is emitted, so call sites must not pre-format
+(no f-strings). The arguments are fixed parameters instead of *args to avoid
+allocating a tuple per call. log() and log_info() calls are removed from the
+release bundle by scripts/strip_logs.py.
+
+Over bluetooth the messages are queued in a LogBuffer and sent in batches by
+flush_log(), which the main loop calls when the link is idle.
+"""
+
+import struct
+
 import debug_on
 import hardware
+from ticks import ticks_diff
+from ticks import ticks_ms
 
+DEBUG = 10
+INFO = 20
+ERROR = 40
 
-def log(*args, **kwargs):
-    if not debug_on.debug:
-        return
-    print(*args, **kwargs)
-    if hardware.hardware_variant.has_bluetooth:
-        text = "LD" + " ".join(map(str, args)) + " " * 36
-        hardware.hardware_variant.send_bluetooth_update(text[:36])
+# messages below this level are dropped before they are formatted
+level = DEBUG if debug_on.debug else ERROR
+
+_NO_ARG = object()
+LOG_REPORT_LENGTH = 36
+# "LB" + one header byte per entry
+LOG_ENTRY_LENGTH = LOG_REPORT_LENGTH - 3
+LOG_BUFFER_SLOTS = 16
+LOG_FLUSH_INTERVAL_MS = 50
+ENTRY_ERROR = 0x80
+
+
+def set_level(new_level):
+    global level
+    level = new_level
+
+
+def format_message(msg, a=_NO_ARG, b=_NO_ARG, c=_NO_ARG, d=_NO_ARG):
+    if a is _NO_ARG:
+        return msg
+    args = tuple(arg for arg in (a, b, c, d) if arg is not _NO_ARG)
+    try:
+        return msg % args
+    except TypeError:
+        return " ".join(map(str, (msg,) + args))
+
+
+class LogBuffer:
+    """Ring buffer of log messages sent in batches as 36 byte reports.
+
+    A "LB" report holds as many entries as fit, each is a header byte (length,
+    ENTRY_ERROR for errors) followed by the text, a zero header ends the list.
+    When the buffer is full the oldest entry is dropped, the number of dropped
+    entries is sent as "LX" report (uint32 little endian) before the next batch.
+    At most one report is sent per interval.
+    """
+
+    def __init__(self, slots=LOG_BUFFER_SLOTS, interval_ms=LOG_FLUSH_INTERVAL_MS):
+        self._entries = bytearray(slots * LOG_ENTRY_LENGTH)
+        self._headers = bytearray(slots)
+        self._slots = slots
+        self._first = 0
+        self._count = 0
+        self._interval_ms = interval_ms
+        self._last_flush = None
+        self._report = bytearray(LOG_REPORT_LENGTH)
+        self.dropped = 0
+        self._reported_dropped = 0
+
+    def __len__(self):
+        return self._count
 
+    @property
+    def pending(self):
+        return self._count > 0 or self.dropped != self._reported_dropped
 
-def log_error(*args, **kwargs):
-    print(*args, **kwargs)
+    def put(self, text, error=False):
+        # an empty entry would end the batch
+        data = text.encode()[:LOG_ENTRY_LENGTH] or b" "
+        if self._count == self._slots:
+            self._first = (self._first + 1) % self._slots
+            self._count -= 1
+            self.dropped += 1
+        slot = (self._first + self._count) % self._slots
+        offset = slot * LOG_ENTRY_LENGTH
+        self._entries[offset : offset + len(data)] = data
+        self._headers[slot] = len(data) | (ENTRY_ERROR if error else 0)
+        self._count += 1
+
+    def flush(self, send, now):
+        """Send one report if the interval since the last one has passed."""
+        if not self.pending:
+            return False
+        if (
+            self._last_flush is not None
+            and ticks_diff(now, self._last_flush) < self._interval_ms
+        ):
+            return False
+        self._last_flush = now
+        report = self._report
+        for i in range(LOG_REPORT_LENGTH):
+            report[i] = 0
+        if self.dropped != self._reported_dropped:
+            report[0:2] = b"LX"
+            struct.pack_into("<I", report, 2, self.dropped)
+            self._reported_dropped = self.dropped
+        else:
+            report[0:2] = b"LB"
+            position = 2
+            while self._count:
+                header = self._headers[self._first]
+                length = header & 0x7F
+                if position + 1 + length > LOG_REPORT_LENGTH:
+                    break
+                offset = self._first * LOG_ENTRY_LENGTH
+                report[position] = header
+                report[position + 1 : position + 1 + length] = self._entries[
+                    offset : offset + length
+                ]
+                position += 1 + length
+                self._first = (self._first + 1) % self._slots
+                self._count -= 1
+        send(report)
+        return True
+
+
+log_buffer = LogBuffer()
+
+
+def flush_log():
+    """Send buffered log messages over bluetooth, call when the link is idle."""
+    if log_buffer.pending and hardware.hardware_variant.bluetooth_connected:
+        log_buffer.flush(hardware.hardware_variant.send_bluetooth_update, ticks_ms())
+
+
+def _emit(error, msg, a, b, c, d):
+    text = format_message(msg, a, b, c, d)
+    print(text)
     if hardware.hardware_variant.has_bluetooth:
-        text = "LE" + " ".join(map(str, args)) + " " * 36
-        hardware.hardware_variant.send_bluetooth_update(text[:36])
+        log_buffer.put(text, error)
+
+
+def log(msg, a=_NO_ARG, b=_NO_ARG, c=_NO_ARG, d=_NO_ARG):
+    if level > DEBUG:
+        return
+    _emit(False, msg, a, b, c, d)
+
+
+def log_info(msg, a=_NO_ARG, b=_NO_ARG, c=_NO_ARG, d=_NO_ARG):
+    if level > INFO:
+        return
+    _emit(False, msg, a, b, c, d)
+
+
+def log_error(msg, a=_NO_ARG, b=_NO_ARG, c=_NO_ARG, d=_NO_ARG):
+    if level > ERROR:
+        return
+    _emit(True, msg, a, b, c, d)
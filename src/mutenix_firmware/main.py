@@ -2,25 +2,66 @@
 # Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
 import time
 
+import debug_on
 import storage  # type: ignore
 import supervisor  # type: ignore
 import usb_hid  # type: ignore
+from animation import Animations
+from chords import Chords
+from gestures import Gestures
 from hardware import hardware_variant
+from log import flush_log
 from log import log
+from log import LOG_FLUSH_INTERVAL_MS
 from log import log_error
+from power import IdleMonitor
+from protocol import Animate
+from protocol import CAPABILITY_AGGREGATED_STATUS
+from protocol import CAPABILITY_GESTURES
+from protocol import CAPABILITY_TIMESTAMPS
+from protocol import Dispatcher
+from protocol import GestureConfig
 from protocol import InMessage
 from protocol import OutMessage
 from protocol import Ping
 from protocol import PrepareUpdate
 from protocol import Reset
 from protocol import SetColor
-from protocol import Unknown
+from protocol import SetColors
+from protocol import StatsRequest
+from protocol import TimeSync
 from protocol import UpdateConfig
+from scheduler import Scheduler
+from stats import LoopStats
+from stats import PHASE_ALL
+from stats import PHASE_BLE
+from stats import PHASE_BUTTONS
+from stats import PHASE_COUNT
+from stats import PHASE_DISPATCH
+from stats import PHASE_LEDS
+from stats import PHASE_RX
+from ticks import ticks_ms
 
 
-COMBO_ACTIVATION_TIME = 500_000_000
 COMMUNICATION_TIMEOUT = 5.5
 
+# task intervals, buttons and host reports are checked every tick
+BUTTON_INTERVAL_MS = 1
+RECEIVE_INTERVAL_MS = 1
+LED_INTERVAL_MS = 10
+ANIMATION_INTERVAL_MS = 20
+HEARTBEAT_INTERVAL_MS = 100
+BLUETOOTH_INTERVAL_MS = 100
+# buffered logs are only sent after this long without reports or button edges
+LOG_IDLE_MS = 20
+# bluetooth variants slow down after this long without button edges or host
+# messages other than pings, the keypad keeps scanning in the background
+IDLE_AFTER_MS = 30_000
+IDLE_BUTTON_INTERVAL_MS = 10
+IDLE_RECEIVE_INTERVAL_MS = 20
+IDLE_LED_INTERVAL_MS = 100
+POWER_INTERVAL_MS = 100
+
 update_mode = False
 macropad = usb_hid.devices[0]
 
@@ -32,13 +73,17 @@ def do_reset():  # pragma: no cover
 
 
 last_communication: float = 0.0
+host_capabilities = 0
+loop_stats = LoopStats()
+animations = Animations(hardware_variant.leds, len(hardware_variant.leds))
 
 
-def update_config(update):
+def write_config(debug=None, filesystem=None):
+    """Change debug_on.py, None keeps the current value."""
     try:
         storage.remount("/", readonly=False)
     except RuntimeError:
-        return
+        return False
     with open("/debug_on.py", "r") as f:
         lines = f.readlines()
 
@@ -48,11 +93,19 @@ def update_config(update):
                 f.write(line)
                 continue
             name, value = map(str.strip, line.split("="))
-            if name in ["serial", "debug"] and update.update_debug is not None:
-                value = str(update.activate_debug)
-            if name == "filesystem" and update.update_filesystem is not None:
-                value = str(update.activate_filesystem)
+            if name in ["serial", "debug"] and debug is not None:
+                value = str(debug)
+            if name == "filesystem" and filesystem is not None:
+                value = str(filesystem)
             f.write(f"{name} = {value}\n")
+    return True
+
+
+def update_config(update):
+    write_config(
+        update.activate_debug if update.update_debug is not None else None,
+        update.activate_filesystem if update.update_filesystem is not None else None,
+    )
 
 
 def send_message(message):
@@ -64,105 +117,321 @@ def send_message(message):
         message.send(macropad)
 
 
+def send_update_report(data):
+    if hardware_variant.bluetooth_connected:
+        hardware_variant.send_bluetooth_update(data)
+    elif supervisor.runtime.usb_connected:
+        macropad.send_report(data, 2)
+
+
+def send_stats(request):
+    if request.phase == PHASE_ALL:
+        phases = range(PHASE_COUNT)
+    elif request.phase < PHASE_COUNT:
+        phases = range(request.phase, request.phase + 1)
+    else:
+        return
+    for phase in phases:
+        send_update_report(loop_stats.report(phase))
+    if request.reset:
+        loop_stats.reset()
+
+
+def is_host_led(led):
+    return led >= 1 and (
+        led < 6 or (hardware_variant.is_ten_button_variant and led < 11)
+    )
+
+
+def on_ping(message):
+    global host_capabilities
+    host_capabilities = message.capabilities
+    send_message(InMessage.initialize())
+    log("ping")
+
+
+def on_set_color(message):
+    led = message.buttonid
+    if is_host_led(led):
+        animations.stop(led)
+        hardware_variant.leds[led] = message.color
+    log("led %d set", led)
+
+
+def on_set_colors(message):
+    start = message.start
+    count = message.count
+    for i in range(count):
+        if is_host_led(start + i):
+            animations.stop(start + i)
+            hardware_variant.leds[start + i] = message.color(i)
+    if message.stage:
+        hardware_variant.leds.hold()
+    else:
+        hardware_variant.leds.release()
+    log("leds %d-%d set, staged %s", start, start + count - 1, message.stage)
+
+
+def on_animate(message):
+    start = message.start
+    count = 0
+    while count < message.count and is_host_led(start + count):
+        count += 1
+    animations.start(
+        start,
+        count,
+        message.effect,
+        message.period_ms,
+        message.color1,
+        message.color2,
+        message.value,
+        ticks_ms(),
+    )
+    log("leds %d+%d effect %d", start, count, message.effect)
+
+
+def on_gesture_config(message):
+    if message.tap_window_ms:
+        gestures.tap_window_ms = message.tap_window_ms
+    if message.hold_ms:
+        gestures.hold_ms = message.hold_ms
+    log("gesture config %d %d", gestures.tap_window_ms, gestures.hold_ms)
+
+
+def on_time_sync(message):
+    send_message(InMessage.time_sync(message.token, ticks_ms()))
+
+
+def enter_update_mode():
+    global update_mode
+    update_mode = True
+
+
+def on_prepare_update(message):
+    log("Prepare update")
+    enter_update_mode()
+
+
+def on_reset(message):
+    log("Reset")
+    do_reset()
+
+
+def on_update_config(message):
+    log("Update config %s, %s", message.activate_debug, message.activate_filesystem)
+    update_config(message)
+
+
+def on_unknown(report):
+    log("Unknown message %s", report)
+
+
+dispatcher = Dispatcher(unknown=on_unknown)
+dispatcher.register(Ping, on_ping)
+dispatcher.register(SetColor, on_set_color)
+dispatcher.register(SetColors, on_set_colors)
+dispatcher.register(Animate, on_animate)
+dispatcher.register(GestureConfig, on_gesture_config)
+dispatcher.register(StatsRequest, send_stats)
+dispatcher.register(TimeSync, on_time_sync)
+dispatcher.register(PrepareUpdate, on_prepare_update)
+dispatcher.register(Reset, on_reset)
+dispatcher.register(UpdateConfig, on_update_config)
+
+
 def handle_received_report(data):
     log("Data received")
-    p = OutMessage.from_buffer(data)
-    if isinstance(p, Ping):
-        send_message(InMessage.initialize())
-        log("ping")
-    elif isinstance(p, SetColor):
-        if p.buttonid >= 1 and (
-            p.buttonid < 6
-            or (hardware_variant.is_ten_button_variant and p.buttonid < 11)
-        ):
-            hardware_variant.leds[p.buttonid] = p.color
-        log(f"led {p.buttonid} set to {p.color}")
-    elif isinstance(p, PrepareUpdate):
-        log("Prepare update")
-        global update_mode
-        update_mode = True
-    elif isinstance(p, Reset):
-        log("Reset")
-        do_reset()
-    elif isinstance(p, UpdateConfig):
-        log(f"Update config {p.activate_debug}, {p.activate_filesystem}")
-        update_config(p)
-    elif isinstance(p, Unknown):
-        log(f"Unknown message {p.data}")
-
-
-class Combos:
-    def __init__(self, combos):
-        self.combos = combos
-        self.combo_matched_time = {}
-
-    def check(self):
-        for c, f in self.combos.items():
-            if all([hardware_variant.buttons[i].pressed for i in c]):
-                if self.combo_matched_time[c] == 0:
-                    self.combo_matched_time[c] = time.monotonic_ns()
-                if (
-                    time.monotonic_ns() - self.combo_matched_time[c]
-                    > COMBO_ACTIVATION_TIME
-                ):
-                    f()
-                    for i in c:
-                        hardware_variant.buttons[i].handled()
-                    self.combo_matched_time = {}
-            else:
-                self.combo_matched_time[c] = 0
-
-
-combos = Combos(
-    {
-        (0, 1, 4): do_reset,
-    },
+    dispatcher.dispatch(data)
+
+
+def toggle_debug():
+    if write_config(debug=not debug_on.debug):
+        supervisor.reload()
+
+
+def chord_report(chord_id):
+    def send():
+        send_message(InMessage.chord(chord_id, chords.pressed))
+
+    return send
+
+
+# buttons as indices into hardware_variant.buttons, hold time in ms, action
+CHORDS = (
+    ((0, 1, 4), 500, do_reset),
+    ((0, 1, 3), 2000, enter_update_mode),
+    ((0, 1, 2), 2000, toggle_debug),
+    ((3, 4), 1000, chord_report(1)),
 )
 
-hardware_variant.setup_bluetooth()
+chords = Chords()
+for chord_buttons, hold_ms, action in CHORDS:
+    chords.add(chord_buttons, action, hold_ms)
+
+
+def on_gesture(index, gesture, taps, start):
+    if host_capabilities & CAPABILITY_GESTURES:
+        button_id = hardware_variant.buttons[index].id
+        send_message(InMessage.gesture(button_id, gesture, taps, start, ticks_ms()))
+
 
-while True:
+gestures = Gestures(len(hardware_variant.buttons), on_gesture)
+
+
+def receive_reports():
     data = None
+    frame = None
     if hardware_variant.bluetooth_connected:
         try:
             data = hardware_variant.read_bluetooth_hid()
+            frame = hardware_variant.read_bluetooth_update()
             if data:
-                log("data from bt", data)
+                log("data from bt %s", data)
         except Exception as e:
-            log_error(f"Bluetooth receiving not working, but who cares {e}")
+            log_error("Bluetooth receiving not working, but who cares %s", e)
     elif supervisor.runtime.usb_connected:
         try:
             data = macropad.get_last_received_report(1)
+            frame = macropad.get_last_received_report(2)
             if data:
-                log("data from usb", data)
+                log("data from usb %s", data)
         except Exception as e:
-            log_error(f"USB receiving not working, but who cares {e}")
+            log_error("USB receiving not working, but who cares %s", e)
+    return data, frame
+
+
+def receive_task():
+    global last_communication
+    data, frame = receive_reports()
+    loop_stats.mark(PHASE_RX)
     try:
-        if data:
+        for report in (data, frame):
+            # report 2 carries the file transfer once the host requested an
+            # update, its chunks must not be read as messages
+            if not report or update_mode:
+                continue
             if last_communication == 0:
                 send_message(InMessage.status_request())
             last_communication = time.monotonic()
-            handle_received_report(data)
+            if report[0] != OutMessage.PING:
+                idle_monitor.activity(ticks_ms())
+            handle_received_report(report)
             hardware_variant.leds[0] = "green"
+    except OSError as e:
+        log_error("USB send %s", e)
+
+    if update_mode:
+        supervisor.set_next_code_file("update.py")
+        supervisor.reload()
+
 
-        if (time.monotonic() - last_communication) > COMMUNICATION_TIMEOUT:
-            hardware_variant.leds[0] = "red"
-            # hardware_variant.leds.rainbow_next()
-            hardware_variant.leds[1:11] = "black"
-            last_communication = 0
+def heartbeat_task():
+    global last_communication, host_capabilities
+    if (time.monotonic() - last_communication) > COMMUNICATION_TIMEOUT:
+        hardware_variant.leds[0] = "red"
+        animations.stop_all()
+        # only the host leds, the others show the device state
+        for led in range(1, len(hardware_variant.leds)):
+            if is_host_led(led):
+                hardware_variant.leds[led] = "black"
+        hardware_variant.leds.release()
+        last_communication = 0
+        host_capabilities = 0
 
+
+def button_task():
+    try:
+        buttons_changed = False
+        hardware_variant.read_buttons()
         for b in hardware_variant.buttons:
-            b.read()
             if b.changed_state:
-                log(f"Button {b._pin} changed")
-                send_message(InMessage.button(b))
-        combos.check()
-
+                idle_monitor.activity(ticks_ms())
+                chords.edge(b.id - 1, b.pressed, b.timestamp)
+                gestures.edge(b.id - 1, b.pressed, b.timestamp)
+                log("Button %s changed", b._pin)
+                if host_capabilities & CAPABILITY_GESTURES:
+                    # reported by on_gesture once the gesture is complete
+                    continue
+                if host_capabilities & CAPABILITY_AGGREGATED_STATUS:
+                    buttons_changed = True
+                elif host_capabilities & CAPABILITY_TIMESTAMPS:
+                    send_message(InMessage.button_extended(b, ticks_ms()))
+                else:
+                    send_message(InMessage.button(b))
+        if buttons_changed:
+            send_message(InMessage.buttons(hardware_variant.buttons))
+        now = ticks_ms()
+        chords.check(now)
+        gestures.check(now)
     except OSError as e:
-        log_error(f"USB send {e}")
+        log_error("USB send %s", e)
+
+
+def animation_task():
+    animations.step(ticks_ms())
 
+
+def led_task():
+    hardware_variant.leds.show()
+
+
+def bluetooth_task():
     hardware_variant.check_bluetooth()
 
-    if update_mode:
-        supervisor.set_next_code_file("update.py")
-        supervisor.reload()
+
+def log_task():
+    # keep the link free for HID reports while something is going on
+    if idle_monitor.quiet_ms(ticks_ms()) >= LOG_IDLE_MS:
+        flush_log()
+
+
+def power_task():
+    idle_monitor.check(ticks_ms())
+
+
+scheduler = Scheduler(loop_stats)
+idle_monitor = IdleMonitor(
+    scheduler,
+    IDLE_AFTER_MS,
+    enabled=hardware_variant.has_bluetooth,
+)
+idle_monitor.add(
+    scheduler.add("buttons", button_task, BUTTON_INTERVAL_MS, 3, PHASE_BUTTONS),
+    IDLE_BUTTON_INTERVAL_MS,
+)
+idle_monitor.add(
+    scheduler.add("receive", receive_task, RECEIVE_INTERVAL_MS, 2, PHASE_DISPATCH),
+    IDLE_RECEIVE_INTERVAL_MS,
+)
+scheduler.add("heartbeat", heartbeat_task, HEARTBEAT_INTERVAL_MS, 1, PHASE_DISPATCH)
+idle_monitor.add(
+    scheduler.add(
+        "animation",
+        animation_task,
+        ANIMATION_INTERVAL_MS,
+        1,
+        PHASE_LEDS,
+    ),
+    IDLE_LED_INTERVAL_MS,
+)
+idle_monitor.add(
+    scheduler.add("leds", led_task, LED_INTERVAL_MS, 1, PHASE_LEDS),
+    IDLE_LED_INTERVAL_MS,
+)
+scheduler.add("bluetooth", bluetooth_task, BLUETOOTH_INTERVAL_MS, 0, PHASE_BLE)
+scheduler.add("log", log_task, LOG_FLUSH_INTERVAL_MS, 0, PHASE_BLE)
+scheduler.add("power", power_task, POWER_INTERVAL_MS, 0, PHASE_BLE)
+
+
+def loop_once():
+    """Run all due tasks once, without sleeping."""
+    scheduler.run_once()
+
+
+def run():
+    hardware_variant.setup_bluetooth()
+    scheduler.run()
+
+
+if __name__ == "__main__":
+    run()
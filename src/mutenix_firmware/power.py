@@ -0,0 +1,56 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+"""Idle mode for the bluetooth variants."""
+
+from ticks import ticks_diff
+from ticks import ticks_ms
+
+ACTIVE = 0
+IDLE = 1
+
+
+class IdleMonitor:
+    """Slows the scheduler down after a quiet period, wakes it on activity.
+
+    Tasks are added with their idle interval, their active interval is the
+    one they were created with. activity() switches back to active mode and
+    makes all tasks due at once, so the first edge after idling is handled in
+    the next scheduler pass.
+    """
+
+    def __init__(self, scheduler, idle_after_ms, enabled=True):
+        self._scheduler = scheduler
+        self.idle_after_ms = idle_after_ms
+        self.enabled = enabled
+        self.state = ACTIVE
+        # ticks start shortly before they wrap, not at 0
+        self.last_activity = ticks_ms()
+        self._intervals = []
+
+    def add(self, task, idle_interval_ms):
+        self._intervals.append((task, task.interval_ms, idle_interval_ms))
+
+    def quiet_ms(self, now):
+        return ticks_diff(now, self.last_activity)
+
+    def activity(self, now):
+        self.last_activity = now
+        if self.state == IDLE:
+            self.state = ACTIVE
+            for task, active, _ in self._intervals:
+                task.interval_ms = active
+            self._scheduler.wake()
+
+    def check(self, now):
+        if (
+            self.enabled
+            and self.state == ACTIVE
+            and self.quiet_ms(now) >= self.idle_after_ms
+        ):
+            self.state = IDLE
+            for task, _, idle in self._intervals:
+                task.interval_ms = idle
+
+    @property
+    def idle(self):
+        return self.state == IDLE
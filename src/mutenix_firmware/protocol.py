@@ -1,5 +1,7 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+import struct
+
 import version as v
 from button import Button
 from hardware import hardware_variant
@@ -7,144 +9,456 @@ from log import log
 
 OUT_REPORT_LENGTH = 8
 
+# capabilities a host announces in the ping message
+CAPABILITY_AGGREGATED_STATUS = 0x01
+CAPABILITY_TIMESTAMPS = 0x02
+# only gestures are reported instead of every button edge
+CAPABILITY_GESTURES = 0x04
+
 
 class OutMessage:
-    """Message from the host to the device."""
+    """Message from the host to the device.
+
+    Messages wrap the whole received report, including the type byte, and
+    read their fields from it in place when accessed. Only multi byte fields
+    like colors are sliced, which gives views when the report is a memoryview.
+    Each message class has its type byte as TYPE and is listed in
+    MESSAGE_TYPES, see register_message(). LENGTH is the shortest report its
+    fields can be read from.
+    """
 
     SETCOLOR = 0x1
+    SETCOLORS = 0x2
+    GESTURE_CONFIG = 0x3
+    ANIMATE = 0x4
     PREPARE_UPDATE = 0xE0
     RESET = 0xE1
     UPDATE_CONFIG = 0xE2
     PING = 0xF0
+    STATS = 0xF1
+    TIME_SYNC = 0xF2
+
+    TYPE: int
+    LENGTH = 1
+
+    def __init__(self, data):
+        self._data = data
 
     @classmethod
     def from_buffer(cls, buffer):
-        type = buffer[0]
-        if type == cls.PING:
-            return Ping(buffer[1:OUT_REPORT_LENGTH])
-        elif type == cls.SETCOLOR:
-            return SetColor(buffer[1:OUT_REPORT_LENGTH])
-        elif type == cls.PREPARE_UPDATE:
-            return PrepareUpdate()
-        elif type == cls.RESET:
-            return Reset()
-        elif type == cls.UPDATE_CONFIG:
-            return UpdateConfig(buffer[1:OUT_REPORT_LENGTH])
-        return Unknown(buffer[0:OUT_REPORT_LENGTH])
+        return MESSAGE_TYPES.get(buffer[0], Unknown)(buffer)
 
 
 class Ping(OutMessage):
     """Ping message to signal that the host is alive."""
 
-    def __init__(self, _):
-        pass
+    TYPE = OutMessage.PING
+
+    @property
+    def capabilities(self):
+        return self._data[1] if len(self._data) > 1 else 0
+
+
+class StatsRequest(OutMessage):
+    """Request the main loop timing statistics."""
+
+    TYPE = OutMessage.STATS
+    LENGTH = 3
+    FLAG_RESET = 0x1
+
+    @property
+    def phase(self):
+        return self._data[1]
+
+    @property
+    def reset(self):
+        return self._data[2] & self.FLAG_RESET != 0
+
+
+class TimeSync(OutMessage):
+    """Request the device ticks to map them to the host clock."""
+
+    TYPE = OutMessage.TIME_SYNC
+    LENGTH = 3
+
+    @property
+    def token(self):
+        return self._data[1] | self._data[2] << 8
 
 
 class Unknown(OutMessage):
     """Unknown message."""
 
-    def __init__(self, data):
-        self._data = data
-
     @property
     def data(self):
-        return self._data
+        return self._data[0:OUT_REPORT_LENGTH]
 
 
 class SetColor(OutMessage):
     """Set the color of a led."""
 
-    def __init__(self, data):
-        self._buttonid = data[0]
-        self._color = bytearray(data[1:5])
+    TYPE = OutMessage.SETCOLOR
+    LENGTH = 6
 
     @property
     def color(self):
-        return self._color
+        return self._data[2:6]
 
     @property
     def buttonid(self):
-        return self._buttonid
+        return self._data[1]
+
+
+class SetColors(OutMessage):
+    """Set the colors of a run of leds, usually sent as 60 byte report 2.
+
+    Layout: start led, count, flags, then 4 bytes per led. With FLAG_STAGE set
+    the colors are not shown until a message without the flag arrives.
+    """
+
+    TYPE = OutMessage.SETCOLORS
+    FLAG_STAGE = 0x1
+    HEADER_LENGTH = 3
+    LENGTH = 1 + HEADER_LENGTH
+
+    @property
+    def start(self):
+        return self._data[1]
+
+    @property
+    def count(self):
+        return min(self._data[2], (len(self._data) - 1 - self.HEADER_LENGTH) // 4)
+
+    @property
+    def stage(self):
+        return self._data[3] & self.FLAG_STAGE != 0
+
+    def color(self, index):
+        offset = 1 + self.HEADER_LENGTH + 4 * index
+        return self._data[offset : offset + 4]
+
+
+class GestureConfig(OutMessage):
+    """Set the gesture tap window and hold time in ms, 0 keeps the value."""
+
+    TYPE = OutMessage.GESTURE_CONFIG
+    LENGTH = 5
+
+    @property
+    def tap_window_ms(self):
+        return self._data[1] | self._data[2] << 8
+
+    @property
+    def hold_ms(self):
+        return self._data[3] | self._data[4] << 8
+
+
+class Animate(OutMessage):
+    """Start a led effect, see animation.py, sent as 60 byte report 2.
+
+    Layout: start led, count, effect, period in ms (uint16), color1, color2
+    (4 bytes each) and the effect value.
+    """
+
+    TYPE = OutMessage.ANIMATE
+    LENGTH = 15
+
+    @property
+    def start(self):
+        return self._data[1]
+
+    @property
+    def count(self):
+        return self._data[2]
+
+    @property
+    def effect(self):
+        return self._data[3]
+
+    @property
+    def period_ms(self):
+        return self._data[4] | self._data[5] << 8
+
+    @property
+    def color1(self):
+        return self._data[6:10]
+
+    @property
+    def color2(self):
+        return self._data[10:14]
+
+    @property
+    def value(self):
+        return self._data[14]
 
 
 class PrepareUpdate(OutMessage):
     """Prepare the device for a firmware update."""
 
-    def __init__(self):
-        pass
+    TYPE = OutMessage.PREPARE_UPDATE
 
 
 class Reset(OutMessage):
     """Reset the device."""
 
-    def __init__(self):
-        pass
+    TYPE = OutMessage.RESET
 
 
 class UpdateConfig(OutMessage):
     """Set the color of a led."""
 
-    def __init__(self, data):
-        self._update_debug = data[0]
-        self._update_filesystem = data[0]
+    TYPE = OutMessage.UPDATE_CONFIG
+    LENGTH = 2
 
     @property
     def update_filesystem(self):
-        return self._update_filesystem != 0
+        return self._data[1] != 0
 
     @property
     def activate_filesystem(self):
-        return self._update_filesystem == 2
+        return self._data[1] == 2
 
     @property
     def update_debug(self):
-        return self._update_debug != 0
+        return self._data[1] != 0
 
     @property
     def activate_debug(self):
-        return self._update_debug == 2
+        return self._data[1] == 2
+
+
+MESSAGE_TYPES = {
+    message_class.TYPE: message_class
+    for message_class in (
+        Ping,
+        SetColor,
+        SetColors,
+        GestureConfig,
+        Animate,
+        PrepareUpdate,
+        Reset,
+        UpdateConfig,
+        StatsRequest,
+        TimeSync,
+    )
+}
+
+
+def register_message(message_class):
+    """Make OutMessage.from_buffer() know the message class."""
+    MESSAGE_TYPES[message_class.TYPE] = message_class
+    return message_class
+
+
+class Dispatcher:
+    """Calls the handler registered for the type byte of a received report.
+
+    Every registered type has one message instance which is pointed at the
+    report before its handler is called, so dispatching allocates nothing.
+    Handlers must not keep the message after returning. Reports without
+    handler are passed as they are to the unknown handler, if any. Reports
+    shorter than the LENGTH of their message are dropped.
+    """
+
+    def __init__(self, unknown=None):
+        self._handlers = {}
+        self._unknown = unknown
+
+    def register(self, message_class, handler):
+        register_message(message_class)
+        self._handlers[message_class.TYPE] = (message_class(None), handler)
+
+    def dispatch(self, report):
+        entry = self._handlers.get(report[0])
+        if entry is None:
+            if self._unknown is not None:
+                self._unknown(report)
+            return False
+        message = entry[0]
+        if len(report) < message.LENGTH:
+            log("Report of type %d too short: %d bytes", report[0], len(report))
+            return False
+        message._data = report
+        entry[1](message)
+        message._data = None
+        return True
 
 
 class InMessage:
-    """Message from the device to the host."""
+    """Message from the device to the host.
+
+    The factory methods encode into one preallocated message per type with
+    struct.pack_into, so sending does not allocate. The returned message is
+    only valid until the next message of the same type is created. They are
+    static methods, calling a classmethod through the class allocates a bound
+    method on CPython.
+    """
 
     INITIALIZE = 0x99
     STATUS = 0x1
     STATUS_REQUEST = 0x2
-
-    def __init__(self, data):
-        self._data = bytearray(data + [0] * (OUT_REPORT_LENGTH - len(data)))
-
-    @classmethod
-    def initialize(cls):
-        return cls(
-            [
-                cls.INITIALIZE,
-                v.MAJOR,
-                v.MINOR,
-                v.PATCH,
-                hardware_variant.hardware_variant,
-            ],
+    STATUS_ALL = 0x3
+    STATUS_EXTENDED = 0x4
+    CHORD = 0x5
+    GESTURE = 0x6
+    TIME_SYNC = 0x98
+
+    _messages: dict = {}
+
+    def __init__(self, data=None):
+        if data is None:
+            self._data = bytearray(OUT_REPORT_LENGTH)
+        else:
+            self._data = bytearray(data + [0] * (OUT_REPORT_LENGTH - len(data)))
+
+    @staticmethod
+    def _reused(type):
+        message = InMessage._messages.get(type)
+        if message is None:
+            message = InMessage()
+            InMessage._messages[type] = message
+        return message
+
+    @staticmethod
+    def initialize():
+        message = InMessage._reused(InMessage.INITIALIZE)
+        struct.pack_into(
+            "<BBBBB",
+            message._data,
+            0,
+            InMessage.INITIALIZE,
+            v.MAJOR,
+            v.MINOR,
+            v.PATCH,
+            hardware_variant.hardware_variant,
         )
-
-    @classmethod
-    def button(cls, button: Button):
-        return cls(
-            [
-                cls.STATUS,
-                button.id,
-                button.triggered,
-                button.longpressed,
-                button.pressed,
-                button.released,
-                button.counter,
-            ],
+        return message
+
+    @staticmethod
+    def button(button: Button):
+        message = InMessage._reused(InMessage.STATUS)
+        struct.pack_into(
+            "<BBBBBBB",
+            message._data,
+            0,
+            InMessage.STATUS,
+            button.id,
+            button.triggered,
+            button.longpressed,
+            button.pressed,
+            button.released,
+            button.counter & 0xFF,
+        )
+        return message
+
+    @staticmethod
+    def buttons(buttons):
+        """Status of all buttons in one report.
+
+        The 7 bytes after the type are a little endian bitfield: pressed mask
+        (bits 0-9), triggered mask (bits 10-19), longpressed mask (bits 20-29)
+        and the lowest two bits of each button counter (bits 30-49).
+        """
+        pressed = 0
+        triggered = 0
+        longpressed = 0
+        counters = 0
+        for i, button in enumerate(buttons):
+            if button.pressed:
+                pressed |= 1 << i
+            if button.triggered:
+                triggered |= 1 << i
+            if button.longpressed:
+                longpressed |= 1 << i
+            counters |= (button.counter & 0x3) << (2 * i)
+        message = InMessage._reused(InMessage.STATUS_ALL)
+        # packed as 16 bit words to stay within small ints on the microcontroller
+        struct.pack_into(
+            "<BHHHB",
+            message._data,
+            0,
+            InMessage.STATUS_ALL,
+            pressed | (triggered & 0x3F) << 10,
+            triggered >> 6 | longpressed << 4 | (counters & 0x3) << 14,
+            (counters >> 2) & 0xFFFF,
+            counters >> 18,
+        )
+        return message
+
+    @staticmethod
+    def button_extended(button: Button, now: int):
+        """Button status with the ticks of the edge and of sending.
+
+        Both ticks are the lowest 16 bits of supervisor.ticks_ms(), the host
+        restores the upper bits from the last time sync.
+        """
+        flags = (
+            button.triggered
+            | button.longpressed << 1
+            | button.pressed << 2
+            | button.released << 3
+        )
+        message = InMessage._reused(InMessage.STATUS_EXTENDED)
+        struct.pack_into(
+            "<BBBBHH",
+            message._data,
+            0,
+            InMessage.STATUS_EXTENDED,
+            button.id,
+            flags,
+            button.counter & 0xFF,
+            button.timestamp & 0xFFFF,
+            now & 0xFFFF,
         )
+        return message
+
+    @staticmethod
+    def chord(chord_id: int, pressed: int):
+        """A chord configured to send a report was held, pressed is the mask."""
+        message = InMessage._reused(InMessage.CHORD)
+        struct.pack_into(
+            "<BBH",
+            message._data,
+            0,
+            InMessage.CHORD,
+            chord_id,
+            pressed,
+        )
+        return message
+
+    @staticmethod
+    def gesture(button_id: int, gesture: int, taps: int, start: int, now: int):
+        """A completed gesture, see gestures.py.
+
+        start are the ticks of the first press of the gesture, both ticks are
+        the lowest 16 bits like in button_extended().
+        """
+        message = InMessage._reused(InMessage.GESTURE)
+        struct.pack_into(
+            "<BBBBHH",
+            message._data,
+            0,
+            InMessage.GESTURE,
+            button_id,
+            gesture,
+            taps,
+            start & 0xFFFF,
+            now & 0xFFFF,
+        )
+        return message
 
-    @classmethod
-    def status_request(cls):
-        return cls([cls.STATUS_REQUEST])
+    @staticmethod
+    def time_sync(token: int, now: int):
+        message = InMessage._reused(InMessage.TIME_SYNC)
+        struct.pack_into("<BHI", message._data, 0, InMessage.TIME_SYNC, token, now)
+        return message
+
+    @staticmethod
+    def status_request():
+        message = InMessage._reused(InMessage.STATUS_REQUEST)
+        message._data[0] = InMessage.STATUS_REQUEST
+        return message
 
     def send(self, device):
-        log(f"Sending {len(self._data)} bytes: {self._data}")
+        log("Sending %d bytes: %s", len(self._data), self._data)
         device.send_report(self._data, 1)
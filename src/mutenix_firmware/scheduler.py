@@ -0,0 +1,97 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+"""Cooperative scheduler for the main loop.
+
+Tasks are plain functions run at their own interval. Between tasks the
+highest priority task runs again when it is due, so a slow low priority task
+delays button handling by at most its own duration. Between passes the
+scheduler sleeps until the next task is due, which lets the microcontroller
+idle instead of spinning.
+"""
+
+import time
+
+from ticks import ticks_add
+from ticks import ticks_diff
+from ticks import ticks_ms
+
+# never sleep longer than this, keeps the loop responsive if intervals change
+MAX_SLEEP_MS = 100
+
+
+class Task:
+    def __init__(self, name, function, interval_ms, priority=0, phase=None):
+        self.name = name
+        self.function = function
+        self.interval_ms = interval_ms
+        self.priority = priority
+        # loop stats phase the task is accounted to
+        self.phase = phase
+        self.next_run = None
+
+    def due(self, now):
+        return self.next_run is None or ticks_diff(now, self.next_run) >= 0
+
+
+class Scheduler:
+    def __init__(self, stats=None):
+        self.tasks = []
+        self._stats = stats
+
+    def add(self, name, function, interval_ms, priority=0, phase=None):
+        task = Task(name, function, interval_ms, priority, phase)
+        self.tasks.append(task)
+        self.tasks.sort(key=lambda t: -t.priority)
+        return task
+
+    def wake(self, task=None):
+        """Make the task, or all tasks, due immediately."""
+        for t in self.tasks:
+            if task is None or t is task:
+                t.next_run = None
+
+    def _run(self, task, now):
+        task.next_run = ticks_add(now, task.interval_ms)
+        task.function()
+        if self._stats is not None and task.phase is not None:
+            self._stats.mark(task.phase)
+
+    def run_once(self, now=None):
+        """Run every due task once by priority, returns the number run.
+
+        Before each task the highest priority task gets another turn if it
+        became due meanwhile. With now given, the whole pass uses that time.
+        """
+        if self._stats is not None:
+            self._stats.begin()
+        fixed = now is not None
+        first = self.tasks[0] if self.tasks else None
+        count = 0
+        for task in self.tasks:
+            if not fixed:
+                now = ticks_ms()
+            if count and task is not first and first.due(now):
+                self._run(first, now)
+                count += 1
+            if task.due(now):
+                self._run(task, now)
+                count += 1
+        if self._stats is not None:
+            self._stats.end()
+        return count
+
+    def sleep_time(self, now):
+        """Milliseconds until the next task is due."""
+        delay = MAX_SLEEP_MS
+        for task in self.tasks:
+            if task.next_run is None:
+                return 0
+            delay = min(delay, ticks_diff(task.next_run, now))
+        return max(delay, 0)
+
+    def run(self):
+        while True:
+            self.run_once()
+            delay = self.sleep_time(ticks_ms())
+            if delay:
+                time.sleep(delay / 1000)
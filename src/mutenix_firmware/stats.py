@@ -0,0 +1,101 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+# Timing statistics of the main loop, kept in fixed size histograms
+import time
+from array import array
+
+PHASE_LOOP = 0
+PHASE_RX = 1
+PHASE_DISPATCH = 2
+PHASE_BUTTONS = 3
+PHASE_LEDS = 4
+PHASE_BLE = 5
+PHASE_COUNT = 6
+PHASE_ALL = 0xFF
+
+# bucket i counts durations of [2**i, 2**(i+1)) us, the last bucket is open ended
+BUCKETS = 20
+REPORT_LENGTH = 36
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = array("L", [0] * BUCKETS)
+        self.reset()
+
+    def reset(self):
+        for i in range(BUCKETS):
+            self.buckets[i] = 0
+        self.count = 0
+        self.min = 0
+        self.max = 0
+
+    def add(self, value):
+        if self.count == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        bucket = 0
+        value >>= 1
+        while value and bucket < BUCKETS - 1:
+            value >>= 1
+            bucket += 1
+        self.buckets[bucket] += 1
+
+    def percentile(self, percent):
+        """Upper bound of the bucket holding the given percentile."""
+        if self.count == 0:
+            return 0
+        threshold = (self.count * percent + 99) // 100
+        seen = 0
+        for i in range(BUCKETS):
+            seen += self.buckets[i]
+            if seen >= threshold:
+                return min((2 << i) - 1, self.max)
+        return self.max
+
+
+class LoopStats:
+    """Durations of the main loop and its phases in microseconds."""
+
+    def __init__(self):
+        self.histograms = [Histogram() for _ in range(PHASE_COUNT)]
+        self._loop_start = 0
+        self._phase_start = 0
+
+    def begin(self):
+        self._loop_start = self._phase_start = time.monotonic_ns()
+
+    def mark(self, phase):
+        """Close the given phase, the next phase starts now."""
+        now = time.monotonic_ns()
+        self.histograms[phase].add((now - self._phase_start) // 1000)
+        self._phase_start = now
+
+    def end(self):
+        self.histograms[PHASE_LOOP].add(
+            (time.monotonic_ns() - self._loop_start) // 1000,
+        )
+
+    def reset(self):
+        for histogram in self.histograms:
+            histogram.reset()
+
+    def report(self, phase):
+        """Report ID 2 payload: "ST", phase, count, min, max, p50, p99."""
+        histogram = self.histograms[phase]
+        data = bytearray(REPORT_LENGTH)
+        data[0:2] = b"ST"
+        data[2] = phase
+        for i, value in enumerate(
+            (
+                histogram.count,
+                histogram.min,
+                histogram.max,
+                histogram.percentile(50),
+                histogram.percentile(99),
+            ),
+        ):
+            data[3 + 4 * i : 7 + 4 * i] = min(value, 0xFFFFFFFF).to_bytes(4, "little")
+        return data
@@ -1,5 +1,6 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+import binascii
 import os
 import time
 
@@ -8,22 +9,71 @@ import supervisor  # type: ignore
 import usb_hid  # type: ignore
 from hardware import hardware_variant
 from hardware import mix_color
+from log import flush_log
 from log import log
 
+try:
+    import zlib
+except ImportError:
+    zlib = None  # type: ignore[assignment]
+
 FILE_TRANSPORT_START = 1
 FILE_TRANSPORT_DATA = 2
 FILE_TRANSPORT_END = 3
 FILE_TRANSPORT_FINISH = 4
 FILE_TRANSPORT_DELETE = 5
+FILE_TRANSPORT_WINDOW = 6
+FILE_TRANSPORT_QUERY = 7
+FILE_TRANSPORT_RESUME = 8
 
 CHUNK_SIZE = 60
 HEADER_SIZE = 8
+REPORT_SIZE = 36
+
+# flags of the start packet
+FLAG_COMPRESSED = 0x01
+# the flags byte is followed by the crc32 (little endian) of the file content
+FLAG_CRC32 = 0x02
+
+# capabilities announced in the mode report
+CAPABILITY_WINDOW = 0x01
+CAPABILITY_COMPRESSION = 0x02
+CAPABILITY_QUERY = 0x04
+CAPABILITY_CRC32 = 0x08
+CAPABILITY_RESUME = 0x10
+
+# compressed files are received into this file and decompressed when complete
+STAGED_SUFFIX = ".z"
+
+# a selective ack consists of "SA", file id, cumulative ack, bitmap length and the bitmap
+SELECTIVE_ACK_HEADER_SIZE = 7
+MAX_WINDOW_SIZE = 8 * (REPORT_SIZE - SELECTIVE_ACK_HEADER_SIZE)
+
+# a file info consists of "FI", query id, index, exists, size, crc32 and the name length
+FILE_INFO_HEADER_SIZE = 15
+# a resume info consists of "RS", resume id, index, count, file id, packages,
+# complete and the name length
+RESUME_INFO_HEADER_SIZE = 12
+
+# link the update reports are exchanged on, sent in the mode report
+TRANSPORT_USB = 0
+TRANSPORT_BLUETOOTH = 1
+# minimum time between two notifications, about one connection interval
+BLUETOOTH_REPORT_INTERVAL = 0.0075
+
+# progress of the files being received, kept across timeouts and reloads
+JOURNAL_FILE = "/update.journal"
+# packages received per file between journal writes, limits flash wear
+JOURNAL_INTERVAL = 64
 
 TIMEOUT_TRANSFER = 30
 TIMEOUT_UPDATE = 180
 TIME_SHOW_FINAL_STATUS = 4
 TIMEOUT_TRANSFER_REQUEST = 1
 
+# number of out of order packages kept in memory before falling back to seeking
+REORDER_BUFFER_SIZE = 8
+
 
 class FileTransport:
     content_length = CHUNK_SIZE - HEADER_SIZE
@@ -37,6 +87,7 @@ class FileTransport:
         self.total_packages = int.from_bytes(data[4:6], "little")
         self.package = int.from_bytes(data[6:8], "little")
         self.content = data[8:]
+        self.data = data
 
     def is_valid(self):
         return self.type_ in [
@@ -45,12 +96,22 @@ class FileTransport:
             FILE_TRANSPORT_END,
             FILE_TRANSPORT_DELETE,
             FILE_TRANSPORT_FINISH,
+            FILE_TRANSPORT_WINDOW,
+            FILE_TRANSPORT_QUERY,
+            FILE_TRANSPORT_RESUME,
         ]
 
+    @staticmethod
+    def _decode_filename(data) -> str:
+        try:
+            return data.decode("utf-8")
+        except UnicodeError:
+            raise ValueError("Invalid filename")
+
     def _get_filename(self):
         filename_length = self.content[0]
-        filename = self.content[1 : 1 + filename_length].decode("utf-8")
-        log("Filename[", filename_length, "]:", filename)
+        filename = self._decode_filename(self.content[1 : 1 + filename_length])
+        log("Filename[%d]: %s", filename_length, filename)
         return filename_length, filename
 
     def as_start(self) -> tuple[str, int]:
@@ -64,11 +125,52 @@ class FileTransport:
         )
         return filename, total_size
 
+    def _flags_index(self) -> int:
+        if self.type_ != FILE_TRANSPORT_START:
+            raise ValueError("Not a start packet")
+        filename_length = self.content[0]
+        return 2 + filename_length + self.content[1 + filename_length]
+
+    def start_flags(self) -> int:
+        flags_index = self._flags_index()
+        if flags_index >= len(self.content):
+            return 0
+        return self.content[flags_index]
+
+    def start_crc(self) -> int | None:
+        """The crc32 of the file content, None if the host sent none."""
+        if not self.start_flags() & FLAG_CRC32:
+            return None
+        crc_index = self._flags_index() + 1
+        if crc_index + 4 > len(self.content):
+            raise ValueError("Checksum missing")
+        return int.from_bytes(self.content[crc_index : crc_index + 4], "little")
+
     def as_delete(self) -> str:
         if self.type_ != FILE_TRANSPORT_DELETE:
             raise ValueError("Not a delete packet")
         return self._get_filename()[1]
 
+    def as_window(self) -> int:
+        if self.type_ != FILE_TRANSPORT_WINDOW:
+            raise ValueError("Not a window packet")
+        return min(self.content[0], MAX_WINDOW_SIZE)
+
+    def as_query(self) -> list[str]:
+        if self.type_ != FILE_TRANSPORT_QUERY:
+            raise ValueError("Not a query packet")
+        filenames = []
+        index = 0
+        while index < len(self.content) and self.content[index]:
+            filename_length = self.content[index]
+            filenames.append(
+                self._decode_filename(
+                    self.content[index + 1 : index + 1 + filename_length],
+                ),
+            )
+            index += 1 + filename_length
+        return filenames
+
     def is_end(self):
         return self.type_ == FILE_TRANSPORT_END
 
@@ -84,58 +186,403 @@ class FileTransport:
     def is_data(self):
         return self.type_ == FILE_TRANSPORT_DATA
 
+    def is_window(self):
+        return self.type_ == FILE_TRANSPORT_WINDOW
+
+    def is_query(self):
+        return self.type_ == FILE_TRANSPORT_QUERY
+
+    def is_resume(self):
+        return self.type_ == FILE_TRANSPORT_RESUME
+
 
 class File:
     def __init__(self, first_element: FileTransport):
         if not first_element.is_start():
             raise ValueError("First element must be start")
         self.filename, self.total_size = first_element.as_start()
+        self.start_data = bytes(first_element.data)
+        self.compressed = bool(first_element.start_flags() & FLAG_COMPRESSED)
+        if self.compressed and zlib is None:
+            raise ValueError("Compression not supported")
+        # running crc32 of the content written so far, see verified()
+        self.expected_crc = first_element.start_crc()
+        self.crc = 0
+        # the crc needs the content in order, of compressed files it is
+        # computed when they are decompressed
+        self._sequential = self.expected_crc is not None and not self.compressed
+        self._broken = False
         self.remaining = self.total_size
         self.id = first_element.id
-        self.packages = list(range(first_element.total_packages))
+        self.total_packages = first_element.total_packages
+        # one bit per package, set once the package has been received
+        self._received = bytearray((self.total_packages + 7) // 8)
+        self.missing = self.total_packages
+        self._first_missing = 0
+        self.unacknowledged = 0
+        # next package to be appended and packages waiting for the gap before them
+        self._next = 0
+        self._pending: dict[int, bytes] = {}
+        self._position = 0
         self._file = None  # type: ignore  # noqa
+        # restored from the journal, the file on flash is continued
+        self.resumed = False
+        self.unjournaled = 0
 
     def write(self, data: FileTransport):
         if not data.is_data():
             log("Not a data packet")
             return
-        if self._file is None:
-            self._file = open(self.filename, "wb")  # type: ignore  # noqa
-        if data.package == data.total_packages - 1:
-            length = self.remaining
-        else:
-            length = FileTransport.content_length
-        if data.package not in self.packages:
+        if data.package >= self.total_packages:
+            log("Package out of range")
+            return
+        if self.is_received(data.package):
             log("Package already received")
             return
+        in_order = data.package == self._next
+        buffered = not in_order and len(self._pending) < REORDER_BUFFER_SIZE
+        if self._sequential and not (in_order or buffered):
+            # let the host resend it once the gap before it is closed
+            log("Reorder buffer full, dropping package")
+            return
+        if self._file is None:
+            mode = "r+b" if self.resumed else "wb"
+            self._file = open(self.path(), mode)  # type: ignore  # noqa
+        offset = data.package * FileTransport.content_length
+        length = min(FileTransport.content_length, self.total_size - offset)
+        content = data.content[: max(0, length)]
+
+        self.remaining -= len(content)
+        log(
+            "Writing %d bytes to %s remaining %d",
+            len(content),
+            self.filename,
+            self.remaining,
+        )
 
-        self.remaining -= length
-        log(f"Writing {length} bytes to {self.filename} remaining {self.remaining}")
-
-        self._file.write(data.content[:length])  # type: ignore  # noqa
-        self.packages.remove(data.package)
+        if in_order:
+            self._write_at(offset, content)
+            self._next += 1
+            self._drain()
+        elif buffered:
+            self._pending[data.package] = bytes(content)
+        else:
+            self._write_at(offset, content)
+        self._mark_received(data.package)
+        self.unacknowledged += 1
+        self.unjournaled += 1
         if self.is_complete():
+            if self.resumed:
+                self._check_size()
+            self.close()
+            if self.compressed:
+                self._decompress()
+
+    def _drain(self):
+        while self._next < self.total_packages and self.is_received(self._next):
+            content = self._pending.pop(self._next, None)
+            if content is not None:
+                self._write_at(self._next * FileTransport.content_length, content)
+            self._next += 1
+
+    def _write_at(self, offset, content):
+        if offset != self._position:
+            self._file.seek(offset)  # type: ignore  # noqa
+        self._write_content(content)
+        self._position = offset + len(content)
+
+    def _write_content(self, content):
+        self._file.write(content)  # type: ignore  # noqa
+        if self._sequential:
+            self.crc = binascii.crc32(content, self.crc)
+
+    def _check_size(self):
+        # files have no truncate(), content beyond the size was not written
+        # by this transfer
+        size = self._file.seek(0, 2)  # type: ignore  # noqa
+        if size > self.total_size:
+            log("%s is %d bytes, expected %d", self.filename, size, self.total_size)
+            self._broken = True
+
+    def path(self):
+        """The file holding the received content on flash."""
+        if self.compressed and not self.is_complete():
+            return self.filename + STAGED_SUFFIX
+        return self.filename
+
+    def _decompress(self):
+        """Replace the staged compressed file by its content.
+
+        CircuitPython only offers zlib.decompress(), so the file is
+        decompressed as a whole and has to fit into memory twice.
+        """
+        staged = self.filename + STAGED_SUFFIX
+        try:
+            with open(staged, "rb") as f:
+                content = zlib.decompress(f.read())
+            with open(self.filename, "wb") as f:
+                f.write(content)
+            self.crc = binascii.crc32(content)
+            log("Decompressed %s to %d bytes", staged, len(content))
+        except Exception as e:
+            log("Cannot decompress %s: %s", staged, e)
+            self._broken = True
+        try:
+            os.unlink(staged)
+        except OSError:
+            pass
+
+    def journal_entry(self):
+        """Start packet, crc, next package and bitmap of the packages on flash."""
+        if self._file is not None:
+            self._file.flush()  # type: ignore  # noqa
+        written = bytearray(self._received)
+        for package in self._pending:
+            written[package >> 3] &= ~(1 << (package & 7)) & 0xFF
+        return (
+            len(self.start_data).to_bytes(1, "little")
+            + self.start_data
+            + self.crc.to_bytes(4, "little")
+            + self._next.to_bytes(2, "little")
+            + written
+        )
+
+    @staticmethod
+    def from_journal(entry):
+        start_length = entry[0]
+        file = File(FileTransport(entry[1 : 1 + start_length]))
+        offset = 1 + start_length
+        bitmap = entry[offset + 6 :]
+        if len(bitmap) != len(file._received):
+            raise ValueError("Journal entry does not match file")
+        file._received[:] = bitmap
+        file.missing = file.total_packages
+        for package in range(file.total_packages):
+            if file.is_received(package):
+                file.missing -= 1
+        file.crc = int.from_bytes(entry[offset : offset + 4], "little")
+        file._next = int.from_bytes(entry[offset + 4 : offset + 6], "little")
+        file.remaining = max(
+            0,
+            file.total_size
+            - (file.total_packages - file.missing) * FileTransport.content_length,
+        )
+        # unknown file position, the next write seeks
+        file._position = -1
+        # without packages on flash the file is written from scratch, an old
+        # copy of it must not keep its content
+        file.resumed = file.missing < file.total_packages
+        return file
+
+    def close(self):
+        if self._file is not None:
             self._file.close()  # type: ignore  # noqa
+            self._file = None
+
+    def verified(self):
+        """False if the complete file does not match the crc of the host."""
+        if self._broken:
+            return False
+        return self.expected_crc is None or self.crc == self.expected_crc
+
+    def is_received(self, package):
+        return self._received[package >> 3] & (1 << (package & 7)) != 0
+
+    def _mark_received(self, package):
+        self._received[package >> 3] |= 1 << (package & 7)
+        self.missing -= 1
 
     def is_complete(self):
-        return len(self.packages) == 0
+        return self.missing == 0
+
+    def first_missing(self):
+        # packages below the cursor never become missing again, so advancing
+        # it is amortised O(1) over the whole transfer
+        while self._first_missing < self.total_packages and self.is_received(
+            self._first_missing,
+        ):
+            self._first_missing += 1
+        return self._first_missing
+
+    def received_bitmap(self, start, count):
+        bitmap = bytearray((count + 7) // 8)
+        for i in range(min(count, self.total_packages - start)):
+            if self.is_received(start + i):
+                bitmap[i >> 3] |= 1 << (i & 7)
+        return bitmap
 
     def __str__(self):
-        return f"File: {self.filename}, Size: {self.total_size}, Missing: {len(self.packages)}"
+        return (
+            f"File: {self.filename}, Size: {self.total_size}, Missing: {self.missing}"
+        )
+
+
+def file_checksum(filename):
+    """Return size and crc32 of a file, or None if it does not exist."""
+    size = 0
+    crc = 0
+    buffer = bytearray(256)
+    view = memoryview(buffer)
+    try:
+        with open(filename, "rb") as f:
+            while True:
+                length = f.readinto(buffer)
+                if not length:
+                    break
+                crc = binascii.crc32(view[:length], crc)
+                size += length
+    except OSError:
+        return None
+    return size, crc
+
+
+def exists(filename):
+    try:
+        os.stat(filename)
+        return True
+    except OSError:
+        return False
+
+
+def write_journal(files):
+    """Store the progress of the files, so an update can be resumed."""
+    with open(JOURNAL_FILE, "wb") as journal:
+        for file in files:
+            entry = file.journal_entry()
+            journal.write(len(entry).to_bytes(2, "little"))
+            journal.write(entry)
+            file.unjournaled = 0
+
+
+def read_journal():
+    """Files restored from the journal by id, empty if there is none.
+
+    A journal cut short by a reset is ignored as a whole.
+    """
+    files = {}
+    if not exists(JOURNAL_FILE):
+        return files
+    try:
+        with open(JOURNAL_FILE, "rb") as journal:
+            data = journal.read()
+        offset = 0
+        while offset < len(data):
+            length = int.from_bytes(data[offset : offset + 2], "little")
+            offset += 2
+            if offset + length > len(data):
+                raise ValueError("Journal truncated")
+            file = File.from_journal(data[offset : offset + length])
+            files[file.id] = file
+            offset += length
+    except (OSError, ValueError, IndexError) as e:
+        log("Journal not usable %s", e)
+        return {}
+    return files
+
+
+def remove_journal():
+    if exists(JOURNAL_FILE):
+        os.unlink(JOURNAL_FILE)
+
+
+class BluetoothTransport:
+    """Update reports over the report 2 endpoints of the bluetooth hid service.
+
+    Offers the part of the usb_hid device interface used by the update.
+    Reports are sent at most once per BLUETOOTH_REPORT_INTERVAL, so the
+    notification queue of the radio does not overflow.
+    """
+
+    def __init__(self, hardware, interval=BLUETOOTH_REPORT_INTERVAL):
+        self._hardware = hardware
+        self._interval = interval
+        self._last_send = None
+
+    @property
+    def connected(self):
+        return self._hardware.bluetooth_connected
+
+    def get_last_received_report(self, report_id=2):
+        # keeps advertising until the host reconnects after the reload
+        self._hardware.check_bluetooth()
+        if not self.connected:
+            return None
+        return self._hardware.read_bluetooth_update()
+
+    def send_report(self, data, report_id=2):
+        if not self.connected:
+            return
+        if self._last_send is not None:
+            delay = self._last_send + self._interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self._hardware.send_bluetooth_update(data)
+        self._last_send = time.monotonic()
+
+
+class UpdateTransport:
+    """Receives update reports over usb and bluetooth, if available.
+
+    Replies go to the link the last report came from, usb until then.
+    Replies that cannot be sent are dropped.
+    """
+
+    def __init__(self, usb, bluetooth=None):
+        self._usb = usb
+        self._bluetooth = bluetooth
+        self._current = usb
+        self._bluetooth_connected = False
+
+    @property
+    def kind(self):
+        if self._current is self._bluetooth:
+            return TRANSPORT_BLUETOOTH
+        return TRANSPORT_USB
+
+    def bluetooth_connected(self):
+        """True once after the bluetooth host (re)connected."""
+        if self._bluetooth is None:
+            return False
+        connected = self._bluetooth.connected
+        changed = connected and not self._bluetooth_connected
+        self._bluetooth_connected = connected
+        if changed:
+            self._current = self._bluetooth
+        return changed
+
+    def get_last_received_report(self, report_id=2):
+        if self._bluetooth is not None:
+            data = self._bluetooth.get_last_received_report(report_id)
+            if data:
+                self._current = self._bluetooth
+                return data
+        data = self._usb.get_last_received_report(report_id)
+        if data:
+            self._current = self._usb
+        return data
+
+    def send_report(self, data, report_id=2):
+        if self._current is self._usb and not supervisor.runtime.usb_connected:
+            return
+        try:
+            self._current.send_report(data, report_id)
+        except OSError as e:
+            # the update has to end with a reload, even if the host is gone
+            log("Cannot send report %s", e)
 
 
-def send_report(macropad, data: bytearray):
+def send_report(transport, data: bytearray):
     data = data + b"\0" * (36 - len(data))
-    log("Send Report: ", data)
-    macropad.send_report(
+    log("Send Report: %s", data)
+    transport.send_report(
         data,
         2,
     )
 
 
-def confirm_chunk(macropad, filetransport: FileTransport):
+def confirm_chunk(transport, filetransport: FileTransport):
     send_report(
-        macropad,
+        transport,
         (
             bytearray("AK", "utf-8")
             + filetransport.id.to_bytes(2, "little")
@@ -145,16 +592,114 @@ def confirm_chunk(macropad, filetransport: FileTransport):
     )
 
 
-def notify_error(macropad, info: str):
+def send_selective_ack(transport, file: File):
+    cumulative = file.first_missing()
+    bitmap = file.received_bitmap(cumulative, MAX_WINDOW_SIZE)
+    send_report(
+        transport,
+        (
+            bytearray("SA", "utf-8")
+            + file.id.to_bytes(2, "little")
+            + cumulative.to_bytes(2, "little")
+            + len(bitmap).to_bytes(1, "little")
+            + bitmap
+        ),
+    )
+    file.unacknowledged = 0
+
+
+def send_file_info(transport, query_id: int, index: int, filename: str):
+    info = file_checksum(filename)
+    size, crc = info if info else (0, 0)
+    name = filename.encode()[: REPORT_SIZE - FILE_INFO_HEADER_SIZE]
+    send_report(
+        transport,
+        (
+            bytearray("FI", "utf-8")
+            + query_id.to_bytes(2, "little")
+            + index.to_bytes(1, "little")
+            + (1 if info else 0).to_bytes(1, "little")
+            + size.to_bytes(4, "little")
+            + crc.to_bytes(4, "little")
+            + len(name).to_bytes(1, "little")
+            + name
+        ),
+    )
+
+
+def send_resume_info(transport, resume_id: int, files):
+    """Describe every known file, each followed by a selective ack."""
+    count = len(files)
+    for index, file in enumerate(files):
+        name = file.filename.encode()[: REPORT_SIZE - RESUME_INFO_HEADER_SIZE]
+        send_report(
+            transport,
+            (
+                bytearray("RS", "utf-8")
+                + resume_id.to_bytes(2, "little")
+                + index.to_bytes(1, "little")
+                + count.to_bytes(1, "little")
+                + file.id.to_bytes(2, "little")
+                + file.total_packages.to_bytes(2, "little")
+                + (1 if file.is_complete() else 0).to_bytes(1, "little")
+                + len(name).to_bytes(1, "little")
+                + name
+            ),
+        )
+        send_selective_ack(transport, file)
+    if not count:
+        send_report(
+            transport,
+            bytearray("RS", "utf-8") + resume_id.to_bytes(2, "little") + b"\0\0",
+        )
+
+
+def notify_error(transport, info: str):
     info_bytes = info.encode()[:33]
     send_report(
-        macropad,
+        transport,
         (bytearray("ER", "utf-8") + len(info_bytes).to_bytes(1, "little") + info_bytes),
     )
 
 
-def send_mode(macropad):
-    send_report(macropad, bytearray("MO", "utf-8") + (1).to_bytes(1, "little"))
+def check_file(transport, file: File, corrupt: set):
+    """Check a file once it is complete, returns False if it is corrupt.
+
+    Corrupt files are tracked in corrupt and reported to the host. A corrupt
+    protected file is removed, so it is never renamed over the original.
+    Sending the file again replaces it.
+    """
+    if not file.is_complete():
+        return True
+    if file.verified():
+        corrupt.discard(file.filename)
+        return True
+    log("Checksum mismatch %s", file.filename)
+    corrupt.add(file.filename)
+    notify_error(transport, f"crc {file.filename}")
+    if file.filename.endswith(".tmp"):
+        try:
+            os.unlink(file.filename)
+        except OSError:
+            pass
+    return False
+
+
+def capabilities():
+    result = CAPABILITY_WINDOW | CAPABILITY_QUERY | CAPABILITY_CRC32 | CAPABILITY_RESUME
+    if zlib is not None:
+        result |= CAPABILITY_COMPRESSION
+    return result
+
+
+def send_mode(transport: UpdateTransport):
+    send_report(
+        transport,
+        bytearray("MO", "utf-8")
+        + (1).to_bytes(1, "little")
+        + capabilities().to_bytes(1, "little")
+        + transport.kind.to_bytes(1, "little"),
+    )
 
 
 class LedStatus:
@@ -162,17 +707,25 @@ class LedStatus:
         self.led = led
         self.led_status = 0
         self.counter = 0
+        self._color = bytearray(4)
 
     def update(self):
         self.led_status = (self.led_status + 1) % 100
+        step = self.led_status // 10
         for i in range(1, len(self.led)):
-            if self.led_status // 10 in [(i - 1), (i - 1 + 5)]:
-                color1, color2 = (
-                    ("blue", "green")
-                    if self.led_status // 10 == (i - 1)
-                    else ("green", "blue")
-                )
-                self.led[i] = mix_color(color1, color2, self.led_status % 10, 10)
+            if step == i - 1:
+                color1, color2 = "blue", "green"
+            elif step == i + 4:
+                color1, color2 = "green", "blue"
+            else:
+                continue
+            self.led[i] = mix_color(
+                color1,
+                color2,
+                self.led_status % 10,
+                10,
+                self._color,
+            )
 
     def running(self):
         self.led[0] = "purple" if (self.counter // 100) % 2 == 0 else "yellow"
@@ -180,9 +733,14 @@ class LedStatus:
 
     def error(self):
         self.led.fill("red")
+        self.led.show()
 
     def success(self):
         self.led.fill("green")
+        self.led.show()
+
+    def show(self):
+        self.led.show()
 
 
 def do_update():
@@ -191,34 +749,58 @@ def do_update():
     hardware = hardware_variant
     log("Setup LEDs")
     led_status = LedStatus(hardware.leds)
-    macropad = usb_hid.devices[0]
+    bluetooth = None
+    if hardware.has_bluetooth:
+        hardware.setup_bluetooth()
+        bluetooth = BluetoothTransport(hardware)
+    transport = UpdateTransport(usb_hid.devices[0], bluetooth)
     log("Mount Storage")
     try:
         storage.remount("/", readonly=False)
     except RuntimeError:
         led_status.error()
-        notify_error(macropad, "filsystem")
+        notify_error(transport, "filsystem")
         time.sleep(TIME_SHOW_FINAL_STATUS)
         return
     log("Disable Autoreload")
     supervisor.runtime.autoreload = False
+    # progress of a timed out or interrupted update, only continued if the
+    # host asks to resume, dropped once it starts over
+    journal = read_journal()
+    for file_id, file in list(journal.items()):
+        if file.filename in special_protected_files:
+            file.filename = f"{file.filename}.tmp"
+        if file.resumed and not exists(file.path()):
+            del journal[file_id]
+    log("Journal holds %d files", len(journal))
     files = {}
+    # files that did not match their crc, the update is not activated with them
+    corrupt = set()
     last_transfer = time.monotonic()
     start_time = last_transfer
+    # 0 means stop-and-wait, every chunk is confirmed on its own
+    window = 0
+    last_ack = last_transfer
 
     invalid_data_ignore_counter = 5
 
     log("Prepared for update")
     try:
-        send_mode(macropad)
+        send_mode(transport)
     except Exception as e:
-        log(f"Failed to send mode {e}")
+        log("Failed to send mode %s", e)
     finished = False
     while True:
-        data = macropad.get_last_received_report(2)
+        if transport.bluetooth_connected():
+            log("Bluetooth connected")
+            send_mode(transport)
+        data = transport.get_last_received_report(2)
         led_status.running()
+        led_status.show()
+        if not data:
+            flush_log()
         if data:
-            log("Data received", last_transfer)
+            log("Data received %s", last_transfer)
             ft = FileTransport(data)
             if not ft.is_valid():
                 invalid_data_ignore_counter -= 1
@@ -228,16 +810,50 @@ def do_update():
                     time.sleep(TIME_SHOW_FINAL_STATUS)
                     break
                 log(
-                    f"Invalid data received {data}, ignoring it {invalid_data_ignore_counter} more times",
+                    "Invalid data received %s, ignoring it %d more times",
+                    data,
+                    invalid_data_ignore_counter,
                 )
                 continue
-            confirm_chunk(macropad, ft)
+            if not (window and ft.is_data()):
+                confirm_chunk(transport, ft)
 
             last_transfer = time.monotonic()
             led_status.update()
+            if ft.is_window():
+                window = ft.as_window()
+                log("Window size %d", window)
+                continue
+            if ft.is_query():
+                try:
+                    filenames = ft.as_query()
+                except ValueError as e:
+                    log("Cannot answer query: %s", e)
+                    notify_error(transport, str(e))
+                    continue
+                for index, filename in enumerate(filenames):
+                    send_file_info(transport, ft.id, index, filename)
+                continue
+            if ft.is_resume():
+                if journal is not None:
+                    files = journal
+                    journal = None
+                    log("Resuming %d files", len(files))
+                send_resume_info(transport, ft.id, list(files.values()))
+                continue
+            if journal is not None:
+                # a start equal to a journaled one must not reuse its progress
+                log("Journal discarded")
+                remove_journal()
+                journal = None
             if ft.is_delete():
-                filename = ft.as_delete()
-                log(f"Delete file {filename}")
+                try:
+                    filename = ft.as_delete()
+                except ValueError as e:
+                    log("Cannot delete file: %s", e)
+                    notify_error(transport, str(e))
+                    continue
+                log("Delete file %s", filename)
                 try:
                     os.unlink(filename)
                 except OSError:
@@ -248,33 +864,82 @@ def do_update():
                 finished = True
                 break
             if ft.is_end():
-                if ft.id in files:
+                if ft.id in files and files[ft.id].is_complete():
+                    # kept for the journal until the update is finished
                     log("File complete")
-                    del files[ft.id]
+                elif ft.id in files:
+                    log("File incomplete")
+                    files.pop(ft.id).close()
                 else:
                     log("File not found")
                 continue
+            if ft.is_start() and ft.id in files and files[ft.id].start_data != ft.data:
+                log("New file replaces %s", files[ft.id])
+                files.pop(ft.id).close()
             if ft.id not in files:
                 # to ensure that we do not overwrite the update file, while updating,
                 # we fake the name here
-                files[ft.id] = File(ft)
+                try:
+                    files[ft.id] = File(ft)
+                except ValueError as e:
+                    log("Cannot receive file: %s", e)
+                    notify_error(transport, str(e))
+                    continue
                 if files[ft.id].filename in special_protected_files:
                     files[ft.id].filename = f"{files[ft.id].filename}.tmp"
-                log("New file", files[ft.id])
+                log("New file %s", files[ft.id])
             else:
-                files[ft.id].write(ft)
-            log(f"{files[ft.id].filename}[{ft.id}]", ft.package, "/", ft.total_packages)
+                file = files[ft.id]
+                complete = file.is_complete()
+                file.write(ft)
+                if not (complete or check_file(transport, file, corrupt)):
+                    # the host may send the file again with the same id
+                    del files[ft.id]
+                    continue
+                if window and (file.unacknowledged >= window or file.is_complete()):
+                    send_selective_ack(transport, file)
+                    last_ack = last_transfer
+                if file.unjournaled >= JOURNAL_INTERVAL:
+                    write_journal(files.values())
+            log(
+                "%s[%d] %d / %d",
+                files[ft.id].filename,
+                ft.id,
+                ft.package,
+                ft.total_packages,
+            )
+        elif (
+            window
+            and time.monotonic() - last_transfer > TIMEOUT_TRANSFER_REQUEST
+            and time.monotonic() - last_ack > TIMEOUT_TRANSFER_REQUEST
+        ):
+            # the host is waiting for us, tell it what is still missing
+            for file in files.values():
+                if file.unacknowledged or not file.is_complete():
+                    send_selective_ack(transport, file)
+            last_ack = time.monotonic()
 
         if (
             time.monotonic() - last_transfer > TIMEOUT_TRANSFER
             or time.monotonic() - start_time > TIMEOUT_UPDATE
         ):
             log("Transfer timed out")
-            notify_error(macropad, "timeout")
+            notify_error(transport, "timeout")
             led_status.error()
             time.sleep(TIME_SHOW_FINAL_STATUS)
             break
 
+    if finished and corrupt:
+        log("Corrupt files %s, update not activated", corrupt)
+        notify_error(transport, "corrupt")
+        led_status.error()
+        time.sleep(TIME_SHOW_FINAL_STATUS)
+        finished = False
+    if not finished and files:
+        # keep the progress, the host can resume after reloading the update
+        write_journal(files.values())
+        for file in files.values():
+            file.close()
     if finished:
         log("Update finished")
         for file in os.listdir("/"):
@@ -282,10 +947,12 @@ def do_update():
                 # we need to revert the update.py trick here, this is the critical part in the update and
                 # worst case these lines would brick the device (not really as you could enter the file mode)
                 os.rename(file, file[:-4])
+        remove_journal()
         led_status.success()
     supervisor.runtime.autoreload = True
     supervisor.set_next_code_file("main.py")
     supervisor.reload()
 
 
-do_update()
+if __name__ == "__main__":
+    do_update()
@@ -0,0 +1,9 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+"""Run the mutenix firmware on desktop CPython against simulated hardware."""
+
+from .scenario import Result
+from .scenario import Scenario
+from .simulator import Simulator
+
+__all__ = ["Result", "Scenario", "Simulator"]
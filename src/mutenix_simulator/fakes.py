@@ -0,0 +1,334 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+"""Desktop stand-ins for the CircuitPython modules used by the firmware.
+
+All of them are driven by a shared Clock and by the Simulator, nothing here
+touches real hardware.
+"""
+
+import types
+from collections import deque
+from unittest import mock
+
+TICKS_PERIOD = 1 << 29
+
+
+class Reload(Exception):
+    """Raised by supervisor.reload(), the firmware would restart here."""
+
+
+class Reset(Exception):
+    """Raised by microcontroller.reset()."""
+
+
+class Clock:
+    """Virtual time in nanoseconds, advanced explicitly by the simulator.
+
+    The clock starts at boot_ms like a board that just finished booting, the
+    firmware treats a monotonic time of 0 as "never".
+    """
+
+    def __init__(self, boot_ms=1000):
+        self.boot_ns = boot_ms * 1_000_000
+        self.ns = self.boot_ns
+
+    def advance(self, ms):
+        self.ns += int(ms * 1_000_000)
+
+    @property
+    def ms(self):
+        """Milliseconds since the simulation started."""
+        return (self.ns - self.boot_ns) // 1_000_000
+
+    def monotonic(self):
+        return self.ns / 1e9
+
+    def monotonic_ns(self):
+        return self.ns
+
+    def sleep(self, seconds):
+        self.ns += int(seconds * 1e9)
+
+    def ticks_ms(self):
+        return (self.ns // 1_000_000) % TICKS_PERIOD
+
+
+class Pin:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"board.{self.name}"
+
+
+class Pins:
+    """Logic levels of all pins, inputs are pulled up by default."""
+
+    def __init__(self):
+        self.levels = {}
+
+    def level(self, pin):
+        return self.levels.get(pin, True)
+
+    def set(self, pin, value):
+        self.levels[pin] = value
+
+
+def make_module(name, **attributes):
+    """A module with the given attributes, stands in for a CircuitPython one."""
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+
+def make_board(board_id):
+    board = make_module("board", board_id=board_id)
+    for name in [f"GP{i}" for i in range(30)] + [
+        f"P{port}_{pin:02d}" for port in (0, 1) for pin in range(32)
+    ]:
+        setattr(board, name, Pin(name))
+    return board
+
+
+def make_digitalio(pins: Pins):
+    class Direction:
+        INPUT = "input"
+        OUTPUT = "output"
+
+    class Pull:
+        UP = "up"
+        DOWN = "down"
+
+    class DigitalInOut:
+        def __init__(self, pin):
+            self.pin = pin
+            self.direction = Direction.INPUT
+            self.pull = None
+
+        @property
+        def value(self):
+            return pins.level(self.pin)
+
+        @value.setter
+        def value(self, value):
+            pins.set(self.pin, value)
+
+    return make_module(
+        "digitalio",
+        Direction=Direction,
+        Pull=Pull,
+        DigitalInOut=DigitalInOut,
+    )
+
+
+class KeyEvents:
+    def __init__(self, max_events):
+        self.queue = deque()
+        self.max_events = max_events
+        self.overflowed = False
+
+    def put(self, key_number, pressed, timestamp):
+        if len(self.queue) >= self.max_events:
+            self.overflowed = True
+            return
+        self.queue.append((key_number, pressed, timestamp))
+
+    def get_into(self, event):
+        if not self.queue:
+            return False
+        event.key_number, event.pressed, event.timestamp = self.queue.popleft()
+        return True
+
+    def clear(self):
+        self.queue.clear()
+        self.overflowed = False
+
+    def __len__(self):
+        return len(self.queue)
+
+
+def make_keypad(pins: Pins, clock: Clock, scanners: list):
+    class Event:
+        def __init__(self, key_number=0, pressed=True):
+            self.key_number = key_number
+            self.pressed = pressed
+            self.timestamp = 0
+
+    class Keys:
+        def __init__(
+            self,
+            pins_,
+            *,
+            value_when_pressed,
+            pull=True,
+            interval=0.02,
+            max_events=64,
+        ):
+            self.pins = list(pins_)
+            self.value_when_pressed = value_when_pressed
+            self.interval = interval
+            self.events = KeyEvents(max_events)
+            self._pressed = [False] * len(self.pins)
+            scanners.append(self)
+
+        def scan(self):
+            """Called by the simulator, stands in for the background scan."""
+            for i, pin in enumerate(self.pins):
+                pressed = pins.level(pin) == self.value_when_pressed
+                if pressed != self._pressed[i]:
+                    self._pressed[i] = pressed
+                    self.events.put(i, pressed, clock.ticks_ms())
+
+        def reset(self):
+            self._pressed = [False] * len(self.pins)
+
+        @property
+        def key_count(self):
+            return len(self.pins)
+
+    return make_module("keypad", Event=Event, Keys=Keys)
+
+
+class HIDDevice:
+    """A usb_hid device as seen from the firmware, the host side is the simulator."""
+
+    def __init__(self):
+        self.received = {}
+        self.sent = []
+
+    def get_last_received_report(self, report_id):
+        return self.received.pop(report_id, None)
+
+    def send_report(self, data, report_id=None):
+        self.sent.append((report_id, bytes(data)))
+
+
+def make_usb_hid(device: HIDDevice):
+    class Device:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+
+    return make_module(
+        "usb_hid",
+        Device=Device,
+        devices=[device],
+        enable=lambda devices: None,
+    )
+
+
+class NeopixelWrites:
+    def __init__(self):
+        self.count = 0
+        self.frame = b""
+
+    def __call__(self, pin, buffer):
+        self.count += 1
+        self.frame = bytes(buffer)
+
+
+def make_neopixel_write(writes: NeopixelWrites):
+    return make_module("neopixel_write", neopixel_write=writes)
+
+
+def make_supervisor(clock: Clock):
+    state = types.SimpleNamespace(next_code_file=None)
+
+    def set_next_code_file(filename, **kwargs):
+        state.next_code_file = filename
+
+    def reload():
+        raise Reload(state.next_code_file)
+
+    return make_module(
+        "supervisor",
+        runtime=types.SimpleNamespace(usb_connected=True, autoreload=True),
+        ticks_ms=clock.ticks_ms,
+        set_next_code_file=set_next_code_file,
+        reload=reload,
+    )
+
+
+def make_microcontroller():
+    def reset():
+        raise Reset()
+
+    return make_module("microcontroller", reset=reset)
+
+
+def make_storage():
+    return make_module(
+        "storage",
+        remount=lambda *args, **kwargs: None,
+        disable_usb_drive=lambda: None,
+    )
+
+
+class ReportIn:
+    def __init__(self, report_id):
+        self._report_id = report_id
+        self.sent = []
+
+    def send_report(self, data):
+        self.sent.append(bytes(data))
+
+
+class Characteristic:
+    """Bytes written by the host and not yet read."""
+
+    def __init__(self):
+        self.written = bytearray()
+
+
+class CharacteristicBuffer:
+    def __init__(self, characteristic, buffer_size=64):
+        self._characteristic = characteristic
+
+    @property
+    def in_waiting(self):
+        return len(self._characteristic.written)
+
+    def read(self, nbytes):
+        data = bytes(self._characteristic.written[:nbytes])
+        del self._characteristic.written[:nbytes]
+        return data
+
+
+class ReportOut:
+    def __init__(self, report_id):
+        self._report_id = report_id
+        self._characteristic = Characteristic()
+        self.report = None
+
+    def write(self, report):
+        self.report = bytes(report)
+        self._characteristic.written += self.report
+
+
+class HIDService:
+    def __init__(self, descriptor=None):
+        self.devices = [ReportIn(1), ReportOut(1), ReportIn(2), ReportOut(2)]
+
+
+def make_ble_modules():
+    """The BLE stack is stubbed, the simulator controls radio.connected."""
+    modules = {
+        name: mock.MagicMock()
+        for name in [
+            "_bleio",
+            "adafruit_ble",
+            "adafruit_ble.advertising",
+            "adafruit_ble.advertising.standard",
+            "adafruit_ble.services.standard",
+            "adafruit_ble.services.standard.device_info",
+            "adafruit_ble.services.standard.hid",
+        ]
+    }
+    modules["_bleio"].CharacteristicBuffer = CharacteristicBuffer
+    radio = modules["adafruit_ble"].BLERadio.return_value
+    radio.connected = False
+    radio.advertising = False
+    hid = modules["adafruit_ble.services.standard.hid"]
+    hid.HIDService = HIDService
+    hid.ReportIn = ReportIn
+    hid.ReportOut = ReportOut
+    return modules
@@ -0,0 +1,109 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+import time
+import tracemalloc
+
+from .simulator import Simulator
+
+
+class Result:
+    def __init__(self, name, simulator, elapsed, allocated, max_allocated=None):
+        self.name = name
+        self.iterations = simulator.iteration
+        self.elapsed = elapsed
+        self.allocated = allocated
+        self.max_allocated = max_allocated
+        self.latencies = list(simulator.latencies)
+        self.reports = {}
+        for report_id, _ in simulator.sent_reports():
+            self.reports[report_id] = self.reports.get(report_id, 0) + 1
+        self.neopixel_writes = simulator.neopixel_writes.count
+
+    @property
+    def iterations_per_second(self):
+        return self.iterations / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def max_latency(self):
+        return max(self.latencies) if self.latencies else 0
+
+    @property
+    def mean_latency(self):
+        if not self.latencies:
+            return 0.0
+        return sum(self.latencies) / len(self.latencies)
+
+    @property
+    def allocated_per_iteration(self):
+        if self.allocated is None:
+            return None
+        return self.allocated / self.iterations if self.iterations else 0.0
+
+
+class Scenario:
+    """A timed script of button edges, host reports and link changes.
+
+    Times are milliseconds of simulated time since the start of the scenario.
+    """
+
+    def __init__(self, name, duration_ms):
+        self.name = name
+        self.duration_ms = duration_ms
+        self._actions = []
+
+    def at(self, ms, action):
+        """Run action(simulator) before the loop iteration at the given time."""
+        self._actions.append((ms, len(self._actions), action))
+        return self
+
+    def press(self, ms, *buttons):
+        return self.at(ms, lambda sim: [sim.press(b) for b in buttons])
+
+    def release(self, ms, *buttons):
+        return self.at(ms, lambda sim: [sim.release(b) for b in buttons])
+
+    def tap(self, ms, button, duration_ms=50):
+        self.press(ms, button)
+        return self.release(ms + duration_ms, button)
+
+    def host(self, ms, report, report_id=1):
+        return self.at(ms, lambda sim: sim.host_report(report, report_id))
+
+    def ping_every(self, interval_ms, capabilities=0, start_ms=0):
+        report = bytes([0xF0, capabilities, 0, 0, 0, 0, 0, 0])
+        for ms in range(start_ms, self.duration_ms, interval_ms):
+            self.host(ms, report)
+        return self
+
+    def disconnect(self, ms):
+        return self.at(ms, lambda sim: sim.disconnect())
+
+    def connect(self, ms):
+        return self.at(ms, lambda sim: sim.connect())
+
+    def run(self, trace_allocations=False, **simulator_options):
+        with Simulator(**simulator_options) as simulator:
+            actions = sorted(self._actions)
+            index = 0
+            allocated = 0 if trace_allocations else None
+            max_allocated = 0 if trace_allocations else None
+            if trace_allocations:
+                tracemalloc.start()
+            start = time.perf_counter()
+            while simulator.clock.ms < self.duration_ms:
+                while index < len(actions) and actions[index][0] <= simulator.clock.ms:
+                    actions[index][2](simulator)
+                    index += 1
+                if trace_allocations:
+                    tracemalloc.reset_peak()
+                    before = tracemalloc.get_traced_memory()[0]
+                    simulator.step()
+                    peak = tracemalloc.get_traced_memory()[1] - before
+                    allocated += peak
+                    max_allocated = max(max_allocated, peak)
+                else:
+                    simulator.step()
+            elapsed = time.perf_counter() - start
+            if trace_allocations:
+                tracemalloc.stop()
+            return Result(self.name, simulator, elapsed, allocated, max_allocated)
@@ -0,0 +1,230 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+import importlib
+import os
+import sys
+import time
+import types
+from unittest import mock
+
+from . import fakes
+
+FIRMWARE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "mutenix_firmware",
+)
+
+VARIANTS = {
+    "usb5": ("waveshare_rp2040_zero", False),
+    "usb10": ("waveshare_rp2040_zero", True),
+    "bt5": ("supermini_nrf52840", False),
+    "bt10": ("supermini_nrf52840", True),
+}
+VARIANT_PINS = {
+    "waveshare_rp2040_zero": "GP29",
+    "supermini_nrf52840": "P0_17",
+}
+
+STATUS_REPORTS = (0x1, 0x3, 0x4)
+# report 2 from the host, written with its full length over BLE
+UPDATE_REPORT_LENGTH = 60
+
+
+def _firmware_modules(firmware_dir):
+    return [
+        name[:-3]
+        for name in os.listdir(firmware_dir)
+        if name.endswith(".py") and name not in ("boot.py", "code.py")
+    ]
+
+
+class Simulator:
+    """Runs the firmware main loop on CPython against simulated hardware.
+
+    Use as context manager, the fake CircuitPython modules are only installed
+    while it is active. Every step() is one main loop iteration followed by
+    advancing the virtual clock by tick_ms. firmware_dir allows running another
+    build of the firmware, e.g. a release staging directory.
+    """
+
+    def __init__(
+        self,
+        variant="usb10",
+        keypad=True,
+        tick_ms=1,
+        firmware_dir=FIRMWARE_DIR,
+    ):
+        self.firmware_dir = firmware_dir
+        self.board_id, self.ten_buttons = VARIANTS[variant]
+        self.use_keypad = keypad
+        self.tick_ms = tick_ms
+        self.clock = fakes.Clock()
+        self.pins = fakes.Pins()
+        self.device = fakes.HIDDevice()
+        self.neopixel_writes = fakes.NeopixelWrites()
+        self.scanners = []
+        self.iteration = 0
+        self.reloaded = None
+        self.reset = False
+        self.latencies = []
+        self._pending_edges = {}
+        self._patcher = None
+
+    def _modules(self):
+        modules = {
+            "board": fakes.make_board(self.board_id),
+            "digitalio": fakes.make_digitalio(self.pins),
+            "neopixel_write": fakes.make_neopixel_write(self.neopixel_writes),
+            "usb_hid": fakes.make_usb_hid(self.device),
+            "supervisor": fakes.make_supervisor(self.clock),
+            "microcontroller": fakes.make_microcontroller(),
+            "storage": fakes.make_storage(),
+        }
+        if self.use_keypad:
+            modules["keypad"] = fakes.make_keypad(self.pins, self.clock, self.scanners)
+        else:
+            modules["keypad"] = None
+        modules.update(fakes.make_ble_modules())
+        return modules
+
+    def __enter__(self):
+        modules = self._modules()
+        self.board = modules["board"]
+        self.supervisor = modules["supervisor"]
+        self.radio = modules["adafruit_ble"].BLERadio.return_value
+        self._patcher = mock.patch.dict(sys.modules, modules)
+        self._patcher.start()
+        for name in _firmware_modules(self.firmware_dir):
+            sys.modules.pop(name, None)
+        sys.path.insert(0, self.firmware_dir)
+        self.pins.set(
+            getattr(self.board, VARIANT_PINS[self.board_id]),
+            self.ten_buttons,
+        )
+        self.main = importlib.import_module("main")
+        self._use_virtual_time()
+        self.hardware = self.main.hardware_variant
+        self.hardware.setup_bluetooth()
+        self.connect()
+        return self
+
+    def __exit__(self, *exc):
+        self._patcher.stop()
+        sys.path.remove(self.firmware_dir)
+        return False
+
+    def _use_virtual_time(self):
+        virtual_time = types.SimpleNamespace(
+            monotonic=self.clock.monotonic,
+            monotonic_ns=self.clock.monotonic_ns,
+            sleep=self.clock.sleep,
+        )
+        for name in _firmware_modules(self.firmware_dir):
+            module = sys.modules.get(name)
+            if module is not None and getattr(module, "time", None) is time:
+                module.time = virtual_time
+
+    @property
+    def bluetooth(self):
+        return self.board_id == "supermini_nrf52840"
+
+    def press(self, button):
+        """Press the button with the given index (0 based)."""
+        self._set_button(button, False)
+
+    def release(self, button):
+        self._set_button(button, True)
+
+    def _set_button(self, button, level):
+        pin = self.hardware.button_pins[button]
+        if self.pins.level(pin) != level:
+            self.pins.set(pin, level)
+            self._pending_edges.setdefault(button + 1, []).append(self.iteration)
+
+    def host_report(self, report, report_id=1):
+        """Deliver a report from the host to the device."""
+        if self.bluetooth:
+            endpoint = (
+                self.hardware._hid_communication_out
+                if report_id == 1
+                else self.hardware._update_communication_out
+            )
+            if report_id == 2:
+                report = bytes(report).ljust(UPDATE_REPORT_LENGTH, b"\0")
+            endpoint.write(report)
+        else:
+            self.device.received[report_id] = bytes(report)
+
+    def connect(self):
+        if self.bluetooth:
+            self.radio.connected = True
+        else:
+            self.supervisor.runtime.usb_connected = True
+
+    def disconnect(self):
+        if self.bluetooth:
+            self.radio.connected = False
+        else:
+            self.supervisor.runtime.usb_connected = False
+
+    def sent_reports(self):
+        """All reports sent to the host as (report id, data)."""
+        if self.bluetooth:
+            return [
+                (endpoint._report_id, data)
+                for endpoint in (
+                    self.hardware._hid_communication_in,
+                    self.hardware._update_communication_in,
+                )
+                for data in endpoint.sent
+            ]
+        return list(self.device.sent)
+
+    def _sent_count(self):
+        if self.bluetooth:
+            return len(self.hardware._hid_communication_in.sent) + len(
+                self.hardware._update_communication_in.sent,
+            )
+        return len(self.device.sent)
+
+    def step(self):
+        for scanner in self.scanners:
+            scanner.scan()
+        sent = self._sent_list()
+        sent_before = len(sent)
+        try:
+            self.main.loop_once()
+        except fakes.Reload as reload:
+            self.reloaded = reload.args[0]
+        except fakes.Reset:
+            self.reset = True
+        if len(sent) > sent_before:
+            self._track_latency(sent[sent_before:])
+        self.clock.advance(self.tick_ms)
+        self.iteration += 1
+
+    def run(self, ms):
+        for _ in range(int(ms / self.tick_ms)):
+            self.step()
+
+    def _sent_list(self):
+        if self.bluetooth:
+            return self.hardware._hid_communication_in.sent
+        return self.device.sent
+
+    def _track_latency(self, reports):
+        for report in reports:
+            if isinstance(report, tuple):
+                report_id, report = report
+                if report_id != 1:
+                    continue
+            if report[0] not in STATUS_REPORTS:
+                continue
+            if report[0] == 0x3:
+                buttons = list(self._pending_edges)
+            else:
+                buttons = [report[1]]
+            for button in buttons:
+                edges = self._pending_edges.get(button)
+                if edges:
+                    self.latencies.append(self.iteration - edges.pop(0))
@@ -0,0 +1,85 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+import sys
+from unittest import mock
+
+sys.modules.setdefault("supervisor", mock.Mock())
+
+from mutenix_firmware.animation import Animations  # noqa: E402
+from mutenix_firmware.animation import BLINK  # noqa: E402
+from mutenix_firmware.animation import FADE  # noqa: E402
+from mutenix_firmware.animation import PROGRESS  # noqa: E402
+from mutenix_firmware.animation import PULSE  # noqa: E402
+from mutenix_firmware.animation import RAINBOW  # noqa: E402
+from mutenix_firmware.animation import STOP  # noqa: E402
+
+RED = bytes([200, 0, 0, 0])
+BLACK = bytes(4)
+
+
+class Leds(list):
+    def __setitem__(self, key, value):
+        super().__setitem__(key, bytes(value))
+
+
+def make_animations():
+    leds = Leds([BLACK] * 6)
+    return Animations(leds, 6), leds
+
+
+def test_blink():
+    animations, leds = make_animations()
+    animations.start(1, 2, BLINK, 1000, RED, BLACK, 0, 1000)
+    animations.step(1100)
+    assert leds[1] == leds[2] == RED
+    animations.step(1600)
+    assert leds[1] == leds[2] == BLACK
+    animations.step(2100)
+    assert leds[1] == RED
+    assert leds[3] == BLACK
+
+
+def test_pulse_breathes():
+    animations, leds = make_animations()
+    animations.start(1, 1, PULSE, 1000, RED, BLACK, 0, 0)
+    levels = []
+    for now in range(0, 1000, 125):
+        animations.step(now)
+        levels.append(leds[1][0])
+    assert levels[0] == 0
+    assert levels == sorted(levels[:5]) + sorted(levels[5:], reverse=True)
+    assert max(levels) > 190
+
+
+def test_fade_ends_at_color1():
+    animations, leds = make_animations()
+    animations.start(2, 1, FADE, 200, RED, BLACK, 0, 0)
+    animations.step(100)
+    assert 90 < leds[2][0] < 110
+    animations.step(300)
+    assert leds[2] == RED
+    assert animations.active == 0
+
+
+def test_progress_is_static():
+    animations, leds = make_animations()
+    animations.start(1, 4, PROGRESS, 0, RED, BLACK, 160, 0)
+    assert [led[0] for led in leds[1:5]] == [200, 200, 101, 0]
+    assert animations.active == 0
+
+
+def test_rainbow_shifts_hue_per_led():
+    animations, leds = make_animations()
+    animations.start(1, 2, RAINBOW, 1000, bytes([20, 0, 0, 0]), BLACK, 86, 0)
+    animations.step(0)
+    assert leds[1] == bytes([20, 0, 0, 0])
+    assert leds[2] == bytes([0, 20, 0, 0])
+
+
+def test_stop():
+    animations, leds = make_animations()
+    animations.start(1, 3, BLINK, 100, RED, BLACK, 0, 0)
+    animations.start(2, 1, STOP, 0, BLACK, BLACK, 0, 0)
+    assert animations.active == 0b1010
+    animations.stop_all()
+    assert animations.active == 0
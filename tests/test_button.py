@@ -5,7 +5,12 @@ from importlib.abc import MetaPathFinder
 from unittest import mock
 
 import pytest
-from mutenix_firmware.button import Button
+
+sys.modules.setdefault("supervisor", mock.Mock())
+
+from mutenix_firmware.button import Button  # noqa: E402
+from mutenix_firmware.button import KeypadButtons  # noqa: E402
+from mutenix_firmware.button import LONGPRESS_TIME_MS  # noqa: E402
 
 
 class MockFcntl(MetaPathFinder):
@@ -17,6 +22,12 @@ class MockFcntl(MetaPathFinder):
 sys.meta_path.insert(0, MockFcntl())
 
 
+@pytest.fixture(autouse=True)
+def mock_ticks():
+    with mock.patch("mutenix_firmware.button.ticks_ms", return_value=0) as ticks:
+        yield ticks
+
+
 @pytest.fixture
 def mock_digitalio():
     with mock.patch("digitalio.DigitalInOut") as mock_digitalinout:
@@ -54,3 +65,84 @@ def test_button_triggered(mock_digitalio):
     button.read()
     assert button.triggered
     assert not button.triggered
+
+
+def test_button_longpress(mock_digitalio, mock_ticks):
+    pin_mock = mock.Mock()
+    pin_mock.value = True
+    mock_digitalio.return_value = pin_mock
+    button = Button(id=1)
+    button._pin.value = False
+    mock_ticks.return_value = 100
+    button.read()
+    button._pin.value = True
+    mock_ticks.return_value = 101 + LONGPRESS_TIME_MS
+    button.read()
+    assert button.longpressed
+
+
+class FakeEvent:
+    def __init__(self, key_number=0, pressed=True, timestamp=0):
+        self.key_number = key_number
+        self.pressed = pressed
+        self.timestamp = timestamp
+
+
+class FakeEventQueue:
+    def __init__(self):
+        self.queue = []
+        self.overflowed = False
+
+    def get_into(self, event):
+        if not self.queue:
+            return False
+        event.key_number, event.pressed, event.timestamp = self.queue.pop(0)
+        return True
+
+
+@pytest.fixture
+def mock_keypad():
+    keypad = mock.Mock()
+    keypad.Event = FakeEvent
+    keypad.Keys.return_value.events = FakeEventQueue()
+    with mock.patch("mutenix_firmware.button.keypad", keypad):
+        yield keypad
+
+
+def test_keypad_buttons(mock_keypad):
+    keys = KeypadButtons(["pin1", "pin2"], interval=0.01)
+    mock_keypad.Keys.assert_called_once()
+    assert mock_keypad.Keys.call_args.kwargs["interval"] == 0.01
+    assert [b.id for b in keys.buttons] == [1, 2]
+
+    events = mock_keypad.Keys.return_value.events
+    events.queue = [(1, True, 10)]
+    assert keys.read() == 0b10
+    button = keys.buttons[1]
+    assert button.changed_state
+    assert button.pressed
+    assert button.timestamp == 10
+    assert button.counter == 1
+    assert not keys.buttons[0].changed_state
+
+
+def test_keypad_buttons_keep_every_edge(mock_keypad):
+    keys = KeypadButtons(["pin1", "pin2"])
+    events = mock_keypad.Keys.return_value.events
+    events.queue = [
+        (0, True, 10),
+        (1, True, 20),
+        (0, False, 30 + LONGPRESS_TIME_MS),
+        (1, False, 40),
+    ]
+    button = keys.buttons[0]
+    assert keys.read() == 0b11
+    assert button.changed_state
+    assert button.pressed
+    assert keys.read() == 0b11
+    assert button.changed_state
+    assert button.released
+    assert button.triggered
+    assert button.longpressed
+    assert not keys.buttons[1].longpressed
+    assert keys.read() == 0
@@ -0,0 +1,71 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+import sys
+from unittest import mock
+
+import pytest
+
+sys.modules.setdefault("supervisor", mock.Mock())
+
+from mutenix_firmware.chords import Chords  # noqa: E402
+
+
+def make_chords(calls):
+    chords = Chords()
+    chords.add((0, 1), lambda: calls.append("short"), 100)
+    chords.add((0, 1, 4), lambda: calls.append("long"), 500)
+    return chords
+
+
+def test_chord_fires_after_hold_time():
+    calls = []
+    chords = make_chords(calls)
+    chords.edge(0, True, 1000)
+    chords.edge(1, True, 1010)
+    assert not chords.check(1109)
+    assert chords.check(1110)
+    assert calls == ["short"]
+
+
+def test_chord_fires_once_per_press():
+    calls = []
+    chords = make_chords(calls)
+    chords.edge(0, True, 0)
+    chords.edge(1, True, 0)
+    chords.check(200)
+    chords.check(400)
+    assert calls == ["short"]
+    chords.edge(1, False, 500)
+    chords.edge(1, True, 600)
+    chords.check(700)
+    assert calls == ["short", "short"]
+
+
+def test_chord_needs_exactly_its_buttons():
+    calls = []
+    chords = make_chords(calls)
+    chords.edge(0, True, 0)
+    chords.edge(1, True, 0)
+    chords.edge(4, True, 50)
+    chords.check(200)
+    assert calls == []
+    assert chords.check(550)
+    assert calls == ["long"]
+    assert chords.pressed == 0b10011
+
+
+def test_release_disarms_chord():
+    calls = []
+    chords = make_chords(calls)
+    chords.edge(0, True, 0)
+    chords.edge(1, True, 0)
+    chords.edge(0, False, 50)
+    assert not chords.check(1000)
+    assert calls == []
+
+
+def test_duplicate_chord_is_rejected():
+    chords = Chords()
+    chords.add((2, 3), lambda: None)
+    with pytest.raises(ValueError):
+        chords.add((3, 2), lambda: None)
@@ -0,0 +1,38 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+import pytest
+from mutenix_firmware.colors import GAMMA
+from mutenix_firmware.colors import hue_color
+from mutenix_firmware.colors import levels
+from mutenix_firmware.colors import scale
+
+
+@pytest.mark.parametrize(
+    "hue, rgb",
+    [(0, (255, 0, 0)), (43, (254, 255, 0)), (128, (0, 255, 255)), (213, (253, 0, 255))],
+)
+def test_hue_color(hue, rgb):
+    color = bytearray(4)
+    hue_color(hue, 255, color)
+    assert tuple(color[:3]) == rgb
+
+
+def test_hue_color_brightness():
+    color = bytearray(4)
+    hue_color(0, 20, color)
+    assert color == bytearray([20, 0, 0, 0])
+
+
+def test_scale_is_exact_at_both_ends():
+    assert scale(255, 255) == 255
+    assert scale(255, 0) == 0
+    assert scale(200, 128) == 100
+
+
+def test_levels():
+    assert levels() is None
+    assert levels(128)[255] == 128
+    table = levels(gamma=True)
+    assert table[0] == 0
+    assert table[255] == 255
+    assert table[128] == GAMMA[128] < 128
@@ -0,0 +1,85 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+import sys
+from unittest import mock
+
+sys.modules.setdefault("supervisor", mock.Mock())
+
+from mutenix_firmware.gestures import DOUBLE  # noqa: E402
+from mutenix_firmware.gestures import Gestures  # noqa: E402
+from mutenix_firmware.gestures import HOLD  # noqa: E402
+from mutenix_firmware.gestures import HOLD_RELEASED  # noqa: E402
+from mutenix_firmware.gestures import SINGLE  # noqa: E402
+from mutenix_firmware.gestures import TRIPLE  # noqa: E402
+
+
+def make_gestures():
+    emitted = []
+    gestures = Gestures(
+        3,
+        lambda *gesture: emitted.append(gesture),
+        tap_window_ms=200,
+        hold_ms=400,
+    )
+    return gestures, emitted
+
+
+def tap(gestures, index, at, duration=50):
+    gestures.edge(index, True, at)
+    gestures.check(at)
+    gestures.edge(index, False, at + duration)
+    gestures.check(at + duration)
+
+
+def test_single_tap_after_tap_window():
+    gestures, emitted = make_gestures()
+    tap(gestures, 1, 1000)
+    gestures.check(1249)
+    assert emitted == []
+    gestures.check(1250)
+    assert emitted == [(1, SINGLE, 1, 1000)]
+    gestures.check(2000)
+    assert len(emitted) == 1
+
+
+def test_double_tap():
+    gestures, emitted = make_gestures()
+    tap(gestures, 0, 1000)
+    tap(gestures, 0, 1150)
+    gestures.check(1400)
+    assert emitted == [(0, DOUBLE, 2, 1000)]
+
+
+def test_triple_tap_is_reported_on_third_release():
+    gestures, emitted = make_gestures()
+    for at in (1000, 1100, 1200):
+        tap(gestures, 2, at)
+    assert emitted == [(2, TRIPLE, 3, 1000)]
+
+
+def test_hold_and_release():
+    gestures, emitted = make_gestures()
+    gestures.edge(0, True, 1000)
+    gestures.check(1399)
+    assert emitted == []
+    gestures.check(1400)
+    assert emitted == [(0, HOLD, 0, 1000)]
+    gestures.edge(0, False, 2000)
+    assert emitted[1] == (0, HOLD_RELEASED, 0, 1000)
+
+
+def test_tap_and_hold():
+    gestures, emitted = make_gestures()
+    tap(gestures, 0, 1000)
+    gestures.edge(0, True, 1100)
+    gestures.check(1500)
+    assert emitted == [(0, HOLD, 1, 1000)]
+
+
+def test_buttons_are_independent():
+    gestures, emitted = make_gestures()
+    tap(gestures, 0, 1000)
+    tap(gestures, 2, 1020)
+    tap(gestures, 0, 1100)
+    gestures.check(1400)
+    assert sorted(emitted) == [(0, DOUBLE, 2, 1000), (2, SINGLE, 1, 1020)]
@@ -0,0 +1,125 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+import sys
+from unittest import mock
+
+import pytest
+
+circuitpython_modules = {
+    module: mock.MagicMock()
+    for module in [
+        "adafruit_ble",
+        "adafruit_ble.advertising",
+        "adafruit_ble.advertising.standard",
+        "adafruit_ble.services.standard",
+        "adafruit_ble.services.standard.device_info",
+        "adafruit_ble.services.standard.hid",
+        "_bleio",
+        "board",
+        "digitalio",
+        "keypad",
+        "neopixel_write",
+        "supervisor",
+        "usb_hid",
+    ]
+}
+circuitpython_modules["board"].board_id = "waveshare_rp2040_zero"
+
+# only mock the modules while importing, other tests bring their own mocks
+with mock.patch.dict(sys.modules, circuitpython_modules):
+    for module in ["hardware", "button", "myhid", "ticks"]:
+        sys.modules.pop(module, None)
+    # hardware and log import each other, import it the way the firmware does
+    import hardware
+    from hardware import ColorLeds
+    from hardware import GRB
+    from hardware import LedColors
+
+
+@pytest.fixture
+def neopixel_write():
+    with mock.patch.object(
+        hardware.neopixel_write,
+        "neopixel_write",
+    ) as neopixel_write:
+        yield neopixel_write
+
+
+def test_colorleds_setitem_does_not_write(neopixel_write):
+    leds = ColorLeds(mock.Mock(), 3, GRB)
+    leds[1] = "red"
+    neopixel_write.assert_not_called()
+    assert leds[1] == bytearray([0, 10, 0])
+
+
+def test_colorleds_show_writes_once(neopixel_write):
+    leds = ColorLeds(mock.Mock(), 3, GRB)
+    leds.fill("green")
+    leds[2] = "blue"
+    assert leds.show() is True
+    neopixel_write.assert_called_once_with(leds.pin, leds.colors)
+    assert leds.show() is False
+    neopixel_write.assert_called_once()
+
+
+def test_colorleds_show_skips_unchanged(neopixel_write):
+    leds = ColorLeds(mock.Mock(), 3, GRB)
+    leds[0] = "red"
+    leds.show()
+    leds[0] = LedColors["red"]
+    assert leds.show() is False
+    leds[0] = "black"
+    assert leds.show() is True
+    assert neopixel_write.call_count == 2
+
+
+def test_colorleds_slice_with_multi_led_mapping(neopixel_write):
+    leds = ColorLeds(mock.Mock(), 5, GRB, [0, [1, 3], [2, 4]])
+    leds[1:3] = "red"
+    leds.show()
+    assert leds.colors == bytearray([0, 0, 0] + [0, 10, 0] * 4)
+    neopixel_write.assert_called_once()
+
+
+def test_colorleds_hold_defers_show(neopixel_write):
+    leds = ColorLeds(mock.Mock(), 3, GRB)
+    leds.hold()
+    leds[0] = "red"
+    leds[1] = "blue"
+    assert leds.show() is False
+    neopixel_write.assert_not_called()
+    leds.release()
+    assert leds.show() is True
+    neopixel_write.assert_called_once()
+
+
+def test_colorleds_brightness_and_gamma(neopixel_write):
+    leds = ColorLeds(mock.Mock(), 3, GRB, brightness=128)
+    leds[0] = bytearray([200, 100, 0, 0])
+    leds[1] = "red"
+    assert leds[0] == bytearray([50, 100, 0])
+    assert leds[1] == bytearray([0, 5, 0])
+    leds.set_brightness(255, gamma=True)
+    leds[0] = bytearray([255, 0, 0, 0])
+    assert leds[0] == bytearray([0, 255, 0])
+
+
+def test_colorleds_white_only_on_grb(neopixel_write):
+    leds = ColorLeds(mock.Mock(), 3, GRB)
+    leds[2] = bytearray([0, 0, 0, 7])
+    assert leds[2] == bytearray([7, 7, 7])
+
+
+def test_mix_color_into_buffer():
+    out = bytearray(4)
+    result = hardware.mix_color("blue", "green", 3, 10, out)
+    assert result is out
+    assert out == bytearray([0, 7, 3, 0])
+
+
+def test_bluetooth_not_connected_before_setup():
+    options = hardware.hardware_variant
+    with mock.patch.object(options, "hardware_variant", hardware.TEN_BUTTON_BT):
+        with mock.patch.object(options, "_bluetooth", None):
+            assert options.has_bluetooth
+            assert options.bluetooth_connected is False
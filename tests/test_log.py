@@ -0,0 +1,127 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+import sys
+from unittest import mock
+
+import pytest
+
+with mock.patch.dict(
+    sys.modules,
+    {"hardware": mock.Mock(), "supervisor": mock.Mock()},
+):
+    sys.modules.pop("log", None)
+    sys.modules.pop("ticks", None)
+    import log
+
+
+class Counting:
+    def __init__(self):
+        self.calls = 0
+
+    def __str__(self):
+        self.calls += 1
+        return "counted"
+
+
+@pytest.fixture
+def bluetooth():
+    variant = mock.Mock()
+    variant.has_bluetooth = True
+    variant.bluetooth_connected = True
+    with (
+        mock.patch.object(log, "hardware") as hardware,
+        mock.patch.object(
+            log,
+            "log_buffer",
+            log.LogBuffer(),
+        ),
+    ):
+        hardware.hardware_variant = variant
+        yield variant
+
+
+@pytest.fixture
+def level():
+    old = log.level
+    yield log.set_level
+    log.set_level(old)
+
+
+def test_disabled_log_does_not_format(level, bluetooth):
+    level(log.ERROR)
+    argument = Counting()
+    with mock.patch("builtins.print") as print_:
+        log.log("value %s", argument)
+        log.log_info("value %s", argument)
+    assert argument.calls == 0
+    print_.assert_not_called()
+    assert len(log.log_buffer) == 0
+
+
+def test_log_formats_when_enabled(level, bluetooth):
+    level(log.DEBUG)
+    with mock.patch("builtins.print") as print_:
+        log.log("led %d set to %s", 3, None)
+    print_.assert_called_once_with("led 3 set to None")
+    bluetooth.send_bluetooth_update.assert_not_called()
+    log.flush_log()
+    bluetooth.send_bluetooth_update.assert_called_once_with(
+        bytearray(b"LB\x11led 3 set to None".ljust(36, b"\0")),
+    )
+
+
+def test_log_error_respects_level(level, bluetooth):
+    level(log.INFO)
+    with mock.patch("builtins.print") as print_:
+        log.log("debug")
+        log.log_info("info")
+        log.log_error("error %s", "x")
+    assert [c.args[0] for c in print_.call_args_list] == ["info", "error x"]
+    log.flush_log()
+    report = bluetooth.send_bluetooth_update.call_args.args[0]
+    assert report.startswith(b"LB\x04info\x87error x\0")
+
+
+def test_format_message():
+    assert log.format_message("no args %d") == "no args %d"
+    assert log.format_message("%s-%s-%s-%s", 1, 2, 3, 4) == "1-2-3-4"
+    # arguments not matching the format are joined instead of raising
+    assert log.format_message("Data received", 5) == "Data received 5"
+
+
+def test_log_buffer_batches_and_rate_limits():
+    buffer = log.LogBuffer(slots=4, interval_ms=50)
+    send = mock.Mock(side_effect=lambda report: reports.append(bytes(report)))
+    reports = []
+    buffer.put("a" * 20)
+    buffer.put("b" * 10)
+    buffer.put("c" * 20)
+    assert buffer.flush(send, 1000)
+    assert not buffer.flush(send, 1049)
+    assert buffer.flush(send, 1050)
+    assert not buffer.flush(send, 2000)
+    assert reports == [
+        b"LB\x14" + b"a" * 20 + b"\x0a" + b"b" * 10 + b"\0\0",
+        b"LB\x14" + b"c" * 20 + b"\0" * 13,
+    ]
+
+
+def test_log_buffer_drops_oldest():
+    buffer = log.LogBuffer(slots=2, interval_ms=0)
+    reports = []
+    for text in ["one", "two", "three", "four"]:
+        buffer.put(text, error=text == "four")
+    assert buffer.dropped == 2
+    while buffer.flush(lambda report: reports.append(bytes(report)), 0):
+        pass
+    assert reports[0] == b"LX" + (2).to_bytes(4, "little") + b"\0" * 30
+    assert reports[1].startswith(b"LB\x05three\x84four\0")
+    assert len(reports) == 2
+
+
+def test_log_buffer_truncates_long_messages():
+    buffer = log.LogBuffer()
+    buffer.put("x" * 100)
+    send = mock.Mock()
+    buffer.flush(send, 0)
+    assert send.call_args.args[0] == bytearray(b"LB\x21" + b"x" * 33)
@@ -0,0 +1,59 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+import sys
+from unittest import mock
+
+
+sys.modules.setdefault("supervisor", mock.Mock())
+
+from mutenix_firmware import power  # noqa: E402
+from mutenix_firmware.power import IdleMonitor  # noqa: E402
+from mutenix_firmware.scheduler import Scheduler  # noqa: E402
+
+
+def make_monitor(enabled=True):
+    scheduler = Scheduler()
+    task = scheduler.add("buttons", lambda: None, 1)
+    with mock.patch.object(power, "ticks_ms", return_value=0):
+        monitor = IdleMonitor(scheduler, 1000, enabled=enabled)
+    monitor.add(task, 20)
+    return scheduler, task, monitor
+
+
+def test_idle_after_quiet_period():
+    scheduler, task, monitor = make_monitor()
+    monitor.activity(0)
+    monitor.check(999)
+    assert not monitor.idle
+    monitor.check(1000)
+    assert monitor.idle
+    assert task.interval_ms == 20
+
+
+def test_activity_wakes_immediately():
+    scheduler, task, monitor = make_monitor()
+    monitor.check(1000)
+    scheduler.run_once(1000)
+    assert not task.due(1001)
+    monitor.activity(1001)
+    assert not monitor.idle
+    assert task.interval_ms == 1
+    assert task.due(1001)
+
+
+def test_quiet_period_starts_at_creation_before_ticks_wrap():
+    start = (1 << 29) - 65_000
+    with mock.patch.object(power, "ticks_ms", return_value=start):
+        monitor = IdleMonitor(Scheduler(), 1000)
+    assert monitor.quiet_ms(start + 10) == 10
+    monitor.check(start + 999)
+    assert not monitor.idle
+    monitor.check(start + 1000)
+    assert monitor.idle
+
+
+def test_disabled_monitor_stays_active():
+    scheduler, task, monitor = make_monitor(enabled=False)
+    monitor.check(100_000)
+    assert not monitor.idle
+    assert task.interval_ms == 1
@@ -1,21 +1,30 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
 import sys
+import tracemalloc
 from unittest import mock
 
+sys.modules.setdefault("supervisor", mock.Mock())
 sys.modules["hardware"] = mock.Mock()  # type: ignore[attr-defined]
 hw = sys.modules["hardware"]
 hw.hardware_variant = mock.Mock()  # type: ignore[attr-defined]
 hw.hardware_variant.hardware_variant = 1
 
 from mutenix_firmware.protocol import (  # noqa: E402
+    Animate,
     OutMessage,
     Ping,
     SetColor,
+    SetColors,
+    TimeSync,
+    StatsRequest,
     PrepareUpdate,
     Reset,
     Unknown,
     InMessage,
+    CAPABILITY_AGGREGATED_STATUS,
+    Dispatcher,
+    MESSAGE_TYPES,
 )  # noqa: E402
 from mutenix_firmware.button import Button  # noqa: E402
 import version as v  # noqa: E402
@@ -29,6 +38,15 @@ def test_outmessage_from_buffer_ping():
     assert isinstance(message, Ping)
 
 
+def test_outmessage_from_buffer_ping_capabilities():
+    buffer = bytearray(
+        [OutMessage.PING, CAPABILITY_AGGREGATED_STATUS] + [0] * (OUT_REPORT_LENGTH - 2),
+    )
+    message = OutMessage.from_buffer(buffer)
+    assert isinstance(message, Ping)
+    assert message.capabilities == CAPABILITY_AGGREGATED_STATUS
+
+
 def test_outmessage_from_buffer_setcolor():
     buffer = bytearray([OutMessage.SETCOLOR, 1, 2, 3, 4, 5, 0, 0])
     message = OutMessage.from_buffer(buffer)
@@ -37,6 +55,45 @@ def test_outmessage_from_buffer_setcolor():
     assert message.color == bytearray([2, 3, 4, 5])
 
 
+def test_outmessage_from_buffer_setcolors():
+    buffer = bytearray(60)
+    buffer[0:4] = bytes([OutMessage.SETCOLORS, 2, 3, SetColors.FLAG_STAGE])
+    for i in range(3):
+        buffer[4 + 4 * i : 8 + 4 * i] = bytes([i, i + 1, i + 2, 0])
+    message = OutMessage.from_buffer(buffer)
+    assert isinstance(message, SetColors)
+    assert message.start == 2
+    assert message.count == 3
+    assert message.stage is True
+    assert [message.color(i) for i in range(3)] == [
+        bytearray([0, 1, 2, 0]),
+        bytearray([1, 2, 3, 0]),
+        bytearray([2, 3, 4, 0]),
+    ]
+
+
+def test_outmessage_from_buffer_setcolors_count_limited_by_report():
+    buffer = bytearray([OutMessage.SETCOLORS, 1, 10, 0, 1, 2, 3, 4])
+    message = OutMessage.from_buffer(buffer)
+    assert message.count == 1
+    assert message.stage is False
+
+
+def test_outmessage_from_buffer_time_sync():
+    buffer = bytearray([OutMessage.TIME_SYNC, 0x34, 0x12, 0, 0, 0, 0, 0])
+    message = OutMessage.from_buffer(buffer)
+    assert isinstance(message, TimeSync)
+    assert message.token == 0x1234
+
+
+def test_outmessage_from_buffer_stats():
+    buffer = bytearray([OutMessage.STATS, 0xFF, StatsRequest.FLAG_RESET, 0, 0, 0, 0, 0])
+    message = OutMessage.from_buffer(buffer)
+    assert isinstance(message, StatsRequest)
+    assert message.phase == 0xFF
+    assert message.reset is True
+
+
 def test_outmessage_from_buffer_prepare_update():
     buffer = bytearray([OutMessage.PREPARE_UPDATE] + [0] * (OUT_REPORT_LENGTH - 1))
     message = OutMessage.from_buffer(buffer)
@@ -56,6 +113,64 @@ def test_outmessage_from_buffer_unknown():
     assert message.data == buffer
 
 
+def test_outmessage_from_buffer_parses_in_place():
+    buffer = bytearray([OutMessage.SETCOLOR, 1, 2, 3, 4, 5, 0, 0])
+    message = OutMessage.from_buffer(buffer)
+    buffer[1] = 7
+    assert message.buttonid == 7
+    view = OutMessage.from_buffer(memoryview(buffer)).color
+    buffer[2] = 9
+    assert view == bytearray([9, 3, 4, 5])
+
+
+def test_dispatcher_calls_registered_handler():
+    handler = mock.Mock()
+    dispatcher = Dispatcher()
+    dispatcher.register(SetColor, handler)
+    assert dispatcher.dispatch(bytes([OutMessage.SETCOLOR, 3, 1, 2, 3, 4, 0, 0]))
+    message = handler.call_args.args[0]
+    assert isinstance(message, SetColor)
+    handler.side_effect = lambda message: seen.append(message.buttonid)
+    seen = []
+    dispatcher.dispatch(bytes([OutMessage.SETCOLOR, 4, 1, 2, 3, 4, 0, 0]))
+    assert handler.call_args.args[0] is message
+    assert seen == [4]
+
+
+def test_dispatcher_passes_unknown_reports_unparsed():
+    unknown = mock.Mock()
+    dispatcher = Dispatcher(unknown=unknown)
+    dispatcher.register(Ping, mock.Mock())
+    report = bytes([OutMessage.SETCOLOR, 3, 1, 2, 3, 4, 0, 0])
+    assert not dispatcher.dispatch(report)
+    unknown.assert_called_once_with(report)
+
+
+def test_dispatcher_drops_short_reports():
+    handler = mock.Mock()
+    dispatcher = Dispatcher()
+    dispatcher.register(Animate, handler)
+    assert not dispatcher.dispatch(bytes([OutMessage.ANIMATE, 1, 2, 1, 0x10, 0, 10, 0]))
+    handler.assert_not_called()
+    assert dispatcher.dispatch(bytes([OutMessage.ANIMATE]) + bytes(59))
+    handler.assert_called_once()
+
+
+def test_dispatcher_registers_new_message_types():
+    class Custom(OutMessage):
+        TYPE = 0x42
+
+    handler = mock.Mock()
+    dispatcher = Dispatcher()
+    dispatcher.register(Custom, handler)
+    try:
+        assert dispatcher.dispatch(bytes([0x42, 1]))
+        assert isinstance(OutMessage.from_buffer(bytes([0x42, 1])), Custom)
+    finally:
+        del MESSAGE_TYPES[0x42]
+    assert isinstance(handler.call_args.args[0], Custom)
+
+
 def test_inmessage_initialize():
     message = InMessage.initialize()
     expected_data = [InMessage.INITIALIZE, v.MAJOR, v.MINOR, v.PATCH, 1] + [0] * (
@@ -79,12 +194,108 @@ def test_inmessage_button():
     assert message._data[:-1] == bytearray(expected_data)[:-1]
 
 
+def test_inmessage_buttons():
+    buttons = []
+    for i in range(10):
+        button = mock.Mock(spec=Button)
+        button.pressed = i in (0, 9)
+        button.triggered = i == 3
+        button.longpressed = i == 3
+        button.counter = i
+        buttons.append(button)
+    message = InMessage.buttons(buttons)
+    assert message._data[0] == InMessage.STATUS_ALL
+    status = int.from_bytes(message._data[1:], "little")
+    assert status & 0x3FF == 0b1000000001
+    assert (status >> 10) & 0x3FF == 0b1000
+    assert (status >> 20) & 0x3FF == 0b1000
+    assert [(status >> (30 + 2 * i)) & 0x3 for i in range(10)] == [
+        i & 0x3 for i in range(10)
+    ]
+
+
+def test_inmessage_button_extended():
+    button = mock.Mock(spec=Button)
+    button.id = 2
+    button.triggered = True
+    button.longpressed = True
+    button.pressed = False
+    button.released = True
+    button.counter = 300
+    button.timestamp = 0x1ABCDE
+    message = InMessage.button_extended(button, 0x1ABCFF)
+    assert message._data == bytearray(
+        [InMessage.STATUS_EXTENDED, 2, 0b1011, 300 & 0xFF, 0xDE, 0xBC, 0xFF, 0xBC],
+    )
+
+
+def test_inmessage_time_sync():
+    message = InMessage.time_sync(0x1234, 0x1ABCDEF)
+    assert message._data == bytearray(
+        [InMessage.TIME_SYNC, 0x34, 0x12, 0xEF, 0xCD, 0xAB, 0x01, 0],
+    )
+
+
 def test_inmessage_status_request():
     message = InMessage.status_request()
     expected_data = [InMessage.STATUS_REQUEST] + [0] * (OUT_REPORT_LENGTH - 1)
     assert message._data == bytearray(expected_data)
 
 
+def test_inmessage_buttons_wide_counters():
+    buttons = []
+    for i in range(10):
+        button = mock.Mock(spec=Button)
+        button.pressed = True
+        button.triggered = True
+        button.longpressed = True
+        button.counter = 3
+        buttons.append(button)
+    message = InMessage.buttons(buttons)
+    assert message._data == bytearray([InMessage.STATUS_ALL] + [0xFF] * 6 + [0x03])
+
+
+class PlainButton:
+    id = 3
+    triggered = True
+    longpressed = False
+    pressed = True
+    released = False
+    counter = 257
+
+
+def test_inmessage_button_counter_wraps():
+    message = InMessage.button(PlainButton())
+    assert message._data[6] == 1
+
+
+def test_inmessage_reuses_buffers():
+    button = PlainButton()
+    assert InMessage.button(button) is InMessage.button(button)
+    assert InMessage.initialize() is not InMessage.status_request()
+
+
+def test_inmessage_steady_state_does_not_allocate():
+    button = PlainButton()
+    InMessage.button(button)
+    InMessage.initialize()
+    InMessage.status_request()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        i = 0
+        while i < 100:
+            InMessage.button(button)
+            InMessage.initialize()
+            InMessage.status_request()
+            i += 1
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak - before == 0
+
+
 def test_inmessage_send():
     device = mock.Mock()
     data = [1, 2, 3, 4, 5, 6, 7, 8]
@@ -0,0 +1,97 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+import sys
+from unittest import mock
+
+sys.modules.setdefault("supervisor", mock.Mock())
+
+from mutenix_firmware.scheduler import MAX_SLEEP_MS  # noqa: E402
+from mutenix_firmware.scheduler import Scheduler  # noqa: E402
+
+
+def make_scheduler(calls):
+    scheduler = Scheduler()
+    scheduler.add("slow", lambda: calls.append("slow"), 10)
+    scheduler.add("buttons", lambda: calls.append("buttons"), 1, priority=2)
+    scheduler.add("leds", lambda: calls.append("leds"), 5, priority=1)
+    return scheduler
+
+
+def test_tasks_run_by_priority_at_their_interval():
+    calls = []
+    scheduler = make_scheduler(calls)
+    assert scheduler.run_once(1000) == 3
+    assert calls == ["buttons", "leds", "slow"]
+    calls.clear()
+    for now in range(1001, 1011):
+        scheduler.run_once(now)
+    assert calls.count("buttons") == 10
+    assert calls.count("leds") == 2
+    assert calls.count("slow") == 1
+
+
+def test_sleep_time_until_next_task():
+    scheduler = Scheduler()
+    scheduler.add("a", lambda: None, 20)
+    scheduler.add("b", lambda: None, 7)
+    assert scheduler.sleep_time(0) == 0
+    scheduler.run_once(0)
+    assert scheduler.sleep_time(0) == 7
+    assert scheduler.sleep_time(5) == 2
+    assert scheduler.sleep_time(9) == 0
+
+
+def test_sleep_time_is_bounded():
+    scheduler = Scheduler()
+    scheduler.add("a", lambda: None, 10 * MAX_SLEEP_MS)
+    scheduler.run_once(0)
+    assert scheduler.sleep_time(0) == MAX_SLEEP_MS
+
+
+def test_scheduler_handles_ticks_wrap():
+    calls = []
+    scheduler = Scheduler()
+    scheduler.add("a", lambda: calls.append(1), 10)
+    scheduler.run_once((1 << 29) - 5)
+    scheduler.run_once(4)
+    scheduler.run_once(5)
+    assert len(calls) == 2
+
+
+def test_high_priority_task_runs_between_slow_tasks():
+    calls = []
+    clock = [0]
+
+    def slow():
+        calls.append("slow")
+        clock[0] += 3
+
+    scheduler = Scheduler()
+    scheduler.add("slow1", slow, 100)
+    scheduler.add("slow2", slow, 100)
+    scheduler.add("buttons", lambda: calls.append("buttons"), 1, priority=1)
+    with mock.patch("mutenix_firmware.scheduler.ticks_ms", lambda: clock[0]):
+        scheduler.run_once()
+    assert calls == ["buttons", "slow", "buttons", "slow"]
+
+
+def test_wake_makes_task_due():
+    calls = []
+    scheduler = Scheduler()
+    task = scheduler.add("a", lambda: calls.append(1), 100)
+    scheduler.run_once(0)
+    scheduler.run_once(1)
+    scheduler.wake(task)
+    scheduler.run_once(2)
+    assert calls == [1, 1]
+
+
+def test_stats_are_marked_per_task():
+    stats = mock.Mock()
+    scheduler = Scheduler(stats)
+    scheduler.add("a", lambda: None, 1, phase=3)
+    scheduler.add("b", lambda: None, 1)
+    scheduler.run_once(0)
+    stats.begin.assert_called_once_with()
+    stats.mark.assert_called_once_with(3)
+    stats.end.assert_called_once_with()
@@ -0,0 +1,189 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+import sys
+
+from mutenix_simulator import Scenario
+from mutenix_simulator import Simulator
+
+
+PING = bytes([0xF0, 0, 0, 0, 0, 0, 0, 0])
+
+
+def test_ping_is_answered_with_initialize():
+    with Simulator() as sim:
+        sim.host_report(PING)
+        sim.step()
+        reports = [data for report_id, data in sim.sent_reports() if report_id == 1]
+    assert reports[0][0] == 0x2
+    assert reports[1][0] == 0x99
+
+
+def test_button_press_reports_status():
+    with Simulator(variant="usb5") as sim:
+        sim.press(2)
+        sim.step()
+        sim.release(2)
+        sim.step()
+        reports = [data for report_id, data in sim.sent_reports() if report_id == 1]
+    assert [(r[0], r[1], r[4]) for r in reports] == [(0x1, 3, 1), (0x1, 3, 0)]
+    assert sim.latencies == [0, 0]
+
+
+def test_button_press_without_keypad():
+    with Simulator(keypad=False) as sim:
+        sim.press(0)
+        sim.run(30)
+        reports = [data for report_id, data in sim.sent_reports() if report_id == 1]
+    assert reports[0][:2] == bytes([0x1, 1])
+
+
+def test_prepare_update_reloads():
+    with Simulator() as sim:
+        sim.host_report(bytes([0xE0, 0x50, 0x52, 0x45, 0x50, 0x41, 0x52, 0x45]))
+        sim.step()
+    assert sim.reloaded == "update.py"
+
+
+def test_update_chunks_are_ignored_until_reload():
+    with Simulator(variant="usb10") as sim:
+        sim.host_report(bytes([0xE0, 0x50, 0x52, 0x45, 0x50, 0x41, 0x52, 0x45]))
+        # a data packet (type 2) of file 3 must not be taken for SetColors
+        sim.host_report(bytes([0x2, 0, 3, 0, 1, 0, 0, 0]) + b"x" * 52, report_id=2)
+        sim.step()
+        assert bytes(sim.hardware.leds[2]) == bytes(3)
+    assert sim.reloaded == "update.py"
+
+
+def test_short_animate_report_is_ignored():
+    with Simulator(variant="usb10") as sim:
+        sim.host_report(bytes([0x04, 1, 2, 1, 0x10, 0, 10, 0]))
+        sim.step()
+        sim.host_report(PING)
+        sim.step()
+        assert sim.main.animations.active == 0
+        reports = [data for report_id, data in sim.sent_reports() if report_id == 1]
+    assert reports[-1][0] == 0x99
+
+
+def test_ble_repeated_update_reports_are_received():
+    with Simulator(variant="bt10") as sim:
+        chunk = bytes([0x2, 0, 1, 0, 2, 0, 1, 0]) + b"x" * 52
+        sim.host_report(chunk, report_id=2)
+        sim.host_report(chunk, report_id=2)
+        assert sim.hardware.read_bluetooth_update() == chunk
+        assert sim.hardware.read_bluetooth_update() == chunk
+        assert sim.hardware.read_bluetooth_update() is None
+
+
+def test_host_timeout_keeps_bluetooth_led():
+    with Simulator(variant="bt5", tick_ms=10) as sim:
+        sim.run(7000)
+        assert sim.hardware._precvious_bl_led_state == "green"
+        assert bytes(sim.hardware.leds[sim.hardware.bluetooth_led]) != bytes(3)
+
+
+def test_scenario_counts_reports():
+    result = Scenario("taps", 200).ping_every(100).tap(10, 0).run(variant="usb10")
+    assert result.iterations == 200
+    assert result.reports[1] == 5
+    assert result.max_latency == 0
+
+
+def test_ble_logs_are_sent_when_idle():
+    with Simulator(variant="bt10") as sim:
+        log = sys.modules["log"]
+        log.set_level(log.DEBUG)
+        sim.press(0)
+        sim.step()
+        hid = sim.hardware._hid_communication_in.sent
+        update = sim.hardware._update_communication_in.sent
+        assert len(hid) == 1
+        assert update == []
+        sim.run(100)
+        assert update[0].startswith(b"LB")
+        assert len(update) <= 100 // log.LOG_FLUSH_INTERVAL_MS + 1
+
+
+def test_set_color_reaches_the_leds():
+    with Simulator(variant="usb10") as sim:
+        sim.host_report(PING)
+        sim.step()
+        sim.host_report(bytes([0x1, 2, 0x10, 0x20, 0x30, 0, 0, 0]))
+        sim.step()
+        assert bytes(sim.hardware.leds[2]) == bytes([0x20, 0x10, 0x30])
+        sim.host_report(bytes([0x42, 0, 0, 0, 0, 0, 0, 0]))
+        sim.step()
+
+
+def test_ble_variant_idles_and_wakes_on_press():
+    with Simulator(variant="bt10") as sim:
+        sim.main.idle_monitor.idle_after_ms = 50
+        # the quiet period starts at boot, idle is checked every power interval
+        sim.run(sim.main.POWER_INTERVAL_MS + 1)
+        assert sim.main.idle_monitor.idle
+        buttons = sim.main.scheduler.tasks[0]
+        assert buttons.interval_ms == sim.main.IDLE_BUTTON_INTERVAL_MS
+        sim.run(sim.main.IDLE_BUTTON_INTERVAL_MS)
+        sim.press(1)
+        sim.run(sim.main.IDLE_BUTTON_INTERVAL_MS)
+        assert not sim.main.idle_monitor.idle
+        assert buttons.interval_ms == sim.main.BUTTON_INTERVAL_MS
+        assert sim.latencies[0] < sim.main.IDLE_BUTTON_INTERVAL_MS
+
+
+def test_usb_variant_does_not_idle():
+    with Simulator(variant="usb10") as sim:
+        sim.main.idle_monitor.idle_after_ms = 10
+        sim.run(20)
+        assert not sim.main.idle_monitor.idle
+
+
+def test_chord_resets_device():
+    with Simulator(variant="usb5") as sim:
+        for index in (0, 1, 4):
+            sim.press(index)
+        sim.run(400)
+        assert not sim.reset
+        sim.run(200)
+    assert sim.reset
+
+
+def test_chord_sends_report():
+    with Simulator(variant="usb5") as sim:
+        sim.press(3)
+        sim.press(4)
+        sim.run(1100)
+        reports = [data for report_id, data in sim.sent_reports() if report_id == 1]
+    assert reports[-1][:4] == bytes([0x5, 1, 0b11000, 0])
+
+
+def test_gestures_replace_edge_reports():
+    with Simulator(variant="usb5") as sim:
+        # capabilities: gestures
+        sim.host_report(bytes([0xF0, 0x4, 0, 0, 0, 0, 0, 0]))
+        sim.step()
+        for _ in range(2):
+            sim.press(1)
+            sim.run(40)
+            sim.release(1)
+            sim.run(60)
+        sim.run(300)
+        reports = [data for report_id, data in sim.sent_reports() if report_id == 1]
+    assert [r[0] for r in reports] == [0x2, 0x99, 0x6]
+    assert reports[-1][:4] == bytes([0x6, 2, 2, 2])
+
+
+def test_animation_runs_without_host_traffic():
+    with Simulator(variant="usb10") as sim:
+        sim.host_report(PING)
+        sim.step()
+        # blink led 3 red/black with a period of 200ms
+        animate = bytes([0x4, 3, 1, 1, 200, 0, 0x10, 0, 0, 0] + [0] * 50)
+        sim.host_report(animate, report_id=2)
+        sim.run(50)
+        assert bytes(sim.hardware.leds[3]) == bytes([0, 0x10, 0])
+        sim.run(100)
+        assert bytes(sim.hardware.leds[3]) == bytes([0, 0, 0])
+        sim.host_report(bytes([0x1, 3, 0, 0x10, 0, 0, 0, 0]))
+        sim.run(200)
+        assert bytes(sim.hardware.leds[3]) == bytes([0x10, 0, 0])
@@ -0,0 +1,59 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+from unittest import mock
+
+from mutenix_firmware.stats import Histogram
+from mutenix_firmware.stats import LoopStats
+from mutenix_firmware.stats import PHASE_BUTTONS
+from mutenix_firmware.stats import PHASE_LOOP
+from mutenix_firmware.stats import PHASE_RX
+
+
+def test_histogram_min_max_count():
+    histogram = Histogram()
+    for value in [5, 3, 900, 40]:
+        histogram.add(value)
+    assert histogram.count == 4
+    assert histogram.min == 3
+    assert histogram.max == 900
+
+
+def test_histogram_percentile():
+    histogram = Histogram()
+    for _ in range(98):
+        histogram.add(100)
+    histogram.add(5000)
+    histogram.add(5000)
+    # 100 us lands in [64, 128), 5000 us in [4096, 8192)
+    assert histogram.percentile(50) == 127
+    assert histogram.percentile(99) == 5000
+    assert Histogram().percentile(50) == 0
+
+
+def test_histogram_reset():
+    histogram = Histogram()
+    histogram.add(7)
+    histogram.reset()
+    assert histogram.count == 0
+    assert sum(histogram.buckets) == 0
+
+
+def test_loop_stats_phases_and_report():
+    stats = LoopStats()
+    with mock.patch(
+        "mutenix_firmware.stats.time.monotonic_ns",
+        side_effect=[0, 20_000, 50_000, 60_000],
+    ):
+        stats.begin()
+        stats.mark(PHASE_RX)
+        stats.mark(PHASE_BUTTONS)
+        stats.end()
+    assert stats.histograms[PHASE_RX].max == 20
+    assert stats.histograms[PHASE_BUTTONS].max == 30
+    assert stats.histograms[PHASE_LOOP].max == 60
+
+    report = stats.report(PHASE_BUTTONS)
+    assert len(report) == 36
+    assert report[0:3] == b"ST" + bytes([PHASE_BUTTONS])
+    values = [int.from_bytes(report[3 + 4 * i : 7 + 4 * i], "little") for i in range(5)]
+    assert values == [1, 30, 30, 30, 30]
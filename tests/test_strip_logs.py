@@ -0,0 +1,53 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
+import sys
+
+sys.path.append("scripts")
+
+from strip_logs import strip_source  # noqa: E402
+
+SOURCE = """from log import log
+from log import log_error
+
+
+def f(x):
+    log("start %d", x)
+    if x:
+        log(
+            "multi line %s",
+            x,
+        )
+    else:
+        x = 1
+        log_info("x set")
+    try:
+        return x
+    except ValueError as e:
+        log_error("failed %s", e)
+    if x: log("inline")
+"""
+
+EXPECTED = """from log import log
+from log import log_error
+
+
+def f(x):
+    if x:
+        pass
+    else:
+        x = 1
+    try:
+        return x
+    except ValueError as e:
+        log_error("failed %s", e)
+    if x: pass
+"""
+
+
+def test_strip_source():
+    assert strip_source(SOURCE) == EXPECTED
+
+
+def test_strip_source_unchanged_without_logs():
+    source = "def f():\n    return log_error('x')\n"
+    assert strip_source(source) == source
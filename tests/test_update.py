@@ -1,6 +1,7 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2025 Matthias Bilger <matthias@bilger.info>
 import sys
+import zlib
 from unittest import mock
 from unittest.mock import MagicMock
 from unittest.mock import patch
@@ -15,6 +16,7 @@ sys.modules["hardware"] = mock.Mock()  # type: ignore[attr-defined]
 hw = sys.modules["hardware"]
 hw.hardware_variant = mock.Mock()  # type: ignore[attr-defined]
 hw.hardware_variant.leds = mock.MagicMock()
+hw.hardware_variant.has_bluetooth = False
 from mutenix_firmware.update import (  # noqa: E402
     FileTransport,
     FILE_TRANSPORT_START,
@@ -22,8 +24,27 @@ from mutenix_firmware.update import (  # noqa: E402
     FILE_TRANSPORT_END,
     FILE_TRANSPORT_FINISH,
     FILE_TRANSPORT_DELETE,
+    FILE_TRANSPORT_WINDOW,
+    CAPABILITY_WINDOW,
+    REORDER_BUFFER_SIZE,
+    FLAG_COMPRESSED,
+    FLAG_CRC32,
+    CAPABILITY_CRC32,
+    FILE_TRANSPORT_QUERY,
+    FILE_TRANSPORT_RESUME,
+    CAPABILITY_RESUME,
+    CAPABILITY_COMPRESSION,
+    TRANSPORT_BLUETOOTH,
+    TRANSPORT_USB,
+    BluetoothTransport,
+    UpdateTransport,
+    read_journal,
+    write_journal,
+    file_checksum,
+    MAX_WINDOW_SIZE,
     LedStatus,
     File,
+    capabilities,
     do_update,
 )
 
@@ -110,7 +131,8 @@ def test_file_initialization():
     assert file.filename == "filename.txt"
     assert file.total_size == 1048576
     assert file.id == 1
-    assert file.packages == list(range(10))
+    assert file.missing == 10
+    assert not any(file.is_received(i) for i in range(10))
 
 
 def test_file_write():
@@ -137,8 +159,23 @@ def test_file_write():
         ft_data = FileTransport(data)
         file.write(ft_data)
         mock_open.assert_called_once_with("filename.txt", "wb")
-        mock_file.write.assert_called_once_with(b"12345678")
-    assert 1 not in file.packages
+        mock_file.write.assert_not_called()
+        assert file.is_received(1)
+
+        data = (
+            FILE_TRANSPORT_DATA.to_bytes(2, "little")
+            + (1).to_bytes(2, "little")
+            + (10).to_bytes(2, "little")
+            + (0).to_bytes(2, "little")
+            + b"abcdefgh"
+        )
+        file.write(FileTransport(data))
+        assert mock_file.write.call_args_list == [
+            mock.call(b"abcdefgh"),
+            mock.call(b"12345678"),
+        ]
+        mock_file.seek.assert_called_once_with(FileTransport.content_length)
+    assert file.missing == 8
 
 
 def test_file_is_complete():
@@ -150,22 +187,132 @@ def test_file_is_complete():
         + b"\x0cfilename.txt\x04\x00\x00\x10"
     )
     ft_start = FileTransport(start_data)
-    file = File(ft_start)
+    with patch("builtins.open", mock.mock_open()):
+        file = File(ft_start)
 
-    for i in range(11):
-        data = (
-            FILE_TRANSPORT_DATA.to_bytes(2, "little")
-            + (1).to_bytes(2, "little")
-            + (10).to_bytes(2, "little")
-            + (i).to_bytes(2, "little")
-            + b"12345678"
-        )
-        ft_data = FileTransport(data)
-        file.write(ft_data)
+        for i in range(11):
+            data = (
+                FILE_TRANSPORT_DATA.to_bytes(2, "little")
+                + (1).to_bytes(2, "little")
+                + (10).to_bytes(2, "little")
+                + (i).to_bytes(2, "little")
+                + b"12345678"
+            )
+            ft_data = FileTransport(data)
+            file.write(ft_data)
 
     assert file.is_complete() is True
 
 
+def test_file_write_out_of_order():
+    packages = REORDER_BUFFER_SIZE + 3
+    size = packages * FileTransport.content_length - 10
+    start_data = (
+        FILE_TRANSPORT_START.to_bytes(2, "little")
+        + (1).to_bytes(2, "little")
+        + packages.to_bytes(2, "little")
+        + (0).to_bytes(2, "little")
+        + b"\x0cfilename.txt\x04"
+        + size.to_bytes(4, "little")
+    )
+    content = bytearray(packages * FileTransport.content_length)
+
+    class FakeFile:
+        position = 0
+
+        def seek(self, offset):
+            self.position = offset
+
+        def write(self, data):
+            content[self.position : self.position + len(data)] = data
+            self.position += len(data)
+
+        def close(self):
+            pass
+
+    fake_file = FakeFile()
+    with patch("builtins.open", return_value=fake_file):
+        file = File(FileTransport(start_data))
+        order = list(reversed(range(packages))) + [3, 5]
+        for i in order:
+            file.write(
+                FileTransport(
+                    FILE_TRANSPORT_DATA.to_bytes(2, "little")
+                    + (1).to_bytes(2, "little")
+                    + packages.to_bytes(2, "little")
+                    + i.to_bytes(2, "little")
+                    + bytes([i]) * FileTransport.content_length,
+                ),
+            )
+    assert file.is_complete()
+    assert file.remaining == 0
+    expected = b"".join(
+        bytes([i]) * FileTransport.content_length for i in range(packages)
+    )
+    assert bytes(content[:size]) == expected[:size]
+
+
+def test_filetransport_start_flags():
+    data = (
+        FILE_TRANSPORT_START.to_bytes(2, "little")
+        + (1).to_bytes(2, "little")
+        + (10).to_bytes(2, "little")
+        + (0).to_bytes(2, "little")
+        + b"\x0cfilename.txt\x04\x00\x00\x10\x00\x01"
+    )
+    ft = FileTransport(data)
+    assert ft.as_start() == ("filename.txt", 1048576)
+    assert ft.start_flags() == FLAG_COMPRESSED
+
+
+def test_file_write_compressed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    original = b"".join(b"line %d of a python source file\n" % i for i in range(200))
+    compressed = zlib.compress(original)
+    chunks = [
+        compressed[i : i + FileTransport.content_length]
+        for i in range(0, len(compressed), FileTransport.content_length)
+    ]
+    start_data = (
+        FILE_TRANSPORT_START.to_bytes(2, "little")
+        + (1).to_bytes(2, "little")
+        + len(chunks).to_bytes(2, "little")
+        + (0).to_bytes(2, "little")
+        + b"\x0cfilename.txt\x04"
+        + len(compressed).to_bytes(4, "little")
+        + FLAG_COMPRESSED.to_bytes(1, "little")
+    )
+    assert len(chunks) > 2
+    file = File(FileTransport(start_data))
+    order = [1, 0] + list(range(2, len(chunks)))
+    for i in order:
+        file.write(
+            FileTransport(
+                FILE_TRANSPORT_DATA.to_bytes(2, "little")
+                + (1).to_bytes(2, "little")
+                + len(chunks).to_bytes(2, "little")
+                + i.to_bytes(2, "little")
+                + chunks[i],
+            ),
+        )
+        if not file.is_complete():
+            assert (tmp_path / "filename.txt.z").exists()
+    assert file.is_complete()
+    assert file.verified()
+    assert (tmp_path / "filename.txt").read_bytes() == original
+    assert not (tmp_path / "filename.txt.z").exists()
+
+
+def test_file_write_compressed_invalid_stream(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    start = crc_start(b"main.py", 1, 8, 0, flags=FLAG_COMPRESSED)
+    file = File(FileTransport(start))
+    file.write(FileTransport(data_packet(1, 0, b"no zlib!")))
+    assert file.is_complete()
+    assert not file.verified()
+    assert not (tmp_path / "main.py.z").exists()
+
+
 def test_ledstatus_initialization():
     led = [bytearray((0, 0, 0, 0)) for _ in range(6)]
     led_status = LedStatus(led)
@@ -293,3 +440,614 @@ def test_do_update_delete_file():
                     do_update()
 
     mock_unlink.assert_called_once_with("filename.txt")
+
+
+def test_filetransport_as_window():
+    data = (
+        FILE_TRANSPORT_WINDOW.to_bytes(2, "little")
+        + (0).to_bytes(2, "little")
+        + (0).to_bytes(2, "little")
+        + (0).to_bytes(2, "little")
+        + b"\xff"
+    )
+    ft = FileTransport(data)
+    assert ft.is_valid() is True
+    assert ft.is_window() is True
+    assert ft.as_window() == MAX_WINDOW_SIZE
+
+
+def test_file_received_bitmap():
+    start_data = (
+        FILE_TRANSPORT_START.to_bytes(2, "little")
+        + (1).to_bytes(2, "little")
+        + (10).to_bytes(2, "little")
+        + (0).to_bytes(2, "little")
+        + b"\x0cfilename.txt\x04\x00\x00\x10"
+    )
+    with patch("builtins.open", mock.mock_open()):
+        file = File(FileTransport(start_data))
+        for i in [0, 1, 3, 9]:
+            file.write(
+                FileTransport(
+                    FILE_TRANSPORT_DATA.to_bytes(2, "little")
+                    + (1).to_bytes(2, "little")
+                    + (10).to_bytes(2, "little")
+                    + (i).to_bytes(2, "little")
+                    + b"12345678",
+                ),
+            )
+    assert file.first_missing() == 2
+    assert file.received_bitmap(2, 16) == bytearray([0b10000010, 0b00000000])
+    assert file.unacknowledged == 4
+
+
+def test_do_update_windowed():
+    device_mock = MagicMock()
+    sys.modules["usb_hid"].devices = [device_mock]
+    device_mock.get_last_received_report = mock.Mock(
+        side_effect=[
+            FILE_TRANSPORT_WINDOW.to_bytes(2, "little")
+            + (0).to_bytes(2, "little")
+            + (0).to_bytes(2, "little")
+            + (0).to_bytes(2, "little")
+            + b"\x02",
+            FILE_TRANSPORT_START.to_bytes(2, "little")
+            + (1).to_bytes(2, "little")
+            + (2).to_bytes(2, "little")
+            + (0).to_bytes(2, "little")
+            + b"\x0cfilename.txt\x04\x10\x00\x00\x00",
+            FILE_TRANSPORT_DATA.to_bytes(2, "little")
+            + (1).to_bytes(2, "little")
+            + (2).to_bytes(2, "little")
+            + (0).to_bytes(2, "little")
+            + b"1" * 52,
+            FILE_TRANSPORT_DATA.to_bytes(2, "little")
+            + (1).to_bytes(2, "little")
+            + (2).to_bytes(2, "little")
+            + (1).to_bytes(2, "little")
+            + b"2" * 52,
+            FILE_TRANSPORT_FINISH.to_bytes(2, "little")
+            + (1).to_bytes(2, "little")
+            + (0).to_bytes(2, "little")
+            + (0).to_bytes(2, "little")
+            + b"",
+        ],
+    )
+    with patch("builtins.open", mock.mock_open()):
+        with patch("mutenix_firmware.update.TIMEOUT_TRANSFER", 0.1):
+            with patch("mutenix_firmware.update.TIMEOUT_UPDATE", 0.1):
+                do_update()
+
+    reports = [c.args[0] for c in device_mock.send_report.call_args_list]
+    assert [r[:2] for r in reports] == [b"MO", b"AK", b"AK", b"SA", b"AK"]
+    assert reports[0][3] & CAPABILITY_WINDOW
+    selective_ack = reports[3]
+    assert selective_ack[2:4] == (1).to_bytes(2, "little")
+    assert selective_ack[4:6] == (2).to_bytes(2, "little")
+
+
+def test_filetransport_as_query():
+    data = (
+        FILE_TRANSPORT_QUERY.to_bytes(2, "little")
+        + (7).to_bytes(2, "little")
+        + (0).to_bytes(2, "little")
+        + (0).to_bytes(2, "little")
+        + b"\x07main.py\x0blib/foo.mpy\x00\x00\x00"
+    )
+    ft = FileTransport(data)
+    assert ft.is_valid() is True
+    assert ft.is_query() is True
+    assert ft.as_query() == ["main.py", "lib/foo.mpy"]
+
+
+def test_file_checksum(tmp_path):
+    content = bytes(range(256)) * 3
+    path = tmp_path / "main.py"
+    path.write_bytes(content)
+    assert file_checksum(str(path)) == (len(content), zlib.crc32(content))
+    assert file_checksum(str(tmp_path / "missing.py")) is None
+
+
+def test_do_update_query(tmp_path):
+    content = b"print('hello')\n"
+    path = tmp_path / "main.py"
+    path.write_bytes(content)
+    name = str(path).encode()
+    device_mock = MagicMock()
+    sys.modules["usb_hid"].devices = [device_mock]
+    device_mock.get_last_received_report = mock.Mock(
+        side_effect=[
+            FILE_TRANSPORT_QUERY.to_bytes(2, "little")
+            + (3).to_bytes(2, "little")
+            + (0).to_bytes(2, "little")
+            + (0).to_bytes(2, "little")
+            + len(name).to_bytes(1, "little")
+            + name
+            + b"\x0amissing.py",
+            FILE_TRANSPORT_FINISH.to_bytes(2, "little")
+            + (1).to_bytes(2, "little")
+            + (0).to_bytes(2, "little")
+            + (0).to_bytes(2, "little")
+            + b"",
+        ],
+    )
+    with patch("mutenix_firmware.update.TIMEOUT_TRANSFER", 0.1):
+        with patch("mutenix_firmware.update.TIMEOUT_UPDATE", 0.1):
+            do_update()
+
+    reports = [c.args[0] for c in device_mock.send_report.call_args_list]
+    assert [r[:2] for r in reports] == [b"MO", b"AK", b"FI", b"FI", b"AK"]
+    found, missing = reports[2], reports[3]
+    assert found[2:4] == (3).to_bytes(2, "little")
+    assert found[4] == 0
+    assert found[5] == 1
+    assert found[6:10] == len(content).to_bytes(4, "little")
+    assert found[10:14] == zlib.crc32(content).to_bytes(4, "little")
+    assert missing[4] == 1
+    assert missing[5] == 0
+    assert missing[15:25] == b"missing.py"
+
+
+def test_do_update_reports_invalid_filenames():
+    device_mock = MagicMock()
+    sys.modules["usb_hid"].devices = [device_mock]
+    header = (0).to_bytes(2, "little") * 3
+    device_mock.get_last_received_report = mock.Mock(
+        side_effect=[
+            FILE_TRANSPORT_QUERY.to_bytes(2, "little") + header + b"\x02\xff\xfe",
+            FILE_TRANSPORT_DELETE.to_bytes(2, "little") + header + b"\x01\xff",
+            FILE_TRANSPORT_START.to_bytes(2, "little")
+            + (1).to_bytes(2, "little")
+            + (1).to_bytes(2, "little")
+            + (0).to_bytes(2, "little")
+            + b"\x01\xff\x01\x08",
+            FILE_TRANSPORT_FINISH.to_bytes(2, "little") + header,
+        ],
+    )
+    with patch("mutenix_firmware.update.TIME_SHOW_FINAL_STATUS", 0):
+        do_update()
+
+    reports = [c.args[0] for c in device_mock.send_report.call_args_list]
+    assert [r[:2] for r in reports] == [
+        b"MO",
+        b"AK",
+        b"ER",
+        b"AK",
+        b"ER",
+        b"AK",
+        b"ER",
+        b"AK",
+    ]
+    assert reports[2][3:19] == b"Invalid filename"
+
+
+def crc_start(name, packages, size, crc, flags=FLAG_CRC32):
+    return (
+        FILE_TRANSPORT_START.to_bytes(2, "little")
+        + (1).to_bytes(2, "little")
+        + packages.to_bytes(2, "little")
+        + (0).to_bytes(2, "little")
+        + len(name).to_bytes(1, "little")
+        + name
+        + b"\x04"
+        + size.to_bytes(4, "little")
+        + flags.to_bytes(1, "little")
+        + crc.to_bytes(4, "little")
+    )
+
+
+def data_packet(packages, package, content):
+    return (
+        FILE_TRANSPORT_DATA.to_bytes(2, "little")
+        + (1).to_bytes(2, "little")
+        + packages.to_bytes(2, "little")
+        + package.to_bytes(2, "little")
+        + content
+    )
+
+
+def test_filetransport_start_crc():
+    ft = FileTransport(crc_start(b"main.py", 1, 8, 0x12345678))
+    assert ft.start_flags() == FLAG_CRC32
+    assert ft.start_crc() == 0x12345678
+    assert FileTransport(crc_start(b"main.py", 1, 8, 0, flags=0)).start_crc() is None
+
+
+def test_file_crc_is_computed_while_writing():
+    content = bytes(range(200))
+    chunks = [content[i : i + 52] for i in range(0, len(content), 52)]
+    start = crc_start(b"main.py", len(chunks), len(content), zlib.crc32(content))
+    with patch("builtins.open", mock.mock_open()):
+        file = File(FileTransport(start))
+        for i in [1, 0, 3, 2]:
+            file.write(FileTransport(data_packet(len(chunks), i, chunks[i])))
+    assert file.is_complete()
+    assert file.crc == zlib.crc32(content)
+    assert file.verified()
+
+
+def test_file_crc_of_compressed_content(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    content = b"".join(b"line %d\n" % i for i in range(100))
+    compressed = zlib.compress(content)
+    chunks = [compressed[i : i + 52] for i in range(0, len(compressed), 52)]
+    start = crc_start(
+        b"main.py",
+        len(chunks),
+        len(compressed),
+        zlib.crc32(content),
+        flags=FLAG_CRC32 | FLAG_COMPRESSED,
+    )
+    file = File(FileTransport(start))
+    for i in reversed(range(len(chunks))):
+        file.write(FileTransport(data_packet(len(chunks), i, chunks[i])))
+    assert file.verified()
+    assert file.crc == zlib.crc32(content)
+
+
+def test_file_with_crc_drops_packages_beyond_reorder_buffer():
+    packages = REORDER_BUFFER_SIZE + 3
+    start = crc_start(b"main.py", packages, packages * 52, 0)
+    with patch("builtins.open", mock.mock_open()):
+        file = File(FileTransport(start))
+        for i in range(packages - 1, 0, -1):
+            file.write(FileTransport(data_packet(packages, i, b"x" * 52)))
+    assert file.missing == packages - REORDER_BUFFER_SIZE
+
+
+def test_do_update_rejects_corrupt_file():
+    device_mock = MagicMock()
+    sys.modules["usb_hid"].devices = [device_mock]
+    device_mock.get_last_received_report = mock.Mock(
+        side_effect=[
+            crc_start(b"boot.py", 1, 8, zlib.crc32(b"12345678")),
+            data_packet(1, 0, b"12345679"),
+            FILE_TRANSPORT_FINISH.to_bytes(2, "little")
+            + (1).to_bytes(2, "little")
+            + (0).to_bytes(2, "little")
+            + (0).to_bytes(2, "little")
+            + b"",
+        ],
+    )
+    with patch("builtins.open", mock.mock_open()):
+        with patch("os.unlink") as mock_unlink:
+            with patch("os.rename") as mock_rename:
+                with patch("os.listdir", return_value=["boot.py.tmp"]):
+                    with patch("mutenix_firmware.update.TIME_SHOW_FINAL_STATUS", 0):
+                        do_update()
+
+    reports = [c.args[0] for c in device_mock.send_report.call_args_list]
+    assert reports[0][3] & CAPABILITY_CRC32
+    errors = [r for r in reports if r[:2] == b"ER"]
+    assert errors[0][3 : 3 + errors[0][2]] == b"crc boot.py.tmp"
+    assert errors[1][3 : 3 + errors[1][2]] == b"corrupt"
+    mock_unlink.assert_called_once_with("boot.py.tmp")
+    mock_rename.assert_not_called()
+
+
+def compressed_start(name, packages, size):
+    return (
+        FILE_TRANSPORT_START.to_bytes(2, "little")
+        + (1).to_bytes(2, "little")
+        + packages.to_bytes(2, "little")
+        + (0).to_bytes(2, "little")
+        + len(name).to_bytes(1, "little")
+        + name
+        + b"\x04"
+        + size.to_bytes(4, "little")
+        + FLAG_COMPRESSED.to_bytes(1, "little")
+    )
+
+
+def test_capabilities_without_zlib():
+    assert capabilities() & CAPABILITY_COMPRESSION
+    with patch("mutenix_firmware.update.zlib", None):
+        assert not capabilities() & CAPABILITY_COMPRESSION
+
+
+def test_do_update_rejects_compressed_file_without_zlib():
+    device_mock = MagicMock()
+    sys.modules["usb_hid"].devices = [device_mock]
+    device_mock.get_last_received_report = mock.Mock(
+        side_effect=[
+            compressed_start(b"code.py", 1, 8),
+            FILE_TRANSPORT_FINISH.to_bytes(2, "little")
+            + (1).to_bytes(2, "little")
+            + (0).to_bytes(2, "little")
+            + (0).to_bytes(2, "little")
+            + b"",
+        ],
+    )
+    with patch("mutenix_firmware.update.zlib", None):
+        with patch("builtins.open", mock.mock_open()) as mock_file:
+            with patch("mutenix_firmware.update.TIME_SHOW_FINAL_STATUS", 0):
+                do_update()
+
+    reports = [c.args[0] for c in device_mock.send_report.call_args_list]
+    assert not reports[0][3] & CAPABILITY_COMPRESSION
+    errors = [r for r in reports if r[:2] == b"ER"]
+    assert errors[0][3 : 3 + errors[0][2]] == b"Compression not supported"
+    assert not any(c.args[0] == "code.py.z" for c in mock_file.call_args_list)
+
+
+def plain_start(name, packages, size, file_id=1):
+    return (
+        FILE_TRANSPORT_START.to_bytes(2, "little")
+        + file_id.to_bytes(2, "little")
+        + packages.to_bytes(2, "little")
+        + (0).to_bytes(2, "little")
+        + len(name).to_bytes(1, "little")
+        + name
+        + b"\x04"
+        + size.to_bytes(4, "little")
+    )
+
+
+def test_journal_restores_progress(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    content = bytes(range(256)) * 2
+    chunks = [content[i : i + 52] for i in range(0, len(content), 52)]
+    file = File(FileTransport(plain_start(b"main.py", len(chunks), len(content))))
+    # 2 is kept in memory until 1 arrives, only 0 and 3 are on flash
+    for i in [0, 2]:
+        file.write(FileTransport(data_packet(len(chunks), i, chunks[i])))
+    with patch("mutenix_firmware.update.JOURNAL_FILE", "update.journal"):
+        write_journal([file])
+        file.close()
+        restored = read_journal()[1]
+    assert restored.resumed
+    assert restored.missing == len(chunks) - 1
+    assert restored.is_received(0) and not restored.is_received(2)
+    for i in range(1, len(chunks)):
+        restored.write(FileTransport(data_packet(len(chunks), i, chunks[i])))
+    assert restored.is_complete()
+    assert (tmp_path / "main.py").read_bytes() == content
+
+
+def test_journal_continues_crc(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    content = b"x" * 100 + b"y" * 100
+    chunks = [content[i : i + 52] for i in range(0, len(content), 52)]
+    start = crc_start(b"main.py", len(chunks), len(content), zlib.crc32(content))
+    file = File(FileTransport(start))
+    file.write(FileTransport(data_packet(len(chunks), 0, chunks[0])))
+    with patch("mutenix_firmware.update.JOURNAL_FILE", "update.journal"):
+        write_journal([file])
+        file.close()
+        restored = read_journal()[1]
+    for i in range(1, len(chunks)):
+        restored.write(FileTransport(data_packet(len(chunks), i, chunks[i])))
+    assert restored.verified()
+    assert (tmp_path / "main.py").read_bytes() == content
+
+
+def test_journal_resumes_compressed_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    content = bytes(range(256)) * 4
+    compressed = zlib.compress(content)
+    chunks = [compressed[i : i + 52] for i in range(0, len(compressed), 52)]
+    start = crc_start(
+        b"main.py",
+        len(chunks),
+        len(compressed),
+        zlib.crc32(content),
+        flags=FLAG_CRC32 | FLAG_COMPRESSED,
+    )
+    file = File(FileTransport(start))
+    file.write(FileTransport(data_packet(len(chunks), 0, chunks[0])))
+    with patch("mutenix_firmware.update.JOURNAL_FILE", "update.journal"):
+        write_journal([file])
+        file.close()
+        restored = read_journal()[1]
+    for i in range(1, len(chunks)):
+        restored.write(FileTransport(data_packet(len(chunks), i, chunks[i])))
+    assert restored.verified()
+    assert (tmp_path / "main.py").read_bytes() == content
+
+
+def test_read_journal_ignores_truncated_journal(tmp_path):
+    journal = tmp_path / "update.journal"
+    journal.write_bytes(b"\x40\x00\x10")
+    with patch("mutenix_firmware.update.JOURNAL_FILE", str(journal)):
+        assert read_journal() == {}
+
+
+def test_journal_without_packages_on_flash_rewrites_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "main.py").write_bytes(b"o" * 200)
+    file = File(FileTransport(plain_start(b"main.py", 1, 8)))
+    with patch("mutenix_firmware.update.JOURNAL_FILE", "update.journal"):
+        write_journal([file])
+        restored = read_journal()[1]
+    assert not restored.resumed
+    restored.write(FileTransport(data_packet(1, 0, b"12345678")))
+    assert restored.verified()
+    assert (tmp_path / "main.py").read_bytes() == b"12345678"
+
+
+def test_journal_resumed_file_with_unexpected_tail_is_not_verified(
+    tmp_path,
+    monkeypatch,
+):
+    monkeypatch.chdir(tmp_path)
+    content = b"x" * 104
+    file = File(FileTransport(plain_start(b"main.py", 2, len(content))))
+    file.write(FileTransport(data_packet(2, 0, content[:52])))
+    with patch("mutenix_firmware.update.JOURNAL_FILE", "update.journal"):
+        write_journal([file])
+        file.close()
+        restored = read_journal()[1]
+    (tmp_path / "main.py").write_bytes(content[:52] + b"o" * 200)
+    restored.write(FileTransport(data_packet(2, 1, content[52:])))
+    assert restored.is_complete()
+    assert not restored.verified()
+
+
+FINISH = (
+    FILE_TRANSPORT_FINISH.to_bytes(2, "little")
+    + (1).to_bytes(2, "little")
+    + (0).to_bytes(2, "little")
+    + (0).to_bytes(2, "little")
+)
+RESUME = (
+    FILE_TRANSPORT_RESUME.to_bytes(2, "little")
+    + (9).to_bytes(2, "little")
+    + (0).to_bytes(2, "little")
+    + (0).to_bytes(2, "little")
+)
+
+
+def run_update(reports):
+    """Run do_update() with the given host reports, returns the device reports."""
+    device_mock = MagicMock()
+    sys.modules["usb_hid"].devices = [device_mock]
+    queue = list(reports)
+    device_mock.get_last_received_report = lambda report_id: (
+        queue.pop(0) if queue else None
+    )
+    with patch("mutenix_firmware.update.JOURNAL_FILE", "update.journal"):
+        with patch("mutenix_firmware.update.TIMEOUT_TRANSFER", 0.05):
+            with patch("mutenix_firmware.update.TIME_SHOW_FINAL_STATUS", 0):
+                do_update()
+    return [c.args[0] for c in device_mock.send_report.call_args_list]
+
+
+def test_do_update_resumes_after_timeout(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    content = bytes(range(156))
+    chunks = [content[i : i + 52] for i in range(0, len(content), 52)]
+
+    start = plain_start(b"main.py", len(chunks), len(content))
+    reports = run_update([start, data_packet(len(chunks), 0, chunks[0])])
+    assert reports[0][3] & CAPABILITY_RESUME
+    assert reports[-1][:2] == b"ER"
+    assert (tmp_path / "update.journal").exists()
+
+    reports = run_update(
+        [RESUME, start]
+        + [data_packet(len(chunks), i, chunks[i]) for i in range(1, len(chunks))]
+        + [FINISH],
+    )
+    info, selective_ack = reports[2], reports[3]
+    assert info[:8] == b"RS" + bytes([9, 0, 0, 1, 1, 0])
+    assert info[8:12] == bytes([len(chunks), 0, 0, 7])
+    assert info[12:19] == b"main.py"
+    assert selective_ack[:6] == b"SA" + bytes([1, 0, 1, 0])
+    assert (tmp_path / "main.py").read_bytes() == content
+    assert not (tmp_path / "update.journal").exists()
+
+
+def test_bluetooth_transport_paces_reports():
+    hardware = mock.Mock(bluetooth_connected=True)
+    transport = BluetoothTransport(hardware, interval=0.01)
+    with patch("mutenix_firmware.update.time") as time_mock:
+        time_mock.monotonic.side_effect = [1.0, 1.004, 1.01]
+        transport.send_report(b"AK", 2)
+        transport.send_report(b"AK", 2)
+    time_mock.sleep.assert_called_once()
+    assert abs(time_mock.sleep.call_args.args[0] - 0.006) < 1e-9
+    assert hardware.send_bluetooth_update.call_count == 2
+
+
+def test_bluetooth_transport_not_connected():
+    hardware = mock.Mock(bluetooth_connected=False)
+    transport = BluetoothTransport(hardware)
+    assert transport.get_last_received_report(2) is None
+    transport.send_report(b"AK", 2)
+    hardware.check_bluetooth.assert_called_once()
+    hardware.read_bluetooth_update.assert_not_called()
+    hardware.send_bluetooth_update.assert_not_called()
+
+
+def test_update_transport_replies_on_receiving_link():
+    usb = mock.Mock()
+    bluetooth = mock.Mock(connected=False)
+    transport = UpdateTransport(usb, bluetooth)
+    assert transport.kind == TRANSPORT_USB
+    assert not transport.bluetooth_connected()
+
+    bluetooth.get_last_received_report.return_value = b"ble"
+    assert transport.get_last_received_report(2) == b"ble"
+    transport.send_report(b"AK", 2)
+    assert transport.kind == TRANSPORT_BLUETOOTH
+    bluetooth.send_report.assert_called_once_with(b"AK", 2)
+
+    bluetooth.get_last_received_report.return_value = None
+    usb.get_last_received_report.return_value = b"usb"
+    assert transport.get_last_received_report(2) == b"usb"
+    transport.send_report(b"AK", 2)
+    assert transport.kind == TRANSPORT_USB
+    usb.send_report.assert_called_once_with(b"AK", 2)
+
+    bluetooth.connected = True
+    assert transport.bluetooth_connected()
+    assert transport.kind == TRANSPORT_BLUETOOTH
+    assert not transport.bluetooth_connected()
+
+
+def test_do_update_over_bluetooth(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    content = b"print(1)"
+    queue = [
+        plain_start(b"main.py", 1, len(content)),
+        data_packet(1, 0, content),
+        FILE_TRANSPORT_FINISH.to_bytes(2, "little") + bytes(6),
+    ]
+    hardware = mock.MagicMock(has_bluetooth=True, bluetooth_connected=True)
+    hardware.read_bluetooth_update = lambda: queue.pop(0) if queue else None
+    device_mock = MagicMock()
+    device_mock.get_last_received_report.return_value = None
+    sys.modules["usb_hid"].devices = [device_mock]
+    with patch("mutenix_firmware.update.hardware_variant", hardware):
+        with patch("mutenix_firmware.update.TIME_SHOW_FINAL_STATUS", 0):
+            do_update()
+
+    hardware.setup_bluetooth.assert_called_once()
+    reports = [c.args[0] for c in hardware.send_bluetooth_update.call_args_list]
+    assert [r[:2] for r in reports] == [b"MO", b"AK", b"AK", b"AK"]
+    assert reports[0][4] == TRANSPORT_BLUETOOTH
+    assert [c.args[0][:2] for c in device_mock.send_report.call_args_list] == [b"MO"]
+    assert (tmp_path / "main.py").read_bytes() == content
+
+
+def test_do_update_ignores_journal_without_resume(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    old = b"a" * 104
+    new = b"b" * 104
+    start = plain_start(b"version.py", 2, len(old))
+    run_update([start, data_packet(2, 0, old[:52])])
+    assert (tmp_path / "update.journal").exists()
+
+    run_update(
+        [start, data_packet(2, 0, new[:52]), data_packet(2, 1, new[52:]), FINISH],
+    )
+    assert (tmp_path / "version.py").read_bytes() == new
+    assert not (tmp_path / "update.journal").exists()
+
+
+def test_do_update_ends_without_any_link(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    hardware = mock.MagicMock(has_bluetooth=True, bluetooth_connected=False)
+    device_mock = MagicMock()
+    device_mock.get_last_received_report.return_value = None
+    device_mock.send_report.side_effect = OSError("USB busy")
+    sys.modules["usb_hid"].devices = [device_mock]
+    supervisor = sys.modules["supervisor"]
+    supervisor.reset_mock()
+    with patch("mutenix_firmware.update.hardware_variant", hardware):
+        with patch("mutenix_firmware.update.TIMEOUT_TRANSFER", 0.05):
+            with patch("mutenix_firmware.update.TIME_SHOW_FINAL_STATUS", 0):
+                do_update()
+
+    assert device_mock.send_report.called
+    hardware.send_bluetooth_update.assert_not_called()
+    supervisor.reload.assert_called_once()
+
+
+def test_update_transport_skips_usb_without_connection():
+    usb = mock.Mock()
+    transport = UpdateTransport(usb)
+    with patch("mutenix_firmware.update.supervisor") as supervisor:
+        supervisor.runtime.usb_connected = False
+        transport.send_report(b"ER", 2)
+    usb.send_report.assert_not_called()